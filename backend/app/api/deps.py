@@ -1,11 +1,14 @@
 from fastapi import Request, HTTPException
 from app.core.tokens import verify_token
-from app.services.auth_service import get_user_by_id
 
 COOKIE_NAME = "ps_token"
 
-def get_current_user(request: Request):
-    """FastAPI dependency: returns current user dict, raises 401 if not authenticated."""
+# Эндпоинтам нужен только id для scoping — подписи токена достаточно, БД не трогаем.
+# Профиль — через кэш auth_service.get_user_cached (/auth/me, ответы /credits/*), точный
+# баланс перед списанием — get_user_by_id / add_ledger.
+
+def current_user_id(request: Request) -> str:
+    """FastAPI dependency: user id from the signed cookie, no DB access. 401 if not authenticated."""
     tok = request.cookies.get(COOKIE_NAME)
     if not tok:
         raise HTTPException(status_code=401, detail="Not authenticated")
@@ -13,7 +16,4 @@ def get_current_user(request: Request):
     uid = v[0] if v else None
     if not uid:
         raise HTTPException(status_code=401, detail="Invalid token")
-    try:
-        return get_user_by_id(uid)
-    except Exception:
-        raise HTTPException(status_code=401, detail="User not found")
+    return uid
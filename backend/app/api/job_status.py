@@ -0,0 +1,68 @@
+import asyncio
+from typing import Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse, Response
+
+from app.services.job_events import JOB_CACHE_TTL_SECONDS, get_job_event_bus, get_job_state_cache
+
+JOB_LONG_POLL_MAX_SECONDS = 25
+FINAL_STATES = ("done", "error")
+
+
+def _etag_matches(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return "*" in tags or etag in tags
+
+
+async def job_status_response(
+    req: Request,
+    table: str,
+    uid: str,
+    job_id: str,
+    wait_seconds: Optional[float] = None,
+    envelope: Optional[dict] = None,
+) -> Response:
+    """
+    GET /<kind>/jobs/{id} served from the in-memory job state cache.
+
+    ETag = версия задачи; If-None-Match с текущей версией -> 304 без тела.
+    ?waitSeconds=N (<= JOB_LONG_POLL_MAX_SECONDS) вместе с If-None-Match: запрос ждёт
+    изменения задачи (событие из job_events) и отвечает 200 с новым состоянием, либо 304
+    по таймауту. Завершённые задачи (done/error) отвечают сразу.
+    """
+    cache = get_job_state_cache()
+    st = cache.get(table, job_id) or await asyncio.to_thread(cache.load, table, job_id)
+    if st is None or st.user_id != uid:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    inm = req.headers.get("if-none-match")
+    wait = min(max(float(wait_seconds or 0), 0.0), JOB_LONG_POLL_MAX_SECONDS)
+    if wait > 0 and _etag_matches(inm, st.etag) and st.job.get("state") not in FINAL_STATES:
+        bus = get_job_event_bus()
+        sub = bus.subscribe(uid)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + wait
+        try:
+            # перечитываем после подписки: изменение между первым чтением и подпиской не теряется
+            st = await asyncio.to_thread(cache.get_or_load, table, job_id) or st
+            while _etag_matches(inm, st.etag) and st.job.get("state") not in FINAL_STATES:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                # событие по этой задаче обновило кэш; по таймауту подтягиваем записи других процессов
+                ev = await sub.get(min(remaining, JOB_CACHE_TTL_SECONDS))
+                if ev is not None and (ev.get("job") or {}).get("job_id") != job_id:
+                    continue
+                if await req.is_disconnected():
+                    break
+                st = await asyncio.to_thread(cache.get_or_load, table, job_id) or st
+        finally:
+            bus.unsubscribe(sub)
+
+    headers = {"ETag": st.etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(inm, st.etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse({**(envelope or {}), "job": st.job}, headers=headers)
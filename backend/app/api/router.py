@@ -6,6 +6,7 @@ from app.api.routes.scene import router as scene_router
 from app.api.routes.assets import router as assets_router
 from app.api.routes.lookbook import router as lookbook_router
 from app.api.routes.video import router as video_router
+from app.api.routes.jobs import router as jobs_router
 
 api_router = APIRouter()
 api_router.include_router(health_router, tags=["health"])
@@ -15,3 +16,4 @@ api_router.include_router(scene_router, tags=["scene"])
 api_router.include_router(assets_router, tags=["assets"])
 api_router.include_router(lookbook_router, tags=["lookbook"])
 api_router.include_router(video_router, tags=["video"])
+api_router.include_router(jobs_router, tags=["jobs"])
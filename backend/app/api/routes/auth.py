@@ -1,6 +1,6 @@
 from fastapi import APIRouter, Response, Request
 from pydantic import BaseModel
-from app.services.auth_service import create_user, verify_login, get_user_by_id
+from app.services.auth_service import create_user, verify_login, get_user_cached
 from app.core.tokens import sign_token, verify_token
 
 router = APIRouter()
@@ -63,7 +63,7 @@ def me(request: Request):
     if not uid:
         return {"ok": False, "user": None}
     try:
-        user = get_user_by_id(uid)
+        user = get_user_cached(uid)
         return {"ok": True, "user": user}
     except Exception:
         return {"ok": False, "user": None}
@@ -1,8 +1,8 @@
-from fastapi import APIRouter, Request
+from fastapi import APIRouter, HTTPException, Request
 from pydantic import BaseModel, Field
 
 from app.core.tokens import verify_token
-from app.services.auth_service import add_ledger, list_ledger, get_user_by_id
+from app.services.auth_service import add_ledger, list_ledger, get_user_by_id, get_user_cached
 
 router = APIRouter()
 COOKIE_NAME = "ps_token"
@@ -33,7 +33,8 @@ def topup(payload: TopupIn, request: Request):
     # add_ledger(user_id, delta, reason, ref=None)
     add_ledger(uid, amt, "TOPUP", ref=f"+{amt}")
 
-    user = get_user_by_id(uid)
+    # add_ledger уже сбросил кэш — профиль читается заново и кэшируется для /auth/me
+    user = get_user_cached(uid)
     return {"ok": True, "user": user}
 
 
@@ -65,6 +66,7 @@ def credits_spend(req: SpendReq, request: Request):
     if not uid:
         return {"ok": False, "error": {"code": "UNAUTHORIZED", "message": "Нужно войти"}}
 
+    # точный баланс (не из кэша): по нему решаем, пускать ли списание
     user_before = get_user_by_id(uid)
     bal_before = int((user_before or {}).get("credits") or 0)
 
@@ -88,7 +90,7 @@ def credits_spend(req: SpendReq, request: Request):
     except ValueError as e:
         raise HTTPException(status_code=402, detail=str(e))
 
-    user_after = get_user_by_id(uid)
+    user_after = get_user_cached(uid)
     bal_after = int((user_after or {}).get("credits") or 0)
 
     return {"ok": True, "user": user_after, "balance": bal_after}
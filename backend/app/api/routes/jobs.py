@@ -0,0 +1,75 @@
+import asyncio
+import json
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+
+from app.api.deps import current_user_id
+from app.services.job_events import JOB_STATUS_MAX_IDS, active_jobs, get_job_event_bus, job_statuses
+
+router = APIRouter()
+
+STREAM_KEEPALIVE_SECONDS = 15
+STREAM_RETRY_MS = 3000
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@router.get("/jobs/status")
+def jobs_status(ids: Optional[str] = None, uid: str = Depends(current_user_id)):
+    """Compact status of many jobs of any kind in one round trip.
+
+    ?ids=lb_..,sc_..,vid_.. (up to JOB_STATUS_MAX_IDS) — these jobs; without ids — all queued/running jobs.
+    Returns {"ok": true, "jobs": [{"job_id", "kind", "state", "progress", "error", "updated_at"}]};
+    unknown ids and other users' jobs are simply absent. The full job (with result) is GET /<kind>/jobs/{id}.
+    """
+    wanted = [s.strip() for s in (ids or "").split(",") if s.strip()]
+    if len(wanted) > JOB_STATUS_MAX_IDS:
+        raise HTTPException(status_code=400, detail=f"Too many ids (max {JOB_STATUS_MAX_IDS})")
+    return {"ok": True, "jobs": job_statuses(uid, wanted)}
+
+
+@router.get("/jobs/stream")
+async def jobs_stream(request: Request, ids: Optional[str] = None, uid: str = Depends(current_user_id)):
+    """Server-Sent Events: one stream per user for all lookbook/scene/video jobs.
+
+    On connect sends `event: job` for every queued/running job (plus `?ids=a,b` — jobs the
+    client is waiting for, even if they finished while it was disconnected), then one
+    `event: job` per change: {"kind": lookbook|scene|video, "job": {...same as GET /<kind>/jobs/{id}}}.
+    A comment line is sent every STREAM_KEEPALIVE_SECONDS so proxies keep the connection open.
+    """
+    bus = get_job_event_bus()
+    # подписываемся до снимка — изменение между снимком и подпиской не потеряется
+    sub = bus.subscribe(uid)
+    wanted = [s.strip() for s in (ids or "").split(",") if s.strip()]
+    try:
+        snapshot = await asyncio.to_thread(active_jobs, uid, wanted)
+    except Exception:
+        bus.unsubscribe(sub)
+        raise
+
+    async def _events():
+        try:
+            yield f"retry: {STREAM_RETRY_MS}\n\n"
+            for ev in snapshot:
+                yield _sse("job", ev)
+            yield _sse("ready", {"jobs": len(snapshot)})
+            while True:
+                ev = await sub.get(STREAM_KEEPALIVE_SECONDS)
+                if await request.is_disconnected():
+                    break
+                if ev is None:
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse("job", ev)
+        finally:
+            bus.unsubscribe(sub)
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
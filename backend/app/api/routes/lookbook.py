@@ -1,24 +1,28 @@
 from fastapi import APIRouter, Request, HTTPException
 from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel, Field
-from datetime import datetime, timedelta, timezone
+from datetime import datetime, timezone
 import json
 import io
 import os
 import mimetypes
 import zipfile
-from urllib.parse import urlparse
 import os
 import re
 import base64
 import hashlib
-import threading
 import uuid
 
 from app.core.config import settings
 from app.services.auth_service import add_ledger
+from app.services import lookbook_sessions as lb_sessions
+from app.services.job_scheduler import SchedulerBusy
+from app.services.job_queue import enqueue as enqueue_job, register_handler
+from app.services.job_events import publish_job
+from app.api.job_status import job_status_response
 from app.engine.engine_init import load_engine_config
-from app.engine.lookbook_engine import photoshoot as engine_photoshoot
+from app.engine.lookbook_engine import photoshoot as engine_photoshoot, preflight_shots as engine_preflight
+from app.engine.media_io import local_asset_path
 
 from app.core.tokens import verify_token
 from app.db.sqlite import db
@@ -34,13 +38,6 @@ def _now_iso() -> str:
     return datetime.now(timezone.utc).isoformat()
 
 
-def _parse_dt(s: str) -> datetime:
-    try:
-        return datetime.fromisoformat(s.replace("Z", "+00:00"))
-    except Exception:
-        return datetime.now(timezone.utc)
-
-
 def _uid(req: Request) -> str:
     tok = req.cookies.get(COOKIE_NAME)
     if not tok:
@@ -57,85 +54,23 @@ def _cleanup(con, user_id: str):
     """
     Удаляем старые сессии (TTL) для пользователя, чтобы не раздувать БД.
     """
-    cutoff = datetime.now(timezone.utc) - timedelta(hours=TTL_HOURS)
-    rows = con.execute(
-        "SELECT mode, updated_at FROM lookbook_sessions WHERE user_id=?",
-        (user_id,),
-    ).fetchall()
-    for mode, updated_at in rows:
-        dt = _parse_dt(updated_at)
-        if dt < cutoff:
-            con.execute(
-                "DELETE FROM lookbook_sessions WHERE user_id=? AND mode=?",
-                (user_id, mode),
-            )
+    lb_sessions.cleanup_expired(con, user_id, TTL_HOURS)
 
 
 def _acquire_run_lock(user_id: str, mode: str, ttl_seconds: int = 180) -> bool:
     """
     Защита от бесконечных/параллельных запросов:
     - Если фотосессия для (user_id, mode) уже 'running' и не протухла по TTL — не запускаем вторую.
-    - Храним флаг прямо в JSON lookbook_sessions.data, чтобы не городить отдельные таблицы.
+    - Lock — строка lookbook_runs, захват атомарный (один upsert), без чтения сессии.
     """
-    now = datetime.now(timezone.utc)
     with db() as con:
-        con.execute("BEGIN IMMEDIATE")
-        row = con.execute(
-            "SELECT data, updated_at FROM lookbook_sessions WHERE user_id=? AND mode=?",
-            (user_id, mode),
-        ).fetchone()
-
-        if row and row["data"]:
-            data = json.loads(row["data"])
-        else:
-            data = _default_session(mode)
-            con.execute(
-                "INSERT OR REPLACE INTO lookbook_sessions(user_id, mode, data, updated_at) VALUES(?,?,?,?)",
-                (user_id, mode, json.dumps(data, ensure_ascii=False), _now_iso()),
-            )
-
-        run = (data or {}).get("_run") or {}
-        if bool(run.get("running")):
-            started_at = run.get("startedAt") or run.get("started_at") or ""
-            try:
-                started_dt = _parse_dt(started_at)
-            except Exception:
-                started_dt = now
-            age = (now - started_dt).total_seconds()
-            if age < max(10, int(ttl_seconds or 180)):
-                return False  # already running
-
-        # keep jobId if caller already set it (e.g., job resume)
-        prev_job_id = (run or {}).get("jobId")
-        data["_run"] = {"running": True, "startedAt": now.isoformat(), "jobId": prev_job_id}
-        con.execute(
-            "UPDATE lookbook_sessions SET data=?, updated_at=? WHERE user_id=? AND mode=?",
-            (json.dumps(data, ensure_ascii=False), _now_iso(), user_id, mode),
-        )
-    return True
+        return lb_sessions.try_acquire_run(con, user_id, mode, ttl_seconds)
 
 
 def _release_run_lock(user_id: str, mode: str):
     try:
         with db() as con:
-            con.execute("BEGIN IMMEDIATE")
-            row = con.execute(
-                "SELECT data FROM lookbook_sessions WHERE user_id=? AND mode=?",
-                (user_id, mode),
-            ).fetchone()
-            if not row or not row["data"]:
-                return
-            data = json.loads(row["data"])
-            if not isinstance(data, dict):
-                return
-            run = (data or {}).get("_run") or {}
-            run["running"] = False
-            run["finishedAt"] = datetime.now(timezone.utc).isoformat()
-            data["_run"] = run
-            con.execute(
-                "UPDATE lookbook_sessions SET data=?, updated_at=? WHERE user_id=? AND mode=?",
-                (json.dumps(data, ensure_ascii=False), _now_iso(), user_id, mode),
-            )
+            lb_sessions.release_run(con, user_id, mode)
     except Exception:
         return
 
@@ -174,85 +109,16 @@ def _job_update(job_id: str, **fields):
     vals.append(_job_now_iso())
     vals.append(job_id)
     with db() as con:
-        con.execute(f"UPDATE lookbook_jobs SET {', '.join(sets)} WHERE job_id=?", tuple(vals))
-
-
-def _job_get(uid: str, job_id: str) -> dict | None:
-    with db() as con:
-        row = con.execute(
-            "SELECT job_id, user_id, mode, state, progress, result_json, error, spent, created_at, updated_at FROM lookbook_jobs WHERE job_id=?",
-            (job_id,),
-        ).fetchone()
-        if not row:
-            return None
-        if row["user_id"] != uid:
-            return None
-        out = dict(row)
-        try:
-            out["result"] = json.loads(out.get("result_json") or "null")
-        except Exception:
-            out["result"] = None
-        out.pop("result_json", None)
-        return out
+        # RETURNING user_id: владелец для publish_job без отдельного чтения строки
+        row = con.execute(f"UPDATE lookbook_jobs SET {', '.join(sets)} WHERE job_id=? RETURNING user_id", tuple(vals)).fetchone()
+    if row is not None:
+        publish_job("lookbook_jobs", job_id, row["user_id"])
 
 
 def _session_set_job(uid: str, mode: str, job_id: str | None, running: bool):
-    """Persist jobId into lookbook_sessions.data._run so UI can recover even without localStorage."""
+    """Persist jobId into the session run state (lookbook_runs) so UI can recover even without localStorage."""
     with db() as con:
-        row = con.execute(
-            "SELECT data FROM lookbook_sessions WHERE user_id=? AND mode=?",
-            (uid, mode),
-        ).fetchone()
-        data = json.loads(row["data"]) if row and row["data"] else _default_session(mode)
-        run = (data or {}).get("_run") or {}
-        run["running"] = bool(running)
-        run["jobId"] = job_id
-        if running:
-            run["startedAt"] = datetime.now(timezone.utc).isoformat()
-        else:
-            run["finishedAt"] = datetime.now(timezone.utc).isoformat()
-        data["_run"] = run
-        con.execute(
-            "INSERT OR REPLACE INTO lookbook_sessions(user_id, mode, data, created_at, updated_at) VALUES(?,?,?,?,?)",
-            (uid, mode, json.dumps(data, ensure_ascii=False), data.get("createdAt") or _now_iso(), _now_iso()),
-        )
-
-
-def _default_session(mode: str) -> dict:
-    # 8 карточек: 1..7 вещи/детали, 8 логотип
-    cards = []
-    # Канонические подписи под макет (можно менять позже в UI)
-    labels = [
-        "ПЕРЕД", "ПРАВЫЙ БОК", "ЛЕВЫЙ БОК",
-        "СПИНА", "ТКАНЬ / МАТЕРИАЛ", "ДЕТАЛИРОВКА 1",
-        "ДЕТАЛИРОВКА 2", "ЛОГОТИП"
-    ]
-    for i in range(8):
-        if i == 7:
-            cards.append({
-                "slot": 8,
-                "type": "logo",
-                "label": labels[i],
-                "refUrl": None,
-                "logoKind": "print",  # print | embroidery | patch
-            })
-        else:
-            cards.append({
-                "slot": i + 1,
-                "type": "shot",
-                "label": labels[i],
-                "refUrl": None,
-                "camera": "front",
-                "pose": "classic",
-            })
-    return {
-        "mode": mode,
-        "format": "1:1",  # 1:1 | 16:9 | 9:16
-        "cards": cards,
-        "results": [],  # compact ordered list of urls
-        "updatedAt": _now_iso(),
-        "createdAt": _now_iso(),
-    }
+        lb_sessions.set_run(con, uid, mode, job_id, running)
 
 
 
@@ -313,6 +179,18 @@ class SessionPatch(BaseModel):
     format: str | None = None
     cards: list | None = None
     results: list | None = None
+    version: int | None = None  # format/results: если передан — 409, когда сессию уже изменили
+    cardVersions: dict | None = None  # {slot: version} из GET: с ним cards проверяются (409), без — перезапись
+
+
+class CardPatch(BaseModel):
+    version: int
+    card: dict = Field(default_factory=dict)  # только изменённые поля карточки
+
+
+def _conflict(e: lb_sessions.VersionConflict) -> HTTPException:
+    # detail несёт актуальное состояние — клиент синхронизируется без лишнего GET
+    return HTTPException(status_code=409, detail={"message": str(e), **e.current})
 
 
 @router.get("/session/{mode}")
@@ -323,97 +201,75 @@ def get_session(mode: str, req: Request):
     uid = _uid(req)
     with db() as con:
         _cleanup(con, uid)
-        row = con.execute(
-            "SELECT data FROM lookbook_sessions WHERE user_id=? AND mode=?",
-            (uid, mode),
-        ).fetchone()
-        if not row:
-            sess = _default_session(mode)
-            con.execute(
-                "INSERT OR REPLACE INTO lookbook_sessions(user_id, mode, data, created_at, updated_at) VALUES(?,?,?,?,?)",
-                (uid, mode, json.dumps(sess, ensure_ascii=False), sess["createdAt"], sess["updatedAt"]),
-            )
-            return {"session": sess}
-        try:
-            sess = json.loads(row[0])
-        except Exception:
-            sess = _default_session(mode)
-        # ensure minimal keys
-        if sess.get("mode") != mode:
-            sess["mode"] = mode
-        return {"session": sess}
+        lb_sessions.ensure_session(con, uid, mode)
+        return {"session": lb_sessions.load_session(con, uid, mode)}
 
 
 @router.patch("/session/{mode}")
 def patch_session(mode: str, req: Request, body: SessionPatch):
+    """
+    Replace format / whole cards / whole results. With `version` the patch is applied only if
+    the session version still matches (else 409 with the current version). Whole `cards` with
+    `cardVersions` ({slot: version} from GET) are checked per card: a card changed meanwhile -> 409
+    with current cardVersions; without `cardVersions` they overwrite as before.
+    Правка одной карточки — PATCH /session/{mode}/cards/{slot}.
+    """
     mode = (mode or "").upper()
     if mode not in ALLOWED_MODES:
         raise HTTPException(status_code=400, detail="Bad mode")
     uid = _uid(req)
     with db() as con:
         _cleanup(con, uid)
-        row = con.execute(
-            "SELECT data, created_at FROM lookbook_sessions WHERE user_id=? AND mode=?",
-            (uid, mode),
-        ).fetchone()
-        if row:
-            try:
-                sess = json.loads(row[0])
-            except Exception:
-                sess = _default_session(mode)
-            created_at = row[1] or sess.get("createdAt") or _now_iso()
-        else:
-            sess = _default_session(mode)
-            created_at = sess["createdAt"]
+        lb_sessions.ensure_session(con, uid, mode)
+        try:
+            lb_sessions.check_session_version(con, uid, mode, body.version)
+        except lb_sessions.VersionConflict as e:
+            raise _conflict(e)
 
-        # apply patch
+        # apply patch: пишем только изменённые части
         if body.format is not None:
-            sess["format"] = body.format
+            lb_sessions.set_format(con, uid, mode, body.format)
         if body.cards is not None:
-            sess["cards"] = body.cards
+            # без cardVersions (старые клиенты) — как раньше, перезапись без проверки
+            try:
+                lb_sessions.replace_cards(con, uid, mode, body.cards, expected_versions=body.cardVersions)
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            except lb_sessions.VersionConflict as e:
+                raise _conflict(e)
         if body.results is not None:
-            sess["results"] = body.results
-
-        sess["mode"] = mode
-        sess["createdAt"] = created_at
-        sess["updatedAt"] = _now_iso()
-
-        con.execute(
-            "INSERT OR REPLACE INTO lookbook_sessions(user_id, mode, data, created_at, updated_at) VALUES(?,?,?,?,?)",
-            (uid, mode, json.dumps(sess, ensure_ascii=False), created_at, sess["updatedAt"]),
-        )
-        return {"session": sess}
+            lb_sessions.replace_results(con, uid, mode, body.results)
+        if body.format is not None or body.cards is not None or body.results is not None:
+            lb_sessions.bump_version(con, uid, mode)
+        else:
+            lb_sessions.touch(con, uid, mode)
+        return {"session": lb_sessions.load_session(con, uid, mode)}
 
 
+@router.patch("/session/{mode}/cards/{slot}")
+def patch_session_card(mode: str, slot: int, req: Request, body: CardPatch):
+    """
+    Merge changed fields into one card: {"version": <cardVersions[slot]>, "card": {"refUrl": ...}}.
+    Returns {"slot", "card", "version"}; 409 with the current card/version if it was changed meanwhile.
+    """
+    mode = (mode or "").upper()
+    if mode not in ALLOWED_MODES:
+        raise HTTPException(status_code=400, detail="Bad mode")
+    uid = _uid(req)
+    with db() as con:
+        _cleanup(con, uid)
+        lb_sessions.ensure_session(con, uid, mode)
+        try:
+            return lb_sessions.patch_card(con, uid, mode, slot, body.card, body.version)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="Card not found")
+        except lb_sessions.VersionConflict as e:
+            raise _conflict(e)
 
 
 def _asset_file_path_from_url(url: str) -> str | None:
-    if not url or not isinstance(url, str):
-        return None
-    s = url.strip()
-    if not s:
-        return None
-    # absolute -> take path
-    try:
-        parsed = urlparse(s)
-        path = parsed.path if parsed.scheme in ("http", "https") else s
-    except Exception:
-        path = s
-    if not path.startswith("/static/assets/"):
-        return None
-    fname = path.split("/static/assets/", 1)[1]
-    # prevent traversal
-    fname = os.path.basename(fname)
-    if not fname:
-        return None
-    assets_dir = os.path.join(os.path.dirname(__file__), "..", "..", "static", "assets")
-    assets_dir = os.path.normpath(assets_dir)
-    full = os.path.normpath(os.path.join(assets_dir, fname))
-    if not full.startswith(assets_dir):
-        return None
-    if not os.path.exists(full):
-        return None
-    return full
+    # результаты сессии — наши ассеты, даже если сохранены под другим хостом (домен/порт)
+    return local_asset_path(url, any_host=True)
 
 
 @router.get("/download/{mode}")
@@ -427,31 +283,16 @@ def download_results(mode: str, req: Request):
     with db() as con:
         _cleanup(con, uid)
         row = con.execute(
-            "SELECT data FROM lookbook_sessions WHERE user_id=? AND mode=?",
+            "SELECT 1 FROM lookbook_sessions WHERE user_id=? AND mode=?",
             (uid, mode),
         ).fetchone()
+        # results may be URL strings or objects like {"url": "/static/assets/...", "slotIndex": 1, ...};
+        # url is extracted into its own column on write
+        urls: list[str] = lb_sessions.result_urls(con, uid, mode) if row else []
 
     if not row:
         raise HTTPException(status_code=404, detail="No session")
 
-    try:
-        sess = json.loads(row[0])
-    except Exception:
-        raise HTTPException(status_code=500, detail="Bad session data")
-
-    results = sess.get("results") or []
-    # Session may store results either as a list of URL strings or objects like
-    # {"url": "/static/assets/...", "slotIndex": 1, ...}.
-    urls: list[str] = []
-    for r in results:
-        if isinstance(r, str) and r.strip():
-            urls.append(r.strip())
-            continue
-        if isinstance(r, dict):
-            u = r.get("url")
-            if isinstance(u, str) and u.strip():
-                urls.append(u.strip())
-
     # de-dup while keeping order
     seen = set()
     urls = [u for u in urls if not (u in seen or seen.add(u))]
@@ -494,7 +335,7 @@ def reset_session(mode: str, req: Request):
         raise HTTPException(status_code=400, detail="Bad mode")
     uid = _uid(req)
     with db() as con:
-        con.execute("DELETE FROM lookbook_sessions WHERE user_id=? AND mode=?", (uid, mode))
+        lb_sessions.delete_session(con, uid, mode)
     return {"ok": True}
 
 class PhotoshootIn(BaseModel):
@@ -502,12 +343,102 @@ class PhotoshootIn(BaseModel):
 
 
 @router.get("/jobs/{job_id}")
-def get_job(job_id: str, req: Request):
+async def get_job(job_id: str, req: Request, waitSeconds: float = 0):
+    # ETag/304 + long-poll (?waitSeconds=) из кэша состояний задач, см. api/job_status
     uid = _uid(req)
-    job = _job_get(uid, job_id)
-    if not job:
-        raise HTTPException(status_code=404, detail="Job not found")
-    return {"ok": True, "job": job}
+    return await job_status_response(req, "lookbook_jobs", uid, job_id, waitSeconds, {"ok": True})
+
+def _photoshoot_job(job_id: str, uid: str, payload: dict):
+    """Job handler "lookbook.photoshoot" (runs on the job queue workers; payload is built in run_photoshoot)."""
+    mode = payload["mode"]
+    shots = payload["shots"]
+    credits = int(payload["credits"])
+    model_url = payload["modelUrl"]
+    loc_url = payload["locationUrl"]
+    spent = 0
+    try:
+        _job_update(job_id, state="running", progress=5)
+        cfg = load_engine_config()
+
+        # Pre-flight: classify all refs in parallel and reject the job before credits/image calls
+        pre = engine_preflight(cfg, mode, shots)
+        if not pre.get("ok"):
+            _job_update(job_id, state="error", progress=0, error=pre.get("message") or pre.get("code") or "Engine error")
+            return
+        _job_update(job_id, progress=10)
+
+        # Spend credits once per job
+        try:
+            add_ledger(uid, -credits, "LOOKBOOK_PHOTOSHOOT", ref=f"{mode}:{credits}:{job_id}")
+            spent = credits
+            _job_update(job_id, spent=spent)
+        except ValueError as e:
+            _job_update(job_id, state="error", progress=0, error=str(e))
+            return
+
+        _job_update(job_id, progress=15)
+        prompts_dir = os.path.join(os.path.dirname(__file__), "..", "..", "engine", "prompts")
+        prompts_dir = os.path.abspath(prompts_dir)
+        payload_scene = {
+            "model": {"source": "url", "imgUrl": model_url},
+            "location": {"source": "url", "imgUrl": loc_url},
+        }
+
+        def _on_shot_done(done: int, total: int):
+            # 15..80 — равномерно по мере готовности кадров
+            _job_update(job_id, progress=15 + int(65 * done / max(1, total)))
+
+        eng = engine_photoshoot(cfg, prompts_dir, mode, payload_scene, shots, debug=bool(payload.get("debug")), on_shot_done=_on_shot_done, labels=pre["labels"])
+        if not eng.get("ok"):
+            raise ValueError(eng.get("message") or eng.get("code") or "Engine error")
+
+        _job_update(job_id, progress=80)
+
+        out_results = []
+        for r in eng.get("results") or []:
+            data_url = r.get("image")
+            if not data_url:
+                continue
+            url = _save_dataurl_to_asset_url(data_url)
+            slot = None
+            rid = r.get("id") or ""
+            m = re.match(r"slot_(\d+)", rid)
+            if m:
+                slot = int(m.group(1))
+            out_results.append({"slotIndex": slot, "url": url})
+
+        # persist session results (+ run info with jobId)
+        with db() as con:
+            lb_sessions.ensure_session(con, uid, mode)
+            lb_sessions.replace_results(con, uid, mode, out_results)
+            # results под session version: устаревший {results, version} PATCH получит 409
+            version = lb_sessions.bump_version(con, uid, mode)
+            lb_sessions.set_run(con, uid, mode, job_id, running=False)
+
+        # version — чтобы клиент продолжил правки с новой версией сессии, а не получил 409
+        _job_update(job_id, state="done", progress=100, result_json=json.dumps({"results": out_results, "spent": spent, "version": version}, ensure_ascii=False))
+    except Exception as e:
+        # refund spent credits
+        if spent:
+            try:
+                add_ledger(uid, spent, "REFUND", ref=f"LOOKBOOK:{mode}:{job_id}")
+            except Exception:
+                pass
+        _job_update(job_id, state="error", progress=0, error=str(e), spent=0)
+    finally:
+        _release_run_lock(uid, mode)
+        _session_set_job(uid, mode, job_id, running=False)
+
+
+def _photoshoot_job_abandoned(job_id: str, uid: str, payload: dict):
+    # задача не будет перезапущена (воркер упал, попытки кончились) — снимаем lock сессии
+    mode = payload.get("mode") or ""
+    _release_run_lock(uid, mode)
+    _session_set_job(uid, mode, job_id, running=False)
+
+
+register_handler("lookbook.photoshoot", _photoshoot_job, on_abandon=_photoshoot_job_abandoned)
+
 
 @router.post("/photoshoot/{mode}")
 def run_photoshoot(req: Request, mode: str, body: PhotoshootIn):
@@ -571,80 +502,20 @@ def run_photoshoot(req: Request, mode: str, body: PhotoshootIn):
     # Persist jobId into session._run so UI can recover without localStorage
     _session_set_job(uid, mode, job_id, running=True)
 
-    def _runner():
-        spent = 0
-        try:
-            _job_update(job_id, state="running", progress=5)
-
-            # Spend credits once per job
-            try:
-                add_ledger(uid, -credits, "LOOKBOOK_PHOTOSHOOT", ref=f"{mode}:{credits}:{job_id}")
-                spent = credits
-                _job_update(job_id, spent=spent)
-            except ValueError as e:
-                _job_update(job_id, state="error", progress=0, error=str(e))
-                return
-
-            _job_update(job_id, progress=15)
-            cfg = load_engine_config()
-            prompts_dir = os.path.join(os.path.dirname(__file__), "..", "..", "engine", "prompts")
-            prompts_dir = os.path.abspath(prompts_dir)
-            payload_scene = {
-                "model": {"source": "url", "imgUrl": model_url},
-                "location": {"source": "url", "imgUrl": loc_url},
-            }
-            eng = engine_photoshoot(cfg, prompts_dir, mode, payload_scene, shots, debug=bool(body.debug))
-            if not eng.get("ok"):
-                raise ValueError(eng.get("message") or eng.get("code") or "Engine error")
-
-            _job_update(job_id, progress=80)
-
-            out_results = []
-            for r in eng.get("results") or []:
-                data_url = r.get("image")
-                if not data_url:
-                    continue
-                url = _save_dataurl_to_asset_url(data_url)
-                slot = None
-                rid = r.get("id") or ""
-                m = re.match(r"slot_(\d+)", rid)
-                if m:
-                    slot = int(m.group(1))
-                out_results.append({"slotIndex": slot, "url": url})
-
-            # persist session results
-            with db() as con:
-                row = con.execute(
-                    "SELECT data FROM lookbook_sessions WHERE user_id=? AND mode=?",
-                    (uid, mode),
-                ).fetchone()
-                data = json.loads(row["data"]) if row and row["data"] else _default_session(mode)
-                data["results"] = out_results
-                # keep run info with jobId
-                run = (data or {}).get("_run") or {}
-                run["running"] = False
-                run["jobId"] = job_id
-                run["finishedAt"] = datetime.now(timezone.utc).isoformat()
-                data["_run"] = run
-                con.execute(
-                    "UPDATE lookbook_sessions SET data=?, updated_at=? WHERE user_id=? AND mode=?",
-                    (json.dumps(data, ensure_ascii=False), _now_iso(), uid, mode),
-                )
-
-            _job_update(job_id, state="done", progress=100, result_json=json.dumps({"results": out_results, "spent": spent}, ensure_ascii=False))
-        except Exception as e:
-            # refund spent credits
-            if spent:
-                try:
-                    add_ledger(uid, spent, "REFUND", ref=f"LOOKBOOK:{mode}:{job_id}")
-                except Exception:
-                    pass
-            _job_update(job_id, state="error", progress=0, error=str(e))
-        finally:
-            _release_run_lock(uid, mode)
-            _session_set_job(uid, mode, job_id, running=False)
-
-    t = threading.Thread(target=_runner, daemon=True)
-    t.start()
+    payload = {
+        "mode": mode,
+        "shots": shots,
+        "credits": credits,
+        "modelUrl": model_url,
+        "locationUrl": loc_url,
+        "debug": bool(body.debug),
+    }
+    try:
+        enqueue_job("lookbook_jobs", job_id, uid, "lookbook.photoshoot", payload)
+    except SchedulerBusy as e:
+        _job_update(job_id, state="error", progress=0, error=str(e))
+        _release_run_lock(uid, mode)
+        _session_set_job(uid, mode, job_id, running=False)
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
 
     return {"ok": True, "mode": mode, "jobId": job_id, "state": "queued", "spent": credits}
\ No newline at end of file
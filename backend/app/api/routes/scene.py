@@ -2,7 +2,6 @@ from fastapi import APIRouter, Request, HTTPException
 from pydantic import BaseModel
 from datetime import datetime
 import json
-import threading
 import uuid
 from datetime import timezone
 
@@ -14,6 +13,10 @@ from typing import List, Optional, Any
 
 from app.core.config import settings
 from app.engine.scene_engine import create_asset
+from app.services.job_scheduler import SchedulerBusy
+from app.services.job_queue import enqueue as enqueue_job, register_handler
+from app.services.job_events import publish_job
+from app.api.job_status import job_status_response
 from app.engine.media_io import fetch_url_to_bytes, bytes_to_b64, sniff_mime_from_bytes
 
 from app.core.tokens import verify_token
@@ -162,25 +165,10 @@ def _scene_job_update(job_id: str, **fields):
     vals.append(_job_now_iso())
     vals.append(job_id)
     with db() as con:
-        con.execute(f"UPDATE scene_jobs SET {', '.join(sets)} WHERE job_id=?", tuple(vals))
-
-def _scene_job_get(uid: str, job_id: str) -> dict | None:
-    with db() as con:
-        row = con.execute(
-            "SELECT job_id, user_id, kind, action, state, progress, result_json, error, created_at, updated_at FROM scene_jobs WHERE job_id=?",
-            (job_id,),
-        ).fetchone()
-        if not row:
-            return None
-        if row["user_id"] != uid:
-            return None
-        out = dict(row)
-        try:
-            out["result"] = json.loads(out.get("result_json") or "null")
-        except Exception:
-            out["result"] = None
-        out.pop("result_json", None)
-        return out
+        # RETURNING user_id: владелец для publish_job без отдельного чтения строки
+        row = con.execute(f"UPDATE scene_jobs SET {', '.join(sets)} WHERE job_id=? RETURNING user_id", tuple(vals)).fetchone()
+    if row is not None:
+        publish_job("scene_jobs", job_id, row["user_id"])
 
 ASSETS_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "..", "static", "assets")
 ASSETS_DIR = os.path.abspath(ASSETS_DIR)
@@ -338,22 +326,69 @@ def scene_apply_details(req: Request, body: SceneApplyDetailsIn):
 
 
 @router.get("/scene/jobs/{job_id}")
-def scene_get_job(req: Request, job_id: str):
+async def scene_get_job(req: Request, job_id: str, waitSeconds: float = 0):
+    # ETag/304 + long-poll (?waitSeconds=) из кэша состояний задач, см. api/job_status
     uid = _current_user_id(req)
-    job = _scene_job_get(uid, job_id)
-    if not job:
-        raise HTTPException(status_code=404, detail="Job not found")
-    return {"job": job}
+    return await job_status_response(req, "scene_jobs", uid, job_id, waitSeconds)
 
 
 
 
+def _scene_job_submit(uid: str, job_id: str, handler: str, payload: dict):
+    try:
+        enqueue_job("scene_jobs", job_id, uid, handler, payload)
+    except SchedulerBusy as e:
+        _scene_job_update(job_id, state="error", error=str(e), progress=100)
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
 class SceneGenerateJobIn(BaseModel):
     kind: str
     baseUrl: Optional[str] = None
     prompt: str = ""
     format: Optional[str] = "9:16"
 
+def _scene_generate_job(job_id: str, uid: str, payload: dict):
+    """Job handler "scene.generate"."""
+    kind = payload["kind"]
+    body = SceneGenerateJobIn(**(payload.get("body") or {}))
+    try:
+        _scene_job_update(job_id, state="running", progress=5)
+        base_dataurl = None
+        if body.baseUrl:
+            base_dataurl = _url_to_dataurl(body.baseUrl)
+
+        prompt = (body.prompt or "").strip()
+        full_prompt = prompt if prompt else ("Create a photorealistic fashion model" if kind == "model" else "Create a photorealistic fashion location background")
+        fmt = _normalize_format(body.format)
+        full_prompt = (full_prompt + " " + _format_hint(fmt, kind)).strip()
+
+        _scene_job_update(job_id, progress=35)
+        out_dataurl = create_asset(kind=kind, prompt=full_prompt, base_image=base_dataurl, details=[])
+        _scene_job_update(job_id, progress=70)
+        asset_url = _save_dataurl_to_asset_url(out_dataurl)
+
+        # persist into current scene
+        with db() as con:
+            row = con.execute("SELECT data FROM scenes WHERE user_id = ?", (uid,)).fetchone()
+            data = json.loads(row["data"]) if row and row["data"] else _default_scene()
+            if kind == "model":
+                data["modelUrl"] = asset_url
+            else:
+                data["locationUrl"] = asset_url
+            ts = _now_iso()
+            if row:
+                con.execute("UPDATE scenes SET data=?, updated_at=? WHERE user_id=?", (json.dumps(data, ensure_ascii=False), ts, uid))
+            else:
+                con.execute("INSERT INTO scenes(user_id, data, updated_at) VALUES(?,?,?)", (uid, json.dumps(data, ensure_ascii=False), ts))
+
+        _scene_job_update(job_id, state="done", progress=100, result_json=json.dumps({"url": asset_url}, ensure_ascii=False))
+    except Exception as e:
+        _scene_job_update(job_id, state="error", error=str(e), progress=100)
+
+
+register_handler("scene.generate", _scene_generate_job)
+
 @router.post("/scene/generateJob")
 def scene_generate_job(req: Request, body: SceneGenerateJobIn):
     uid = _current_user_id(req)
@@ -363,44 +398,7 @@ def scene_generate_job(req: Request, body: SceneGenerateJobIn):
         raise HTTPException(status_code=400, detail="kind must be 'model' or 'location'")
 
     job_id = _scene_job_create(uid, kind, "generate")
-
-    def _run():
-        try:
-            _scene_job_update(job_id, state="running", progress=5)
-            base_dataurl = None
-            if body.baseUrl:
-                base_dataurl = _url_to_dataurl(body.baseUrl)
-
-            prompt = (body.prompt or "").strip()
-            full_prompt = prompt if prompt else ("Create a photorealistic fashion model" if kind == "model" else "Create a photorealistic fashion location background")
-            fmt = _normalize_format(body.format)
-            full_prompt = (full_prompt + " " + _format_hint(fmt, kind)).strip()
-
-            _scene_job_update(job_id, progress=35)
-            out_dataurl = create_asset(kind=kind, prompt=full_prompt, base_image=base_dataurl, details=[])
-            _scene_job_update(job_id, progress=70)
-            asset_url = _save_dataurl_to_asset_url(out_dataurl)
-
-            # persist into current scene
-            with db() as con:
-                row = con.execute("SELECT data FROM scenes WHERE user_id = ?", (uid,)).fetchone()
-                data = json.loads(row["data"]) if row and row["data"] else _default_scene()
-                if kind == "model":
-                    data["modelUrl"] = asset_url
-                else:
-                    data["locationUrl"] = asset_url
-                ts = _now_iso()
-                if row:
-                    con.execute("UPDATE scenes SET data=?, updated_at=? WHERE user_id=?", (json.dumps(data, ensure_ascii=False), ts, uid))
-                else:
-                    con.execute("INSERT INTO scenes(user_id, data, updated_at) VALUES(?,?,?)", (uid, json.dumps(data, ensure_ascii=False), ts))
-
-            _scene_job_update(job_id, state="done", progress=100, result_json=json.dumps({"url": asset_url}, ensure_ascii=False))
-        except Exception as e:
-            _scene_job_update(job_id, state="error", error=str(e), progress=100)
-
-    t = threading.Thread(target=_run, daemon=True)
-    t.start()
+    _scene_job_submit(uid, job_id, "scene.generate", {"kind": kind, "body": body.model_dump()})
     return {"ok": True, "jobId": job_id}
 
 
@@ -413,74 +411,78 @@ class SceneApplyDetailsJobIn(BaseModel):
     prompt: str = ""
     format: Optional[str] = "9:16"
 
-@router.post("/scene/applyDetailsJob")
-def scene_apply_details_job(req: Request, body: SceneApplyDetailsJobIn):
-    uid = _current_user_id(req)
-
-    kind = (body.kind or "").strip().lower()
-    if kind not in ("model", "location"):
-        raise HTTPException(status_code=400, detail="kind must be 'model' or 'location'")
+def _scene_apply_details_job(job_id: str, uid: str, payload: dict):
+    """Job handler "scene.applyDetails"."""
+    kind = payload["kind"]
+    body = SceneApplyDetailsJobIn(**(payload.get("body") or {}))
+    try:
+        _scene_job_update(job_id, state="running", progress=5)
 
-    job_id = _scene_job_create(uid, kind, "applyDetails")
+        # Load current scene to pick baseUrl if not provided
+        with db() as con:
+            row = con.execute("SELECT data FROM scenes WHERE user_id = ?", (uid,)).fetchone()
+            sc = json.loads(row["data"]) if row and row["data"] else _default_scene()
 
-    def _run():
-        try:
-            _scene_job_update(job_id, state="running", progress=5)
+        base_url = body.baseUrl or (sc.get("modelUrl") if kind == "model" else sc.get("locationUrl"))
+        if not base_url:
+            raise Exception("No base image. Generate model/location first.")
 
-            # Load current scene to pick baseUrl if not provided
-            with db() as con:
-                row = con.execute("SELECT data FROM scenes WHERE user_id = ?", (uid,)).fetchone()
-                sc = json.loads(row["data"]) if row and row["data"] else _default_scene()
+        base_dataurl = _url_to_dataurl(base_url)
 
-            base_url = body.baseUrl or (sc.get("modelUrl") if kind == "model" else sc.get("locationUrl"))
-            if not base_url:
-                raise Exception("No base image. Generate model/location first.")
+        detail_urls = [u for u in (body.detailUrls or []) if isinstance(u, str) and u.strip()]
+        if not detail_urls:
+            raise Exception("No detailUrls provided")
 
-            base_dataurl = _url_to_dataurl(base_url)
+        _scene_job_update(job_id, progress=25)
 
-            detail_urls = [u for u in (body.detailUrls or []) if isinstance(u, str) and u.strip()]
-            if not detail_urls:
-                raise Exception("No detailUrls provided")
+        detail_dataurls = []
+        for u in detail_urls:
+            detail_dataurls.append(_url_to_dataurl(u))
 
-            _scene_job_update(job_id, progress=25)
+        prompt = (body.prompt or "").strip()
+        if kind == "model":
+            base_prompt = "Apply the provided detail reference images to the SAME person and outfit. Keep identity, face, body, pose, and background unchanged. Improve realism and match details only."
+        else:
+            base_prompt = "Apply the provided detail reference images to the SAME location scene. Keep camera, composition, lighting and all other elements unchanged. Match details only."
+        full_prompt = (base_prompt + " " + prompt).strip()
+        fmt = _normalize_format(body.format)
+        full_prompt = (full_prompt + " " + _format_hint(fmt, kind)).strip()
 
-            detail_dataurls = []
-            for u in detail_urls:
-                detail_dataurls.append(_url_to_dataurl(u))
+        _scene_job_update(job_id, progress=55)
+        out_dataurl = create_asset(kind=kind, prompt=full_prompt, base_image=base_dataurl, details=detail_dataurls)
+        _scene_job_update(job_id, progress=80)
+        asset_url = _save_dataurl_to_asset_url(out_dataurl)
 
-            prompt = (body.prompt or "").strip()
+        # persist: update base
+        with db() as con:
+            row = con.execute("SELECT data FROM scenes WHERE user_id = ?", (uid,)).fetchone()
+            data = json.loads(row["data"]) if row and row["data"] else _default_scene()
             if kind == "model":
-                base_prompt = "Apply the provided detail reference images to the SAME person and outfit. Keep identity, face, body, pose, and background unchanged. Improve realism and match details only."
+                data["modelUrl"] = asset_url
+            else:
+                data["locationUrl"] = asset_url
+            ts = _now_iso()
+            if row:
+                con.execute("UPDATE scenes SET data=?, updated_at=? WHERE user_id=?", (json.dumps(data, ensure_ascii=False), ts, uid))
             else:
-                base_prompt = "Apply the provided detail reference images to the SAME location scene. Keep camera, composition, lighting and all other elements unchanged. Match details only."
-            full_prompt = (base_prompt + " " + prompt).strip()
-            fmt = _normalize_format(body.format)
-            full_prompt = (full_prompt + " " + _format_hint(fmt, kind)).strip()
-
-            _scene_job_update(job_id, progress=55)
-            out_dataurl = create_asset(kind=kind, prompt=full_prompt, base_image=base_dataurl, details=detail_dataurls)
-            _scene_job_update(job_id, progress=80)
-            asset_url = _save_dataurl_to_asset_url(out_dataurl)
-
-            # persist: update base
-            with db() as con:
-                row = con.execute("SELECT data FROM scenes WHERE user_id = ?", (uid,)).fetchone()
-                data = json.loads(row["data"]) if row and row["data"] else _default_scene()
-                if kind == "model":
-                    data["modelUrl"] = asset_url
-                else:
-                    data["locationUrl"] = asset_url
-                ts = _now_iso()
-                if row:
-                    con.execute("UPDATE scenes SET data=?, updated_at=? WHERE user_id=?", (json.dumps(data, ensure_ascii=False), ts, uid))
-                else:
-                    con.execute("INSERT INTO scenes(user_id, data, updated_at) VALUES(?,?,?)", (uid, json.dumps(data, ensure_ascii=False), ts))
-
-            _scene_job_update(job_id, state="done", progress=100, result_json=json.dumps({"url": asset_url}, ensure_ascii=False))
-        except Exception as e:
-            _scene_job_update(job_id, state="error", error=str(e), progress=100)
-
-    t = threading.Thread(target=_run, daemon=True)
-    t.start()
+                con.execute("INSERT INTO scenes(user_id, data, updated_at) VALUES(?,?,?)", (uid, json.dumps(data, ensure_ascii=False), ts))
+
+        _scene_job_update(job_id, state="done", progress=100, result_json=json.dumps({"url": asset_url}, ensure_ascii=False))
+    except Exception as e:
+        _scene_job_update(job_id, state="error", error=str(e), progress=100)
+
+
+register_handler("scene.applyDetails", _scene_apply_details_job)
+
+@router.post("/scene/applyDetailsJob")
+def scene_apply_details_job(req: Request, body: SceneApplyDetailsJobIn):
+    uid = _current_user_id(req)
+
+    kind = (body.kind or "").strip().lower()
+    if kind not in ("model", "location"):
+        raise HTTPException(status_code=400, detail="kind must be 'model' or 'location'")
+
+    job_id = _scene_job_create(uid, kind, "applyDetails")
+    _scene_job_submit(uid, job_id, "scene.applyDetails", {"kind": kind, "body": body.model_dump()})
     return {"ok": True, "jobId": job_id}
 
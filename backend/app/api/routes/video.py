@@ -1,18 +1,29 @@
+import json
 import os
 import shutil
-import subprocess
-import tempfile
+import threading
 import time
+import uuid
+from concurrent.futures import Future
+from datetime import datetime, timezone
 from pathlib import Path
 from typing import List, Optional
 
-from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Body
+from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Body, Request
 
 from app.core.config import settings
-from app.api.deps import get_current_user
+from app.api.deps import current_user_id
+from app.db.sqlite import db
+from app.services.job_scheduler import SchedulerBusy
+from app.services.job_queue import enqueue as enqueue_job, register_handler
+from app.services.job_events import publish_job
+from app.api.job_status import job_status_response
 
 # Engine
-from app.engine.video_engine import generate_video
+from app.engine.provider_poller import get_provider_poller
+from app.engine.video_engine import start_videos
+from app.engine.video_merge import merge_clips
+from app.engine.frames import extract_frames
 
 router = APIRouter(prefix="/video")
 
@@ -30,8 +41,7 @@ def _public_url_for_video(filename: str) -> str:
 
 
 @router.post("/upload")
-async def upload_video(file: UploadFile = File(...), user=Depends(get_current_user)):
-    # NOTE: user dependency is important for account scoping in future.
+async def upload_video(file: UploadFile = File(...), uid: str = Depends(current_user_id)):
     if not file:
         raise HTTPException(status_code=400, detail="No file")
     ct = (file.content_type or "").lower()
@@ -40,7 +50,7 @@ async def upload_video(file: UploadFile = File(...), user=Depends(get_current_us
 
     videos_dir = _ensure_videos_dir()
     ext = ".mp4" if file.filename.lower().endswith(".mp4") else (".webm" if file.filename.lower().endswith(".webm") else ".mp4")
-    safe_name = f"clip_{user['id']}_{abs(hash(file.filename))}{ext}"
+    safe_name = f"clip_{uid}_{abs(hash(file.filename))}{ext}"
     out_path = videos_dir / safe_name
     with out_path.open("wb") as f:
         shutil.copyfileobj(file.file, f)
@@ -48,9 +58,143 @@ async def upload_video(file: UploadFile = File(...), user=Depends(get_current_us
     return {"url": _public_url_for_video(safe_name)}
 
 
+# -----------------------
+# Video jobs (server-side) — generation polls the provider for minutes,
+# so it runs on the job workers and progress is persisted into video_jobs.
+# -----------------------
+
+def _job_now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _video_job_create(uid: str, action: str) -> str:
+    job_id = f"vid_{uuid.uuid4().hex[:16]}"
+    now = _job_now_iso()
+    with db() as con:
+        con.execute(
+            "INSERT INTO video_jobs(job_id, user_id, action, state, progress, result_json, error, spent, created_at, updated_at) VALUES(?,?,?,?,?,?,?,?,?,?)",
+            (job_id, uid, action, "queued", 0, None, None, 0, now, now),
+        )
+    return job_id
+
+
+def _video_job_update(job_id: str, **fields):
+    if not job_id:
+        return
+    allowed = {"state", "progress", "result_json", "error", "spent"}
+    sets = []
+    vals = []
+    for k, v in fields.items():
+        if k not in allowed:
+            continue
+        sets.append(f"{k}=?")
+        vals.append(v)
+    sets.append("updated_at=?")
+    vals.append(_job_now_iso())
+    vals.append(job_id)
+    with db() as con:
+        # RETURNING user_id: владелец для publish_job без отдельного чтения строки
+        row = con.execute(f"UPDATE video_jobs SET {', '.join(sets)} WHERE job_id=? RETURNING user_id", tuple(vals)).fetchone()
+    if row is not None:
+        publish_job("video_jobs", job_id, row["user_id"])
+
+
+def _video_job_submit(uid: str, job_id: str, handler: str, payload: dict):
+    try:
+        enqueue_job("video_jobs", job_id, uid, handler, payload)
+    except SchedulerBusy as e:
+        _video_job_update(job_id, state="error", error=str(e), progress=100)
+        raise HTTPException(status_code=e.status_code, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+
+
+def _clip_result(res: dict) -> dict:
+    if not isinstance(res, dict) or not res.get("ok"):
+        code = (res or {}).get("code") if isinstance(res, dict) else None
+        msg = (res or {}).get("message") if isinstance(res, dict) else "Generation failed"
+        return {"state": "error", "code": code or "GEN_FAILED", "error": msg or "Generation failed"}
+    url = res.get("videoUrl") or res.get("video_url") or res.get("url")
+    if not url:
+        return {"state": "error", "code": "GEN_FAILED", "error": "Provider returned no video url"}
+    return {
+        "state": "done",
+        "videoUrl": url,
+        "lastFrameUrl": res.get("lastFrameUrl") or res.get("last_frame_url"),
+        "warning": res.get("warning"),
+    }
+
+
+def _clips_summary(provider: str, clips: List[dict]) -> dict:
+    ok = [c for c in clips if c.get("state") == "done"]
+    return {
+        "provider": provider,
+        "clips": clips,
+        # back-compat: successful clips only, in request order
+        "videos": [c["videoUrl"] for c in ok],
+        "lastFrames": [c.get("lastFrameUrl") for c in ok],
+        "warnings": [c.get("warning") for c in ok],
+    }
+
+
+def _video_generate_job(job_id: str, uid: str, payload: dict) -> Optional[Future]:
+    """
+    Job handler "video.generate": clips run concurrently, each clip reports its own result.
+    Воркер занят только на отправке клипов: дальше задачу завершает колбэк готовых клипов
+    (возвращаемый Future — job_queue держит lease, пока он не выполнится).
+    """
+    count = int(payload.get("count") or 1)
+    provider = payload["provider"]
+    clips: List[dict] = [{"state": "running"} for _ in range(count)]
+    lock = threading.Lock()
+
+    def _on_clip_done(i: int, res: dict):
+        with lock:
+            clips[i] = _clip_result(res)
+            finished = sum(1 for c in clips if c.get("state") != "running")
+            _video_job_update(
+                job_id,
+                progress=5 + int(90 * finished / count),
+                result_json=json.dumps(_clips_summary(provider, clips), ensure_ascii=False),
+            )
+
+    def _finish(_results: list):
+        summary = _clips_summary(provider, clips)
+        if summary["videos"]:
+            _video_job_update(job_id, state="done", progress=100, result_json=json.dumps(summary, ensure_ascii=False))
+        else:
+            err = next((c.get("error") for c in clips if c.get("error")), "Generation failed")
+            _video_job_update(job_id, state="error", error=err, progress=100, result_json=json.dumps(summary, ensure_ascii=False))
+
+    try:
+        _video_job_update(job_id, state="running", progress=5)
+        started = start_videos(
+            count,
+            kind="video_from_image",
+            source_image=payload["source"],
+            fmt=payload["fmt"],
+            model=payload["model"],
+            camera=payload["camera"],
+            prompt=payload["prompt"],
+            seconds=payload["seconds"],
+            lighting=payload["lighting"],
+            on_clip_done=_on_clip_done,
+        )
+    except Exception as e:
+        _video_job_update(job_id, state="error", error=str(e), progress=100)
+        return None
+    return get_provider_poller().then(started, _finish)
+
+
+register_handler("video.generate", _video_generate_job)
+
+
 @router.post("/generate")
-async def generate(payload: dict = Body(...), user=Depends(get_current_user)):
-    """Generate a short video (Kling or Veo) from 1..3 reference images.
+def generate(payload: dict = Body(...), uid: str = Depends(current_user_id)):
+    """Start a short video generation job (Kling or Veo) from 1..3 reference images.
+
+    Returns {"ok": true, "jobId": ...} immediately; poll GET /video/jobs/{jobId}.
+    Clips are generated concurrently; job.result = {"provider", "clips", "videos", "lastFrames", "warnings"}
+    is updated as each clip finishes. clips[i] = {"state": running|done|error, "videoUrl"/"error", ...};
+    the job is "done" if at least one clip succeeded.
 
     Accepts flexible payload keys to avoid 422 issues:
       provider: "kling" | "veo"
@@ -96,46 +240,59 @@ async def generate(payload: dict = Body(...), user=Depends(get_current_user)):
     # For Veo: pass list (up to 3) to engine; for Kling: pass first image only
     source_for_engine = srcs if model == "premium" else (srcs[0] if srcs else "")
 
-    videos: List[str] = []
-    last_frames: List[Optional[str]] = []
-    warnings: List[Optional[str]] = []
+    job_id = _video_job_create(uid, "generate")
+    _video_job_submit(uid, job_id, "video.generate", {
+        "provider": provider,
+        "source": source_for_engine,
+        "fmt": fmt,
+        "model": model,
+        "camera": camera,
+        "prompt": prompt,
+        "seconds": seconds,
+        "lighting": lighting,
+        "count": count,
+    })
+    return {"ok": True, "jobId": job_id, "provider": provider}
+
+
+@router.get("/jobs/{job_id}")
+async def get_video_job(job_id: str, req: Request, waitSeconds: float = 0, uid: str = Depends(current_user_id)):
+    # ETag/304 + long-poll (?waitSeconds=) из кэша состояний задач, см. api/job_status
+    return await job_status_response(req, "video_jobs", uid, job_id, waitSeconds)
+
+
+def _video_merge_job(job_id: str, uid: str, payload: dict):
+    """Job handler "video.merge": stream-copy concat when clips match, normalize only mismatched ones."""
+    videos_dir = _ensure_videos_dir()
+    local_files = [videos_dir / name for name in payload["files"]]
+    out_name = payload["outName"]
+    try:
+        _video_job_update(job_id, state="running", progress=5)
+        missing = [p.name for p in local_files if not p.exists()]
+        if missing:
+            raise RuntimeError(f"Missing clip: {missing[0]}")
+
+        def _on_progress(frac: float):
+            _video_job_update(job_id, progress=5 + int(90 * frac))
 
-    for _ in range(count):
-        res = generate_video(
-            kind="video_from_image",
-            source_image=source_for_engine,
-            fmt=fmt,
-            model=model,
-            camera=camera,
-            prompt=prompt,
-            seconds=seconds,
-            lighting=lighting,
-        )
-        if not isinstance(res, dict) or not res.get("ok"):
-            # normalize error
-            code = (res or {}).get("code") if isinstance(res, dict) else None
-            msg = (res or {}).get("message") if isinstance(res, dict) else "Generation failed"
-            raise HTTPException(status_code=400, detail={"code": code or "GEN_FAILED", "message": msg, "raw": res})
+        info = merge_clips([str(p) for p in local_files], str(videos_dir / out_name), on_progress=_on_progress)
+        result = {"url": _public_url_for_video(out_name), "mode": info["mode"], "normalized": info["normalized"], "transcoded": info["transcoded"]}
+        _video_job_update(job_id, state="done", progress=100, result_json=json.dumps(result, ensure_ascii=False))
+    except Exception as e:
+        _video_job_update(job_id, state="error", error=str(e), progress=100)
 
-        url = res.get("videoUrl") or res.get("video_url") or res.get("url")
-        lf = res.get("lastFrameUrl") or res.get("last_frame_url")
-        warn = res.get("warning")
-        if url:
-            videos.append(url)
-            last_frames.append(lf)
-            warnings.append(warn)
 
-    return {"ok": True, "provider": provider, "videos": videos, "lastFrames": last_frames, "warnings": warnings}
+register_handler("video.merge", _video_merge_job)
 
 
 @router.post("/merge")
-async def merge_videos(payload: dict, user=Depends(get_current_user)):
+def merge_videos(payload: dict, uid: str = Depends(current_user_id)):
+    """Start a merge job for 2+ of our own /static/videos clips. Poll GET /video/jobs/{jobId}; result = {"url"}."""
     clip_urls: List[str] = payload.get("clipUrls") or []
     if not isinstance(clip_urls, list) or len(clip_urls) < 2:
         raise HTTPException(status_code=400, detail="clipUrls must contain at least 2 urls")
 
-    ffmpeg = shutil.which("ffmpeg")
-    if not ffmpeg:
+    if not shutil.which("ffmpeg"):
         raise HTTPException(status_code=500, detail="ffmpeg not found. Install ffmpeg and add to PATH")
 
     base = (settings.PUBLIC_BASE_URL or "").rstrip("/")
@@ -157,41 +314,52 @@ async def merge_videos(payload: dict, user=Depends(get_current_user)):
         else:
             raise HTTPException(status_code=400, detail="Only /static/videos/* urls are allowed")
         p = videos_dir / fname
-        if not p.exists():
+        if p.parent != videos_dir or not p.exists():
             raise HTTPException(status_code=404, detail=f"Missing clip: {fname}")
         local_files.append(p)
 
     if len(local_files) < 2:
         raise HTTPException(status_code=400, detail="Need at least 2 valid local clips")
 
-    out_name = f"merge_{user['id']}_{int(time.time()*1000)}.mp4"
-    out_path = videos_dir / out_name
-
-    # Safer merge: concat + re-encode to avoid codec mismatch between providers
-    with tempfile.TemporaryDirectory() as td:
-        list_path = Path(td) / "list.txt"
-        lines = []
-        for p in local_files:
-            escaped = str(p).replace("'", "'\''")
-            lines.append(f"file '{escaped}'")
-        list_path.write_text("\n".join(lines), encoding="utf-8")
-
-        cmd = [
-            ffmpeg,
-            "-y",
-            "-f", "concat",
-            "-safe", "0",
-            "-i", str(list_path),
-            "-vf", "fps=30,format=yuv420p",
-            "-c:v", "libx264",
-            "-preset", "veryfast",
-            "-crf", "20",
-            "-c:a", "aac",
-            "-b:a", "128k",
-            str(out_path),
-        ]
-        proc = subprocess.run(cmd, capture_output=True, text=True)
-        if proc.returncode != 0:
-            raise HTTPException(status_code=500, detail=f"ffmpeg failed: {proc.stderr[-400:]}" )
-
-    return {"url": _public_url_for_video(out_name)}
+    out_name = f"merge_{uid}_{int(time.time()*1000)}.mp4"
+    job_id = _video_job_create(uid, "merge")
+    _video_job_submit(uid, job_id, "video.merge", {"files": [p.name for p in local_files], "outName": out_name})
+    return {"ok": True, "jobId": job_id}
+
+
+@router.post("/frames")
+def video_frames(payload: dict = Body(...), uid: str = Depends(current_user_id)):
+    """Thumbnails of one of our /static/videos clips.
+
+      videoUrl: /static/videos/<file>
+      kinds: ["first", "last", "poster"] (default ["last"])
+      format: "jpg" | "webp" | "png" (default "jpg")
+      width: max width in px (optional, keeps aspect)
+    Returns {"ok": true, "frames": {kind: url}}.
+    """
+    video_url = (payload.get("videoUrl") or "").strip()
+    if "/static/videos/" not in video_url:
+        raise HTTPException(status_code=400, detail="Only /static/videos/* urls are allowed")
+    videos_dir = _ensure_videos_dir()
+    name = video_url.split("/static/videos/")[-1].split("?", 1)[0]
+    if not name or name in (".", "..") or "/" in name or "\\" in name:
+        raise HTTPException(status_code=400, detail="Bad videoUrl")
+    p = videos_dir / name
+    if p.parent != videos_dir or not p.is_file():
+        raise HTTPException(status_code=404, detail="Video not found")
+
+    kinds = payload.get("kinds") or ["last"]
+    if isinstance(kinds, str):
+        kinds = [kinds]
+    width = payload.get("width")
+    try:
+        width = max(16, min(4096, int(width))) if width else None
+    except Exception:
+        width = None
+    try:
+        names = extract_frames(str(p), str(videos_dir), kinds=kinds, fmt=payload.get("format") or "jpg", width=width)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"ok": True, "frames": {k: _public_url_for_video(n) for k, n in names.items()}}
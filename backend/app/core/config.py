@@ -6,6 +6,7 @@ class Settings(BaseSettings):
     DB_PATH: str = "app/app.db"
     PUBLIC_BASE_URL: str = "http://127.0.0.1:8000"
     TOKEN_TTL_SECONDS: int = 60 * 60 * 24 * 14  # 14 days
+    USER_CACHE_TTL_SECONDS: int = 5  # кэш профиля (auth_service.get_user_cached); 0 — без кэша
 
     # Gemini / Engine
     GEMINI_API_KEY: str = ""
@@ -13,4 +14,25 @@ class Settings(BaseSettings):
     GEMINI_VISION_MODEL: str = "gemini-2.5-flash"
     ENGINE_DEBUG: bool = False
 
+    # SQLite (db/sqlite): пул соединений + WAL
+    DB_POOL_SIZE: int = 16           # сколько простаивающих соединений держать (0 — без пула)
+    DB_WAL: bool = True
+    DB_BUSY_TIMEOUT_MS: int = 5000
+    DB_CACHE_SIZE_KB: int = 20000    # PRAGMA cache_size на соединение
+    DB_MMAP_SIZE_MB: int = 256
+
+    # Кэш классификации вещей (garment_labels)
+    LABEL_CACHE_TTL_DAYS: int = 30
+    LABEL_CACHE_MAX_ROWS: int = 20000
+
+    # Фоновые задачи (services/job_scheduler)
+    JOB_WORKERS: int = 8             # глобально одновременно выполняемых задач
+    JOB_QUEUE_MAX: int = 64          # длина очереди, дальше — 503
+    JOB_PER_USER_MAX: int = 3        # задач пользователя в очереди+работе, дальше — 429
+    JOB_RETRY_AFTER_SECONDS: int = 15
+    JOB_DRAIN_SECONDS: int = 30      # сколько ждать текущие задачи при остановке
+    JOB_LEASE_SECONDS: int = 60      # lease задачи (продлевается heartbeat); > JOB_DRAIN_SECONDS
+    JOB_QUEUE_POLL_SECONDS: int = 5  # heartbeat / подбор очереди / восстановление протухших задач
+    JOB_MAX_ATTEMPTS: int = 2        # сколько раз задачу можно запустить после сбоя воркера
+
 settings = Settings()
@@ -0,0 +1,111 @@
+"""
+Benchmark: requests/sec of the job-poll endpoints with and without the connection pool + WAL.
+
+Опрашиваются GET /api/lookbook/jobs/{id}, /api/scene/jobs/{id}, /api/video/jobs/{id}
+(то, что фронт дёргает каждые пару секунд), параллельно фоновый поток пишет прогресс
+задач — как воркеры во время генерации. Режимы:
+  before — новое соединение на каждый db(), rollback journal (как было раньше);
+  after  — пул соединений, WAL и прагмы из настроек.
+
+  python -m app.db.bench --requests 2000 --concurrency 8
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from fastapi.testclient import TestClient
+
+from app.core.config import settings
+from app.core.tokens import sign_token
+from app.db.sqlite import close_pool, db, init_db, pool_stats
+
+
+def _seed(uid: str) -> dict:
+    now = datetime.now(timezone.utc).isoformat()
+    ids = {"lookbook": f"lb_{uuid.uuid4().hex[:12]}", "scene": f"sc_{uuid.uuid4().hex[:12]}", "video": f"vid_{uuid.uuid4().hex[:12]}"}
+    with db() as con:
+        con.execute(
+            "INSERT INTO users(id,email,name,pwd_hash,pwd_salt,created_at) VALUES(?,?,?,?,?,?)",
+            (uid, f"{uid}@bench.local", "bench", "x", "00", now),
+        )
+        con.execute("INSERT INTO balances(user_id,balance,updated_at) VALUES(?,?,?)", (uid, 100, now))
+        con.execute(
+            "INSERT INTO lookbook_jobs(job_id,user_id,mode,state,progress,spent,created_at,updated_at) VALUES(?,?,?,?,?,?,?,?)",
+            (ids["lookbook"], uid, "FULL", "running", 0, 0, now, now),
+        )
+        con.execute(
+            "INSERT INTO scene_jobs(job_id,user_id,kind,action,state,progress,created_at,updated_at) VALUES(?,?,?,?,?,?,?,?)",
+            (ids["scene"], uid, "model", "generate", "running", 0, now, now),
+        )
+        con.execute(
+            "INSERT INTO video_jobs(job_id,user_id,action,state,progress,spent,created_at,updated_at) VALUES(?,?,?,?,?,?,?,?)",
+            (ids["video"], uid, "generate", "running", 0, 0, now, now),
+        )
+    return ids
+
+
+def _writer(ids: dict, stop: threading.Event, counter: list):
+    """Simulates job workers persisting progress while the UI polls."""
+    tables = (("lookbook_jobs", ids["lookbook"]), ("scene_jobs", ids["scene"]), ("video_jobs", ids["video"]))
+    i = 0
+    while not stop.is_set():
+        table, job_id = tables[i % 3]
+        with db() as con:
+            con.execute(f"UPDATE {table} SET progress=?, updated_at=? WHERE job_id=?", (i % 100, datetime.now(timezone.utc).isoformat(), job_id))
+        counter[0] += 1
+        i += 1
+        time.sleep(0.002)
+
+
+def run_mode(name: str, pooled: bool, total: int, concurrency: int) -> float:
+    from app.main import app
+
+    close_pool()
+    settings.DB_PATH = os.path.join(tempfile.mkdtemp(prefix=f"bench_{name}_"), "bench.db")
+    settings.DB_POOL_SIZE = 16 if pooled else 0
+    settings.DB_WAL = pooled
+    init_db()
+    uid = "u_bench_" + uuid.uuid4().hex[:8]
+    ids = _seed(uid)
+    urls = [f"/api/lookbook/jobs/{ids['lookbook']}", f"/api/scene/jobs/{ids['scene']}", f"/api/video/jobs/{ids['video']}"]
+
+    client = TestClient(app)  # без lifespan: планировщик и очередь задач не нужны
+    client.cookies.set("ps_token", sign_token(uid))
+    errors = [0]
+    writes = [0]
+    stop = threading.Event()
+    writer = threading.Thread(target=_writer, args=(ids, stop, writes), daemon=True)
+
+    def _one(i: int):
+        r = client.get(urls[i % len(urls)])
+        if r.status_code != 200:
+            errors[0] += 1
+
+    for i in range(30):  # warm-up
+        _one(i)
+    writer.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        list(pool.map(_one, range(total)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    writer.join()
+    rps = total / max(elapsed, 1e-9)
+    print(f"{name:6s} pooled={pooled!s:5s} wal={pooled!s:5s} requests={total} concurrency={concurrency} "
+          f"errors={errors[0]} writes={writes[0]} elapsed={elapsed:.2f}s rps={rps:.1f} pool={pool_stats()}")
+    return rps
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Job-poll endpoints benchmark: per-call connections vs pool + WAL")
+    ap.add_argument("--requests", type=int, default=2000)
+    ap.add_argument("--concurrency", type=int, default=8)
+    a = ap.parse_args()
+    before = run_mode("before", False, a.requests, a.concurrency)
+    after = run_mode("after", True, a.requests, a.concurrency)
+    print(f"speedup: x{after / max(before, 1e-9):.2f}")
@@ -1,7 +1,9 @@
 import os
 import sqlite3
+import threading
 from contextlib import contextmanager
 from datetime import datetime
+from typing import Dict, List
 from app.core.config import settings
 
 def _ensure_dir(path: str):
@@ -12,21 +14,103 @@ def _ensure_dir(path: str):
 def get_db_path() -> str:
     return settings.DB_PATH
 
+def _apply_pragmas(con: sqlite3.Connection):
+    # WAL: читатели не блокируют писателя (опросы задач не мешают воркерам писать прогресс).
+    # synchronous=NORMAL в WAL безопасен для целостности (теряется только последняя транзакция при сбое ОС).
+    if settings.DB_WAL:
+        con.execute("PRAGMA journal_mode=WAL")
+        con.execute("PRAGMA synchronous=NORMAL")
+    con.execute(f"PRAGMA busy_timeout={int(settings.DB_BUSY_TIMEOUT_MS)}")
+    con.execute(f"PRAGMA cache_size=-{int(settings.DB_CACHE_SIZE_KB)}")
+    con.execute(f"PRAGMA mmap_size={int(settings.DB_MMAP_SIZE_MB) * 1024 * 1024}")
+    con.execute("PRAGMA temp_store=MEMORY")
+
 def connect():
     path = get_db_path()
     _ensure_dir(path)
-    con = sqlite3.connect(path, check_same_thread=False)
+    con = sqlite3.connect(
+        path,
+        check_same_thread=False,
+        timeout=max(1.0, settings.DB_BUSY_TIMEOUT_MS / 1000),
+        cached_statements=256,  # подготовленные выражения переиспользуются, пока соединение живёт в пуле
+    )
     con.row_factory = sqlite3.Row
+    _apply_pragmas(con)
     return con
 
+class _ConnectionPool:
+    """LIFO pool of idle connections per DB path. Каждый вход в db() получает своё соединение,
+    поэтому вложенные db() и BEGIN IMMEDIATE ведут себя как раньше (отдельные соединения)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._idle: Dict[str, List[sqlite3.Connection]] = {}
+        self.opened = 0
+        self.reused = 0
+
+    def acquire(self) -> sqlite3.Connection:
+        path = get_db_path()
+        with self._lock:
+            idle = self._idle.get(path)
+            if idle:
+                self.reused += 1
+                return idle.pop()
+            self.opened += 1
+        return connect()
+
+    def release(self, con: sqlite3.Connection, path: str):
+        with self._lock:
+            idle = self._idle.setdefault(path, [])
+            if path == get_db_path() and len(idle) < max(0, int(settings.DB_POOL_SIZE)):
+                idle.append(con)
+                return
+        con.close()
+
+    def close_all(self):
+        with self._lock:
+            conns = [c for idle in self._idle.values() for c in idle]
+            self._idle = {}
+        for c in conns:
+            try:
+                c.close()
+            except Exception:
+                pass
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"idle": sum(len(v) for v in self._idle.values()), "opened": self.opened, "reused": self.reused}
+
+_POOL = _ConnectionPool()
+
+def pool_stats() -> Dict[str, int]:
+    return _POOL.stats()
+
+def close_pool():
+    _POOL.close_all()
+
 @contextmanager
 def db():
-    con = connect()
+    path = get_db_path()
+    con = _POOL.acquire()
     try:
         yield con
         con.commit()
-    finally:
-        con.close()
+    except BaseException:
+        # соединение вернётся в пул — незавершённая транзакция не должна на нём остаться
+        try:
+            con.rollback()
+        except Exception:
+            con.close()
+        else:
+            _POOL.release(con, path)
+        raise
+    else:
+        _POOL.release(con, path)
+
+def _ensure_column(con, table: str, column: str, decl: str):
+    cols = {r["name"] for r in con.execute(f"PRAGMA table_info({table})").fetchall()}
+    if column not in cols:
+        con.execute(f"ALTER TABLE {table} ADD COLUMN {column} {decl}")
 
 def init_db():
     with db() as con:
@@ -49,6 +133,18 @@ def init_db():
         )""")
         con.execute("""CREATE INDEX IF NOT EXISTS idx_ledger_user_time
             ON ledger(user_id, created_at DESC)""")
+        # Materialized SUM(ledger.delta) per user (services/balances) — O(1) balance reads
+        con.execute("""CREATE TABLE IF NOT EXISTS balances(
+            user_id TEXT PRIMARY KEY,
+            balance INTEGER NOT NULL,
+            updated_at TEXT NOT NULL,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )""")
+        # backfill for users created before the table existed
+        con.execute("""INSERT INTO balances(user_id, balance, updated_at)
+            SELECT u.id, COALESCE((SELECT SUM(l.delta) FROM ledger l WHERE l.user_id = u.id), 0), ?
+            FROM users u WHERE u.id NOT IN (SELECT user_id FROM balances)""",
+            (datetime.utcnow().isoformat() + "Z",))
         con.execute("""CREATE TABLE IF NOT EXISTS scenes(
             user_id TEXT PRIMARY KEY,
             data TEXT NOT NULL,
@@ -66,6 +162,46 @@ def init_db():
         )""")
         con.execute("""CREATE INDEX IF NOT EXISTS idx_lookbook_user_time
             ON lookbook_sessions(user_id, updated_at DESC)""")
+        # Normalized lookbook session (services/lookbook_sessions): header above + cards/results/run rows.
+        # data остаётся legacy-колонкой: старые JSON-сессии разбираются в строки ниже (normalized=1).
+        _ensure_column(con, "lookbook_sessions", "format", "TEXT")
+        _ensure_column(con, "lookbook_sessions", "normalized", "INTEGER NOT NULL DEFAULT 0")
+        con.execute("""CREATE TABLE IF NOT EXISTS lookbook_cards(
+            user_id TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            slot INTEGER NOT NULL,
+            data TEXT NOT NULL,      -- JSON одной карточки
+            updated_at TEXT NOT NULL,
+            PRIMARY KEY(user_id, mode, slot),
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )""")
+        con.execute("""CREATE TABLE IF NOT EXISTS lookbook_results(
+            user_id TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            idx INTEGER NOT NULL,
+            url TEXT,
+            slot_index INTEGER,
+            data TEXT NOT NULL,      -- элемент results как есть (строка url или объект)
+            PRIMARY KEY(user_id, mode, idx),
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )""")
+        con.execute("""CREATE TABLE IF NOT EXISTS lookbook_runs(
+            user_id TEXT NOT NULL,
+            mode TEXT NOT NULL,
+            running INTEGER NOT NULL DEFAULT 0,
+            job_id TEXT,
+            started_at TEXT,
+            finished_at TEXT,
+            PRIMARY KEY(user_id, mode),
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )""")
+        # optimistic concurrency для PATCH сессии/карточки (409 при устаревшем version)
+        _ensure_column(con, "lookbook_sessions", "version", "INTEGER NOT NULL DEFAULT 1")
+        _ensure_column(con, "lookbook_cards", "version", "INTEGER NOT NULL DEFAULT 1")
+        # порядок карточек как их прислал клиент (NULL у старых строк -> по slot)
+        _ensure_column(con, "lookbook_cards", "pos", "INTEGER")
+        from app.services.lookbook_sessions import migrate_legacy_sessions
+        migrate_legacy_sessions(con)
 
         # Lookbook long-running jobs (so UI can resume after navigation / refresh)
         con.execute("""CREATE TABLE IF NOT EXISTS lookbook_jobs(
@@ -118,3 +254,30 @@ def init_db():
         )""")
         con.execute("""CREATE INDEX IF NOT EXISTS idx_video_jobs_user_time
             ON video_jobs(user_id, updated_at DESC)""")
+
+        # Garment classification cache: sha256(image bytes) + vision model -> label
+        con.execute("""CREATE TABLE IF NOT EXISTS garment_labels(
+            content_hash TEXT NOT NULL,
+            model TEXT NOT NULL,
+            label TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            last_used_at TEXT NOT NULL,
+            PRIMARY KEY(content_hash, model)
+        )""")
+        con.execute("""CREATE INDEX IF NOT EXISTS idx_garment_labels_used
+            ON garment_labels(last_used_at)""")
+
+        # Durable job queue (services/job_queue): handler + payload to re-run a job,
+        # lease/heartbeat so a crashed worker's jobs are re-queued or failed with REFUND.
+        for table in ("lookbook_jobs", "scene_jobs", "video_jobs"):
+            _ensure_column(con, table, "handler", "TEXT")
+            _ensure_column(con, table, "payload_json", "TEXT")
+            _ensure_column(con, table, "attempts", "INTEGER NOT NULL DEFAULT 0")
+            _ensure_column(con, table, "lease_owner", "TEXT")
+            _ensure_column(con, table, "lease_until", "REAL")
+            _ensure_column(con, table, "heartbeat_at", "REAL")
+            con.execute(f"""CREATE INDEX IF NOT EXISTS idx_{table}_state_lease
+                ON {table}(state, lease_until)""")
+            # batch status (/api/jobs/status): активные задачи пользователя одним запросом
+            con.execute(f"""CREATE INDEX IF NOT EXISTS idx_{table}_user_state
+                ON {table}(user_id, state)""")
@@ -0,0 +1,166 @@
+"""
+Disk cache of normalized (mezzanine) clips for merges.
+
+Один и тот же сгенерированный клип склеивают много раз в разных сочетаниях — перекодировать
+его каждый раз незачем. Клип нормализуется один раз, результат лежит в кэше под ключом
+sha256(содержимое исходника) + параметры нормализации; дальше склейка — только concat copy.
+
+  - попадание обновляет mtime файла (LRU);
+  - после записи нового файла кэш ужимается до MEZZANINE_CACHE_MAX_MB, удаляя самые
+    давно использованные файлы (но не тронутые последние MEZZANINE_CACHE_GRACE_SECONDS —
+    их может прямо сейчас читать параллельная склейка);
+  - один ключ строит только один поток, остальные ждут его результат (lock на ключ живёт,
+    пока его кто-то держит или ждёт, — словарь не растёт с числом когда-либо виданных ключей).
+
+Env:
+  MEZZANINE_CACHE_DIR            — каталог кэша (default backend/app/cache/mezzanine)
+  MEZZANINE_CACHE_MAX_MB         — предел суммарного размера (default 2048)
+  MEZZANINE_CACHE_GRACE_SECONDS  — недавно использованные файлы не вытесняются (default 600)
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+_DEFAULT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "cache", "mezzanine"))
+CACHE_DIR = os.path.abspath(os.getenv("MEZZANINE_CACHE_DIR") or _DEFAULT_DIR)
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(0, int((os.getenv(name) or "").strip() or default))
+    except Exception:
+        return default
+
+
+MAX_BYTES = _env_int("MEZZANINE_CACHE_MAX_MB", 2048) * 1024 * 1024
+GRACE_SECONDS = _env_int("MEZZANINE_CACHE_GRACE_SECONDS", 600)
+
+_key_locks: Dict[str, List] = {}  # key -> [Lock, число держащих/ждущих]
+_key_locks_guard = threading.Lock()
+_evict_lock = threading.Lock()
+
+_hash_cache: "OrderedDict[Tuple[str, int, int], str]" = OrderedDict()
+_hash_lock = threading.Lock()
+HASH_CACHE_MAX = 2048
+
+
+def file_sha256(path: str) -> str:
+    """Content hash of a source clip; memoized per (path, size, mtime)."""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _hash_lock:
+        h = _hash_cache.get(key)
+        if h is not None:
+            _hash_cache.move_to_end(key)
+            return h
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    h = hasher.hexdigest()
+    with _hash_lock:
+        _hash_cache[key] = h
+        while len(_hash_cache) > HASH_CACHE_MAX:
+            _hash_cache.popitem(last=False)
+    return h
+
+
+def cache_key(source_path: str, params: str) -> str:
+    return hashlib.sha256(f"{file_sha256(source_path)}|{params}".encode("utf-8")).hexdigest()[:40]
+
+
+@contextmanager
+def _key_locked(key: str) -> Iterator[None]:
+    with _key_locks_guard:
+        entry = _key_locks.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _key_locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                _key_locks.pop(key, None)
+
+
+def get_or_create(source_path: str, params: str, build: Callable[[str], None]) -> Tuple[str, bool]:
+    """
+    Path of the cached normalized clip for (source content, params); build(tmp_path) creates it on a miss.
+    Returns (path, hit).
+    """
+    key = cache_key(source_path, params)
+    path = os.path.join(CACHE_DIR, f"{key}.mp4")
+    with _key_locked(key):
+        if os.path.isfile(path):
+            os.utime(path)  # LRU: отмечаем использование
+            return path, True
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        tmp = os.path.join(CACHE_DIR, f".{key}.{uuid.uuid4().hex[:8]}.part.mp4")
+        try:
+            build(tmp)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+    evict()
+    return path, False
+
+
+def evict() -> int:
+    """Trim the cache to MAX_BYTES, least recently used first. Returns bytes freed."""
+    with _evict_lock:
+        try:
+            names = [n for n in os.listdir(CACHE_DIR) if n.endswith(".mp4") and not n.startswith(".")]
+        except FileNotFoundError:
+            return 0
+        entries = []
+        total = 0
+        for n in names:
+            p = os.path.join(CACHE_DIR, n)
+            try:
+                st = os.stat(p)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, p))
+            total += st.st_size
+        if total <= MAX_BYTES:
+            return 0
+        freed = 0
+        cutoff = time.time() - GRACE_SECONDS
+        for mtime, size, p in sorted(entries):
+            if total - freed <= MAX_BYTES:
+                break
+            if mtime > cutoff:
+                break  # остальные ещё свежее — могут использоваться прямо сейчас
+            try:
+                os.remove(p)
+                freed += size
+            except FileNotFoundError:
+                continue
+        if freed:
+            logger.info("mezzanine cache evicted bytes=%s total=%s max=%s", freed, total - freed, MAX_BYTES)
+        return freed
+
+
+def stats() -> Dict[str, int]:
+    files = 0
+    size = 0
+    try:
+        for n in os.listdir(CACHE_DIR):
+            if n.endswith(".mp4") and not n.startswith("."):
+                files += 1
+                size += os.path.getsize(os.path.join(CACHE_DIR, n))
+    except FileNotFoundError:
+        pass
+    return {"files": files, "bytes": size, "maxBytes": MAX_BYTES}
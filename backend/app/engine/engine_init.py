@@ -6,6 +6,14 @@ class EngineConfig:
     api_key: str
     image_model: str = "gemini-2.5-flash-image"
     vision_model: str = "gemini-2.5-flash"  # для классификации/понимания
+    shot_concurrency: int = 4          # сколько кадров одной фотосессии идут параллельно
+    global_shot_concurrency: int = 8   # общий лимит кадров в процессе (на все фотосессии)
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int((os.getenv(name) or "").strip() or default))
+    except Exception:
+        return default
 
 def load_engine_config() -> EngineConfig:
     def _norm_env(v: str) -> str:
@@ -21,4 +29,10 @@ def load_engine_config() -> EngineConfig:
         raise RuntimeError("GEMINI_API_KEY is not set")
     image_model = _norm_env(os.getenv("GEMINI_IMAGE_MODEL") or "gemini-2.5-flash-image")
     vision_model = _norm_env(os.getenv("GEMINI_VISION_MODEL") or "gemini-2.5-flash")
-    return EngineConfig(api_key=api_key, image_model=image_model, vision_model=vision_model)
+    return EngineConfig(
+        api_key=api_key,
+        image_model=image_model,
+        vision_model=vision_model,
+        shot_concurrency=_env_int("LOOKBOOK_SHOT_CONCURRENCY", 4),
+        global_shot_concurrency=_env_int("LOOKBOOK_GLOBAL_SHOT_CONCURRENCY", 8),
+    )
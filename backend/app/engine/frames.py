@@ -0,0 +1,124 @@
+"""
+Frame extraction for generated/merged videos (last frame for continuation, first frame, poster).
+
+  - метки времени берутся из метаданных (probe_clip: длительность + fps, с кэшем); «последний»
+    кадр считается от длительности видеопотока — контейнер (аудио длиннее видео) может быть
+    длиннее, и seek за последний кадр не даёт ни одного изображения;
+  - `-ss` стоит перед `-i`: ffmpeg прыгает к ближайшему keyframe и докодирует только
+    несколько кадров, а не весь ролик;
+  - несколько кадров (first/last/poster) — один запуск ffmpeg: по входу на каждую метку;
+  - имя файла = sha256 видео + вид кадра + размер + формат, поэтому повторный вызов для
+    того же ролика ничего не делает и не плодит дубликаты.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import subprocess
+import uuid
+from fractions import Fraction
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .clip_cache import file_sha256
+from .transcode import ffmpeg_bin
+from .video_merge import probe_clip
+
+logger = logging.getLogger(__name__)
+
+FRAME_KINDS = ("first", "last", "poster")
+FRAME_FORMATS = {"png": [], "jpg": ["-q:v", "3"], "webp": ["-quality", "85"]}
+POSTER_POSITION = 0.4  # доля длительности — обычно уже «в движении», но до финальной позы
+FRAME_TIMEOUT_SECONDS = 60
+
+
+def _frame_seek(kind: str, duration: Optional[float], fps: str, video_duration: Optional[float] = None) -> List[str]:
+    """Input-side seek options for one frame kind (duration — container, video_duration — video stream)."""
+    if kind == "first":
+        return ["-ss", "0"]
+    if kind == "poster":
+        d = video_duration or duration
+        return ["-ss", f"{d * POSTER_POSITION:.3f}"] if d else ["-ss", "0"]
+    if not video_duration:
+        # длительность видеопотока неизвестна — ищем от конца файла
+        return ["-sseof", "-0.1"]
+    try:
+        frame_dur = float(1 / Fraction(fps)) if fps else 1 / 30
+    except (ValueError, ZeroDivisionError):
+        frame_dur = 1 / 30
+    return ["-ss", f"{max(0.0, video_duration - frame_dur * 1.5):.3f}"]
+
+
+def extract_frames(
+    video_path: str,
+    out_dir: str,
+    kinds: Iterable[str] = ("last",),
+    fmt: str = "png",
+    width: Optional[int] = None,
+) -> Dict[str, str]:
+    """
+    Extract the requested frames into out_dir. Returns {kind: file name}.
+    Frames already extracted for the same video content/params are reused.
+    """
+    fmt = (fmt or "png").lower().replace("jpeg", "jpg")
+    if fmt not in FRAME_FORMATS:
+        raise ValueError(f"Unsupported frame format: {fmt}")
+    kinds = [k for k in dict.fromkeys(kinds) if k in FRAME_KINDS]
+    if not kinds:
+        raise ValueError(f"kinds must be a subset of {FRAME_KINDS}")
+    width = int(width) if width else None
+
+    digest = file_sha256(video_path)[:20]
+    size_tag = f"w{width}" if width else "full"
+    names = {k: f"frame_{digest}_{k}_{size_tag}.{fmt}" for k in kinds}
+    todo = [k for k in kinds if not os.path.isfile(os.path.join(out_dir, names[k]))]
+    if not todo:
+        return names
+
+    try:
+        info = probe_clip(video_path)
+        duration, fps, video_duration = info.duration, info.fps, info.video_duration
+    except Exception as exc:
+        logger.warning("frame extraction: probe failed for %s: %s", os.path.basename(video_path), exc)
+        duration, fps, video_duration = None, "", None
+
+    os.makedirs(out_dir, exist_ok=True)
+    cmd: List[str] = [ffmpeg_bin(), "-hide_banner", "-loglevel", "error", "-y"]
+    for k in todo:
+        cmd += [*_frame_seek(k, duration, fps, video_duration), "-i", video_path]
+    tmp: List[Tuple[str, str]] = []
+    vf = f"scale='min(iw,{width})':-2" if width else None
+    for idx, k in enumerate(todo):
+        tmp_path = os.path.join(out_dir, f".{uuid.uuid4().hex[:8]}.{names[k]}")
+        tmp.append((tmp_path, os.path.join(out_dir, names[k])))
+        # last: с точки чуть раньше конца пишем все оставшиеся кадры в один файл — остаётся именно последний
+        cmd += ["-map", f"{idx}:v:0", *(["-update", "1"] if k == "last" else ["-frames:v", "1"])]
+        if vf:
+            cmd += ["-vf", vf]
+        cmd += [*FRAME_FORMATS[fmt], "-f", "image2", tmp_path]
+
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True, timeout=FRAME_TIMEOUT_SECONDS)
+        if proc.returncode != 0:
+            raise RuntimeError(f"ffmpeg frame extraction failed: {proc.stderr[-300:]}")
+        for tmp_path, final in tmp:
+            if not os.path.isfile(tmp_path):
+                raise RuntimeError(f"ffmpeg produced no frame for {os.path.basename(final)}")
+            os.replace(tmp_path, final)
+    finally:
+        for tmp_path, _ in tmp:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+    return names
+
+
+def extract_last_frame(video_path: Path, out_dir: Path) -> Tuple[str, str]:
+    """(file name, warning) of the last frame as PNG; warning is set instead of raising."""
+    try:
+        names = extract_frames(str(video_path), str(out_dir), kinds=("last",), fmt="png")
+        return names["last"], ""
+    except Exception as exc:
+        if "ffmpeg not found" in str(exc):
+            return "", "last frame extraction skipped: ffmpeg is not installed"
+        logger.warning("last frame extraction failed for %s: %s", video_path.name, exc)
+        return "", "last frame extraction failed: ffmpeg failed to extract last frame"
@@ -9,7 +9,7 @@ class GeminiRestError(RuntimeError):
 
 def _get_json(url: str, headers: dict) -> dict:
     try:
-        r = requests.get(url, headers=headers, timeout=60)
+        r = get_http_session().get(url, headers=headers, timeout=60)
     except requests.RequestException as e:
         raise GeminiRestError(f"Gemini request failed: {e}") from e
     try:
@@ -27,6 +27,7 @@ def list_models(api_key: str) -> dict:
 
 import requests
 
+from .http_client import get_http_session
 
 GEMINI_BASE = "https://generativelanguage.googleapis.com/v1beta"
 
@@ -54,7 +55,7 @@ def post_generate_content(api_key: str, model: str, body: Dict[str, Any], timeou
     }
 
     try:
-        r = requests.post(
+        r = get_http_session().post(
             url,
             params={"key": api_key},  # keep as fallback; header is primary
             json=body,
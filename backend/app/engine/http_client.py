@@ -0,0 +1,139 @@
+"""
+Shared keep-alive HTTP client for all engine modules (Gemini, Veo, Kling/KIE, asset fetches).
+
+Один requests.Session на процесс: соединения к generativelanguage.googleapis.com и
+остальным провайдерам переиспользуются (TCP+TLS не поднимаются на каждый вызов).
+
+Env:
+  HTTP_POOL_CONNECTIONS  — сколько хостов держим в пуле (default 10)
+  HTTP_POOL_MAXSIZE      — макс. соединений на один хост (default 16)
+  HTTP_POOL_BLOCK        — 1: ждать свободное соединение вместо открытия лишнего (default 1)
+  HTTP_RETRIES           — транспортные ретраи (connect + 502/503/504 для GET) (default 2)
+  HTTP_RETRY_BACKOFF     — backoff factor для ретраев (default 0.5)
+
+Load-test (печатает долю переиспользованных соединений):
+  python -m app.engine.http_client --url https://example.com --requests 50 --concurrency 8
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import DefaultCookiePolicy
+from typing import Any, Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+_SESSION: Optional[requests.Session] = None
+_SESSION_LOCK = threading.Lock()
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(0, int((os.getenv(name) or "").strip() or default))
+    except Exception:
+        return default
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return max(0.0, float((os.getenv(name) or "").strip() or default))
+    except Exception:
+        return default
+
+
+def _build_session() -> requests.Session:
+    retries = _env_int("HTTP_RETRIES", 2)
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=0,  # не повторяем запросы, которые уже дошли до сервера (POST генерации платные)
+        status=retries,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET", "HEAD", "OPTIONS"}),
+        backoff_factor=_env_float("HTTP_RETRY_BACKOFF", 0.5),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=max(1, _env_int("HTTP_POOL_CONNECTIONS", 10)),
+        pool_maxsize=max(1, _env_int("HTTP_POOL_MAXSIZE", 16)),
+        pool_block=bool(_env_int("HTTP_POOL_BLOCK", 1)),
+        max_retries=retry,
+    )
+    s = requests.Session()
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    # Сессия общая для всех пользователей — куки провайдеров не храним.
+    s.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+    return s
+
+
+def get_http_session() -> requests.Session:
+    """Process-wide pooled session (thread-safe lazy init). Use instead of module-level requests.get/post."""
+    global _SESSION
+    if _SESSION is None:
+        with _SESSION_LOCK:
+            if _SESSION is None:
+                _SESSION = _build_session()
+    return _SESSION
+
+
+def pool_stats() -> List[Dict[str, Any]]:
+    """Per-host connection stats: requests served vs. connections opened (reuse = 1 - opened/requests)."""
+    s = _SESSION
+    if s is None:
+        return []
+    out: List[Dict[str, Any]] = []
+    seen = set()
+    for adapter in s.adapters.values():
+        if id(adapter) in seen:
+            continue
+        seen.add(id(adapter))
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            n_req = int(getattr(pool, "num_requests", 0) or 0)
+            n_conn = int(getattr(pool, "num_connections", 0) or 0)
+            out.append({
+                "host": f"{key.key_scheme}://{key.key_host}:{key.key_port}",
+                "requests": n_req,
+                "connections": n_conn,
+                "reuse_rate": round(1.0 - (n_conn / n_req), 4) if n_req else 0.0,
+            })
+    return out
+
+
+def _load_test(url: str, total: int, concurrency: int) -> None:
+    sess = get_http_session()
+    errors = [0]
+    lock = threading.Lock()
+
+    def _one(_):
+        try:
+            sess.get(url, timeout=30).close()
+        except requests.RequestException:
+            with lock:
+                errors[0] += 1
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        list(pool.map(_one, range(max(1, total))))
+    elapsed = time.time() - started
+    print(f"requests={total} concurrency={concurrency} errors={errors[0]} elapsed={elapsed:.2f}s rps={total / max(elapsed, 1e-6):.1f}")
+    for st in pool_stats():
+        print(f"{st['host']}: requests={st['requests']} connections={st['connections']} reuse_rate={st['reuse_rate']:.2%}")
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Pooled HTTP client load test (connection reuse report)")
+    ap.add_argument("--url", required=True)
+    ap.add_argument("--requests", type=int, default=50)
+    ap.add_argument("--concurrency", type=int, default=8)
+    a = ap.parse_args()
+    _load_test(a.url, a.requests, a.concurrency)
@@ -1,35 +1,22 @@
+import hashlib
 import json
+import logging
 import re
-from typing import Dict, Any, List, Tuple
+import threading
+from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Any, List, Tuple, Callable, Optional
 from .engine_init import EngineConfig
-from .media_io import resolve_image_source, bytes_to_b64
+from .media_io import resolve_image_source, bytes_to_b64, sniff_mime_from_bytes
 from .gemini_rest import post_generate_content, GeminiRestError
-def _read_prompt_text(path: str) -> str:
-    with open(path, "r", encoding="utf-8") as f:
-        return f.read().strip()
+from .prompt_registry import get_prompt_registry
+from app.services.label_cache import get_label as _cache_get_label, put_label as _cache_put_label
+
+logger = logging.getLogger(__name__)
 
 def build_prompt(prompts_dir: str, variant: str, shot_type: str, camera_angle: str, pose_style: str, fmt: str) -> str:
-    base = _read_prompt_text(f"{prompts_dir}/base.txt")
-    vmap = {
-        "TORSO": _read_prompt_text(f"{prompts_dir}/variant_torso.txt"),
-        "LEGS": _read_prompt_text(f"{prompts_dir}/variant_legs.txt"),
-        "FULL": _read_prompt_text(f"{prompts_dir}/variant_full.txt"),
-    }
-    smap = {
-        "ITEM": _read_prompt_text(f"{prompts_dir}/shot_item.txt"),
-        "DETAIL": _read_prompt_text(f"{prompts_dir}/shot_detail.txt"),
-        "LOGO": _read_prompt_text(f"{prompts_dir}/shot_logo.txt"),
-    }
-    parts = [
-        base,
-        vmap.get(variant, ""),
-        smap.get(shot_type, ""),
-        f"РАКУРС КАМЕРЫ: {camera_angle}",
-        f"СТИЛЬ ПОЗЫ: {pose_style}",
-        f"ФОРМАТ КАДРА: {fmt}",
-        "Сделай результат как реалистичную фотографию высокого качества. Без текста на изображении.",
-    ]
-    return "\n\n".join([p for p in parts if p])
+    # шаблоны загружены один раз (hot-reload по mtime), сборка кэшируется — см. prompt_registry
+    return get_prompt_registry(prompts_dir).build(variant, shot_type, camera_angle, pose_style, fmt)
 
 def extract_first_image_b64(resp: Dict[str, Any]) -> Tuple[str, str]:
     # returns (mime, b64)
@@ -48,6 +35,27 @@ def extract_first_image_b64(resp: Dict[str, Any]) -> Tuple[str, str]:
     return "image/png", ""
 
 def classify_garment(cfg: EngineConfig, image_bytes: bytes, mime: str) -> str:
+    # Тот же реф (по содержимому) + та же vision-модель -> берём метку из кэша
+    content_hash = hashlib.sha256(image_bytes).hexdigest()
+    try:
+        cached = _cache_get_label(content_hash, cfg.vision_model)
+    except Exception:
+        logger.debug("garment label cache read failed", exc_info=True)
+        cached = None
+    if cached:
+        return cached
+
+    label = _classify_garment_remote(cfg, image_bytes, mime)
+    if label is None or label == "unknown":
+        # ошибка API / пустой или заблокированный ответ — не кэшируем, следующий запрос спросит заново
+        return "unknown"
+    try:
+        _cache_put_label(content_hash, cfg.vision_model, label)
+    except Exception:
+        logger.debug("garment label cache write failed", exc_info=True)
+    return label
+
+def _classify_garment_remote(cfg: EngineConfig, image_bytes: bytes, mime: str) -> str | None:
     # Очень краткая классификация: upper/lower/outfit/unknown
     prompt = (
         "Classify the main garment in the image into one of: upper, lower, outfit, unknown. "
@@ -63,7 +71,7 @@ def classify_garment(cfg: EngineConfig, image_bytes: bytes, mime: str) -> str:
     }
     resp = post_generate_content(cfg.api_key, cfg.vision_model, body, timeout=60)
     if resp.get("__http_error__"):
-        return "unknown"
+        return None
     text = ""
     try:
         cand = (resp.get("candidates") or [])[0]
@@ -88,14 +96,62 @@ def validate_variant_against_label(variant: str, label: str) -> Dict[str, Any] |
         return {"code":"LOOKBOOK_INVALID_GARMENT","message":"В режиме ПОЛНЫЙ РОСТ нужен комплект или комбинезон.","hint":"Загрузи фото комплекта (верх+низ) или цельного комбинезона."}
     return None
 
-def generate_shot(cfg: EngineConfig, prompts_dir: str, variant: str, scene_model: Dict[str, Any], scene_location: Dict[str, Any], shot: Dict[str, Any], debug: bool=False) -> Dict[str, Any]:
-    # resolve images
-    model_b, model_mime = resolve_image_source(scene_model)
-    loc_b, loc_mime = resolve_image_source(scene_location)
+@dataclass(frozen=True)
+class PreparedScene:
+    """Model/location images of one photoshoot, already fetched and base64-encoded (inlineData parts)."""
+    model_part: Dict[str, Any]
+    location_part: Dict[str, Any]
+
+
+def _prepare_inline_part(obj: Dict[str, Any], what: str) -> Dict[str, Any]:
+    b, mime = resolve_image_source(obj)
+    if not b:
+        raise ValueError(f"Scene {what} image is empty")
+    mime = (mime or "").split(";")[0].strip().lower()
+    if not mime.startswith("image/"):
+        mime = sniff_mime_from_bytes(b)
+    if not mime.startswith("image/"):
+        raise ValueError(f"Scene {what} is not an image")
+    return {"inlineData": {"mimeType": mime, "data": bytes_to_b64(b)}}
+
+
+def prepare_scene(scene: Dict[str, Any]) -> PreparedScene:
+    """Resolve scene model/location once per photoshoot; every shot reuses the same inline parts."""
+    return PreparedScene(
+        model_part=_prepare_inline_part(scene["model"], "model"),
+        location_part=_prepare_inline_part(scene["location"], "location"),
+    )
+
+
+def preflight_shots(cfg: EngineConfig, variant: str, shots: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Pre-flight для всей фотосессии: все рефы классифицируются параллельно и
+    проверяются против variant ДО списания кредитов и генерации картинок.
+    ok -> {"ok": True, "labels": [label per shot]}; иначе ошибка первого неподходящего кадра.
+    """
+    def _classify(shot: Dict[str, Any]) -> str:
+        ref_b, ref_mime = resolve_image_source(shot["refImage"])
+        return classify_garment(cfg, ref_b, ref_mime)
+
+    labels: List[str] = []
+    if shots:
+        workers = max(1, min(int(cfg.shot_concurrency or 1), len(shots)))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lookbook-classify") as pool:
+            labels = list(pool.map(_classify, shots))
+    for shot, label in zip(shots, labels):
+        ve = validate_variant_against_label(variant, label)
+        if ve:
+            return {"ok": False, **ve, "shotId": shot.get("id")}
+    return {"ok": True, "labels": labels}
+
+
+def generate_shot(cfg: EngineConfig, prompts_dir: str, variant: str, scene: PreparedScene, shot: Dict[str, Any], debug: bool=False, label: str | None = None) -> Dict[str, Any]:
+    # resolve images (model/location уже подготовлены в prepare_scene)
     ref_b, ref_mime = resolve_image_source(shot["refImage"])
 
-    # classify and enforce strict rules
-    label = classify_garment(cfg, ref_b, ref_mime)
+    # classify (если метка не пришла из preflight_shots) and enforce strict rules
+    if label is None:
+        label = classify_garment(cfg, ref_b, ref_mime)
     ve = validate_variant_against_label(variant, label)
     if ve:
         return {"ok": False, **ve, "shotId": shot.get("id")}
@@ -106,8 +162,8 @@ def generate_shot(cfg: EngineConfig, prompts_dir: str, variant: str, scene_model
         "contents": [{
             "parts": [
                 {"text": prompt},
-                {"inlineData": {"mimeType": model_mime, "data": bytes_to_b64(model_b)}},
-                {"inlineData": {"mimeType": loc_mime, "data": bytes_to_b64(loc_b)}},
+                scene.model_part,
+                scene.location_part,
                 {"inlineData": {"mimeType": ref_mime, "data": bytes_to_b64(ref_b)}},
             ]
         }]
@@ -137,15 +193,98 @@ def generate_shot(cfg: EngineConfig, prompts_dir: str, variant: str, scene_model
         out["debug"] = {"prompt": prompt[:1200], "label": label}
     return out
 
-def photoshoot(cfg: EngineConfig, prompts_dir: str, variant: str, scene: Dict[str, Any], shots: List[Dict[str, Any]], debug: bool=False) -> Dict[str, Any]:
+# Общий (на процесс) лимит одновременных кадров — чтобы несколько фотосессий
+# разом не упирались в лимиты Gemini. Размер берётся из первого cfg.
+_GLOBAL_SHOT_SLOTS: threading.BoundedSemaphore | None = None
+_GLOBAL_SHOT_SLOTS_LOCK = threading.Lock()
+
+
+def _global_shot_slots(limit: int) -> threading.BoundedSemaphore:
+    global _GLOBAL_SHOT_SLOTS
+    with _GLOBAL_SHOT_SLOTS_LOCK:
+        if _GLOBAL_SHOT_SLOTS is None:
+            _GLOBAL_SHOT_SLOTS = threading.BoundedSemaphore(max(1, int(limit or 1)))
+        return _GLOBAL_SHOT_SLOTS
+
+
+def _run_shot(cfg: EngineConfig, prompts_dir: str, variant: str, scene: PreparedScene, shot: Dict[str, Any], label: str | None, cancel: threading.Event, debug: bool) -> Dict[str, Any] | None:
+    """Runs one shot under the global slot limit. Returns None if the job was cancelled before start."""
+    slots = _global_shot_slots(cfg.global_shot_concurrency)
+    while not slots.acquire(timeout=0.5):
+        if cancel.is_set():
+            return None
+    try:
+        if cancel.is_set():
+            return None
+        return generate_shot(cfg, prompts_dir, variant, scene, shot, debug=debug, label=label)
+    finally:
+        slots.release()
+
+
+def photoshoot(cfg: EngineConfig, prompts_dir: str, variant: str, scene: Dict[str, Any], shots: List[Dict[str, Any]], debug: bool=False, on_shot_done: Optional[Callable[[int, int], None]] = None, labels: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    Кадры идут параллельно (не больше cfg.shot_concurrency на фотосессию и
+    cfg.global_shot_concurrency на процесс). Порядок результатов = порядок shots.
+    on_shot_done(done, total) вызывается после каждого успешного кадра.
+    labels — результат preflight_shots; если не передан, preflight выполняется здесь.
+    """
+    total = len(shots)
+    if labels is None:
+        pre = preflight_shots(cfg, variant, shots)
+        if not pre.get("ok"):
+            return {"ok": False, **{k:pre.get(k) for k in ("code","message","hint")}, "shotId": pre.get("shotId"), "debug": None}
+        labels = pre["labels"]
+    prepared = prepare_scene(scene)
+    cancel = threading.Event()
+    done_by_index: Dict[int, Dict[str, Any]] = {}
+    failure: Dict[str, Any] | None = None
+    crash: BaseException | None = None
+
+    workers = max(1, min(int(cfg.shot_concurrency or 1), total or 1))
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lookbook-shot") as pool:
+        futures = {pool.submit(_run_shot, cfg, prompts_dir, variant, prepared, shot, labels[i], cancel, debug): i for i, shot in enumerate(shots)}
+        pending = set(futures)
+        while pending:
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                if fut.cancelled():
+                    continue
+                try:
+                    r = fut.result()
+                except Exception as e:
+                    r = None
+                    crash = crash or e
+                if r is not None and r.get("ok"):
+                    done_by_index[futures[fut]] = r
+                    if on_shot_done and not cancel.is_set():
+                        # только прогресс: его ошибка не должна бросать пул с незапущенными кадрами
+                        try:
+                            on_shot_done(len(done_by_index), total)
+                        except Exception:
+                            logger.exception("photoshoot progress callback failed")
+                    continue
+                if r is not None and failure is None:
+                    failure = r
+                if crash is not None or failure is not None:
+                    # fail-fast: не начинаем оставшиеся кадры
+                    cancel.set()
+                    for p in pending:
+                        p.cancel()
+
+    if crash is not None:
+        raise crash
+    if failure is not None:
+        # fail-fast: возвращаем понятную ошибку
+        r = failure
+        return {"ok": False, **{k:r.get(k) for k in ("code","message","hint")}, "shotId": r.get("shotId"), "debug": r.get("debug")}
+
     results = []
-    for shot in shots:
-        r = generate_shot(cfg, prompts_dir, variant, scene["model"], scene["location"], shot, debug=debug)
-        if not r.get("ok"):
-            # fail-fast: возвращаем понятную ошибку
-            return {"ok": False, **{k:r.get(k) for k in ("code","message","hint")}, "shotId": r.get("shotId"), "debug": r.get("debug")}
+    for i in sorted(done_by_index):
+        r = done_by_index[i]
         results.append({"id": r["id"], "image": f"data:{r['mime']};base64,{r['b64']}", "debug": r.get("debug")})
     return {"ok": True, "variant": variant, "results": results, "meta": {"modelLock": True, "sceneLock": True}}
+
+
 def _format_gemini_http_error(http_err: dict) -> tuple[str, str]:
     """Return (message, hint) based on gemini_rest __http_error__ structure."""
     try:
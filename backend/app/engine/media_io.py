@@ -1,7 +1,20 @@
 import base64
+import hashlib
+import logging
+import mimetypes
+import os
 import re
-from typing import Tuple, Optional
+import uuid
+from typing import Dict, Tuple, Optional
+from urllib.parse import urlparse
 import requests
+from app.core.config import settings
+from .http_client import get_http_session
+
+logger = logging.getLogger(__name__)
+
+# Наши собственные ассеты (PUBLIC_BASE_URL/static/assets/<hash>.<ext>) лежат здесь.
+ASSETS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "static", "assets"))
 
 _DATAURL_RE = re.compile(r"^data:(?P<mime>[-\w.+/]+);base64,(?P<data>.+)$", re.DOTALL)
 
@@ -24,8 +37,54 @@ def dataurl_to_bytes(data_url: str) -> Tuple[bytes, str]:
     data = m.group("data")
     return base64.b64decode(data), mime
 
+def local_asset_path(url: str, any_host: bool = False) -> Optional[str]:
+    """
+    Map our own /static/assets/<file> url (relative or on PUBLIC_BASE_URL's host) to an existing file on disk, else None.
+    any_host=True — хост не проверяется: url заведомо наш (сохранён в сессии), но мог быть
+    записан под другим доменом/портом того же сервера.
+    """
+    if not url or not isinstance(url, str):
+        return None
+    try:
+        u = urlparse(url.strip())
+        # абсолютный url — только если это наш хост (PUBLIC_BASE_URL), иначе чужой сервер
+        if (u.scheme or u.netloc) and not any_host:
+            own = urlparse(settings.PUBLIC_BASE_URL or "")
+            if u.scheme not in ("http", "https") or (u.hostname, u.port) != (own.hostname, own.port):
+                return None
+        path = (u.path or "").lstrip("/")
+    except Exception:
+        return None
+    if not path.startswith("static/assets/"):
+        return None
+    # prevent traversal: only plain file names directly inside ASSETS_DIR
+    fname = os.path.basename(path[len("static/assets/"):])
+    if not fname:
+        return None
+    full = os.path.normpath(os.path.join(ASSETS_DIR, fname))
+    if os.path.dirname(full) != ASSETS_DIR or not os.path.isfile(full):
+        return None
+    return full
+
+def read_local_asset(url: str) -> Optional[Tuple[bytes, str]]:
+    """Read our own asset straight from disk (no self-HTTP round trip). None if url is not a local asset."""
+    path = local_asset_path(url)
+    if not path:
+        return None
+    try:
+        with open(path, "rb") as f:
+            b = f.read()
+    except OSError:
+        return None
+    mime = mimetypes.guess_type(path)[0] or sniff_mime_from_bytes(b)
+    return b, mime
+
 def fetch_url_to_bytes(url: str, timeout: int = 25) -> Tuple[bytes, str]:
-    r = requests.get(url, timeout=timeout)
+    # свои /static/assets читаем с диска — иначе запрос к самому себе занимает воркер и может зависнуть
+    local = read_local_asset(url)
+    if local is not None:
+        return local
+    r = get_http_session().get(url, timeout=timeout)
     r.raise_for_status()
     b = r.content
     ct = (r.headers.get("content-type") or "").split(";")[0].strip().lower()
@@ -53,3 +112,84 @@ def resolve_image_source(obj: dict) -> Tuple[bytes, str]:
     if isinstance(s, str) and (s.startswith("http://") or s.startswith("https://")):
         return fetch_url_to_bytes(s)
     raise ValueError("Unsupported image source")
+
+# Обрывы, после которых имеет смысл докачать файл через Range
+_RESUMABLE_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+def stream_download_to_file(
+    url: str,
+    dest_path: str,
+    headers: Optional[Dict[str, str]] = None,
+    timeout: Tuple[float, float] = (15, 120),
+    chunk_size: int = 1024 * 1024,
+    max_resumes: int = 3,
+) -> Dict[str, object]:
+    """
+    Stream url into dest_path chunk by chunk (memory stays ~chunk_size regardless of file size).
+
+    Пишем во временный файл рядом с dest_path и атомарно переименовываем только после
+    проверки размера по Content-Length; sha256 считается на лету и возвращается для логов.
+    При обрыве соединения докачиваем через Range: bytes=<offset>- (до max_resumes раз);
+    если сервер Range не поддерживает (200 вместо 206) — качаем заново.
+    Returns {"path", "bytes", "sha256"}.
+    """
+    dest_dir = os.path.dirname(os.path.abspath(dest_path))
+    os.makedirs(dest_dir, exist_ok=True)
+    tmp_path = os.path.join(dest_dir, f".{os.path.basename(dest_path)}.{uuid.uuid4().hex[:8]}.part")
+    base_headers = dict(headers or {})
+    sess = get_http_session()
+
+    hasher = hashlib.sha256()
+    written = 0
+    total: Optional[int] = None
+    resumes = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            while True:
+                req_headers = dict(base_headers)
+                if written:
+                    req_headers["Range"] = f"bytes={written}-"
+                try:
+                    with sess.get(url, headers=req_headers, timeout=timeout, stream=True, allow_redirects=True) as r:
+                        if r.status_code >= 400:
+                            raise RuntimeError(f"Download error {r.status_code}: {r.text[:400]}")
+                        if written and r.status_code != 206:
+                            # Range не поддержан — начинаем с нуля
+                            f.seek(0)
+                            f.truncate()
+                            hasher = hashlib.sha256()
+                            written = 0
+                        if total is None:
+                            length = r.headers.get("content-length")
+                            if length and length.isdigit() and "content-encoding" not in r.headers:
+                                total = written + int(length)
+                        for chunk in r.iter_content(chunk_size=chunk_size):
+                            if not chunk:
+                                continue
+                            f.write(chunk)
+                            hasher.update(chunk)
+                            written += len(chunk)
+                    if total is not None and written < total:
+                        raise requests.exceptions.ChunkedEncodingError(f"Incomplete download: {written}/{total} bytes")
+                    break
+                except _RESUMABLE_ERRORS as exc:
+                    resumes += 1
+                    if resumes > max_resumes:
+                        raise
+                    logger.warning("download interrupted url=%s at %s bytes, resuming (%s/%s): %s", url[:120], written, resumes, max_resumes, exc)
+                    f.flush()
+            f.flush()
+            os.fsync(f.fileno())
+
+        if written == 0:
+            raise RuntimeError("Download error: empty body")
+        if total is not None and written != total:
+            raise RuntimeError(f"Download size mismatch: got {written} bytes, expected {total}")
+        os.replace(tmp_path, dest_path)
+        return {"path": dest_path, "bytes": written, "sha256": hasher.hexdigest()}
+    finally:
+        if os.path.exists(tmp_path):
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
@@ -0,0 +1,123 @@
+"""
+Prompt templates for lookbook build_prompt: loaded once, hot-reloaded by mtime, builds memoized.
+
+Раньше build_prompt читал все 7 файлов с диска на каждый кадр. Теперь:
+  - файлы читаются один раз (get_prompt_registry() вызывается на старте);
+  - если mtime любого файла изменился — шаблоны перечитываются, кэш сборок сбрасывается;
+  - готовые промпты кэшируются по (variant, shot_type, camera, pose, format).
+
+Каталог промптов определяется в одном месте (resolve_prompts_dir): переданный путь,
+если в нём есть base.txt, иначе engine/prompts, иначе legacy_engine/prompts.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+ENGINE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_PROMPTS_DIR = os.path.join(ENGINE_DIR, "prompts")
+LEGACY_PROMPTS_DIR = os.path.join(ENGINE_DIR, "legacy_engine", "prompts")
+
+PROMPT_FILES = {
+    "base": "base.txt",
+    "variant:TORSO": "variant_torso.txt",
+    "variant:LEGS": "variant_legs.txt",
+    "variant:FULL": "variant_full.txt",
+    "shot:ITEM": "shot_item.txt",
+    "shot:DETAIL": "shot_detail.txt",
+    "shot:LOGO": "shot_logo.txt",
+}
+
+# как часто (сек) проверять mtime файлов; stat семи файлов дешёвый, но не на каждый кадр
+RELOAD_CHECK_SECONDS = 1.0
+MAX_MEMO_ENTRIES = 1024
+
+
+def resolve_prompts_dir(prompts_dir: Optional[str] = None) -> str:
+    for d in (prompts_dir, DEFAULT_PROMPTS_DIR, LEGACY_PROMPTS_DIR):
+        if d and os.path.isfile(os.path.join(d, PROMPT_FILES["base"])):
+            return os.path.abspath(d)
+    raise FileNotFoundError(f"Lookbook prompts not found (tried {prompts_dir!r}, {DEFAULT_PROMPTS_DIR}, {LEGACY_PROMPTS_DIR})")
+
+
+class PromptRegistry:
+    def __init__(self, prompts_dir: str):
+        self.prompts_dir = prompts_dir
+        self._lock = threading.Lock()
+        self._texts: Dict[str, str] = {}
+        self._mtimes: Dict[str, float] = {}
+        self._memo: Dict[Tuple[str, str, str, str, str], str] = {}
+        self._checked_at = 0.0
+        self._reload()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.prompts_dir, PROMPT_FILES[key])
+
+    def _stat_all(self) -> Dict[str, float]:
+        out: Dict[str, float] = {}
+        for key in PROMPT_FILES:
+            try:
+                out[key] = os.stat(self._path(key)).st_mtime
+            except OSError:
+                out[key] = -1.0
+        return out
+
+    def _reload(self) -> None:
+        texts: Dict[str, str] = {}
+        mtimes = self._stat_all()
+        for key in PROMPT_FILES:
+            if mtimes[key] < 0:
+                texts[key] = ""
+                continue
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                texts[key] = f.read().strip()
+        self._texts = texts
+        self._mtimes = mtimes
+        self._memo = {}
+        self._checked_at = time.monotonic()
+
+    def _maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now - self._checked_at < RELOAD_CHECK_SECONDS:
+            return
+        self._checked_at = now
+        if self._stat_all() != self._mtimes:
+            self._reload()
+
+    def build(self, variant: str, shot_type: str, camera_angle: str, pose_style: str, fmt: str) -> str:
+        key = (variant, shot_type, camera_angle, pose_style, fmt)
+        with self._lock:
+            self._maybe_reload()
+            cached = self._memo.get(key)
+            if cached is not None:
+                return cached
+            parts = [
+                self._texts.get("base", ""),
+                self._texts.get(f"variant:{variant}", ""),
+                self._texts.get(f"shot:{shot_type}", ""),
+                f"РАКУРС КАМЕРЫ: {camera_angle}",
+                f"СТИЛЬ ПОЗЫ: {pose_style}",
+                f"ФОРМАТ КАДРА: {fmt}",
+                "Сделай результат как реалистичную фотографию высокого качества. Без текста на изображении.",
+            ]
+            prompt = "\n\n".join([p for p in parts if p])
+            if len(self._memo) >= MAX_MEMO_ENTRIES:
+                self._memo.clear()
+            self._memo[key] = prompt
+            return prompt
+
+
+_REGISTRIES: Dict[str, PromptRegistry] = {}
+_REGISTRIES_LOCK = threading.Lock()
+
+
+def get_prompt_registry(prompts_dir: Optional[str] = None) -> PromptRegistry:
+    d = resolve_prompts_dir(prompts_dir)
+    with _REGISTRIES_LOCK:
+        reg = _REGISTRIES.get(d)
+        if reg is None:
+            reg = PromptRegistry(d)
+            _REGISTRIES[d] = reg
+        return reg
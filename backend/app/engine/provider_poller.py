@@ -0,0 +1,221 @@
+"""
+One background poller for long-running provider tasks (Kling/KIE taskId, Veo operation name).
+
+Раньше каждый ролик держал свой поток с циклом `while ...: GET; time.sleep(4..12)`.
+Теперь задача регистрируется через track(): один поток-диспетчер держит все незавершённые
+задачи в куче по времени следующей проверки и отдаёт те, чей срок подошёл, в небольшой
+пул опроса (PROVIDER_POLL_WORKERS) — зависший провайдер занимает один воркер на
+POLL_HTTP_TIMEOUT, а не останавливает опрос остальных. Интервал адаптивный: сначала
+часто, затем экспоненциальный backoff до max_interval.
+
+Когда задача завершилась — её Future получает результат (или исключение). Продолжение
+(скачать ролик, кадр) вешается через then() и выполняется в пуле завершения, поэтому
+на время генерации у провайдера ни один поток не ждёт конкретную задачу.
+
+Env:
+  PROVIDER_POLL_BACKOFF        — множитель интервала после каждой «ещё не готово» проверки (default 1.5)
+  PROVIDER_POLL_MAX_ERRORS     — сколько подряд сетевых ошибок опроса терпим (default 3)
+  PROVIDER_POLL_WORKERS        — параллельных проверок статуса (default 4)
+  PROVIDER_FINISH_WORKERS      — параллельных продолжений then() (default 4)
+  PROVIDER_POLL_HTTP_TIMEOUT   — read timeout одного GET статуса, сек (default 15; connect 5)
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return max(0.0, float((os.getenv(name) or "").strip() or default))
+    except Exception:
+        return default
+
+
+# timeout для GET статуса внутри check(): короткий, т.к. повтор всё равно будет на следующем тике
+POLL_HTTP_TIMEOUT = (5.0, _env_float("PROVIDER_POLL_HTTP_TIMEOUT", 15.0) or 15.0)
+
+
+@dataclass
+class _PollTask:
+    name: str
+    check: Callable[[], Any]                  # None -> ещё не готово; иначе результат; исключение -> ошибка
+    deadline: float
+    interval: float
+    max_interval: float
+    on_timeout: Callable[[], BaseException]
+    future: Future = field(default_factory=Future)
+    polls: int = 0
+    errors: int = 0
+
+
+class ProviderPoller:
+    def __init__(self, backoff: float = 1.5, max_errors: int = 3, poll_workers: int = 4, finish_workers: int = 4):
+        self.backoff = max(1.0, float(backoff))
+        self.max_errors = max(1, int(max_errors))
+        # задача в пуле не лежит в куче, поэтому одна задача никогда не опрашивается параллельно сама с собой
+        self._poll_pool = ThreadPoolExecutor(max_workers=max(1, int(poll_workers)), thread_name_prefix="provider-poll")
+        self._finish_pool = ThreadPoolExecutor(max_workers=max(1, int(finish_workers)), thread_name_prefix="provider-finish")
+        self._in_flight = 0
+        self._heap: List[tuple] = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._polls_total = 0
+
+    def track(
+        self,
+        name: str,
+        check: Callable[[], Any],
+        *,
+        timeout: float,
+        initial_interval: float,
+        max_interval: float,
+        on_timeout: Optional[Callable[[], BaseException]] = None,
+    ) -> Future:
+        """Register a provider task; returns a Future resolved with check()'s first non-None result."""
+        now = time.monotonic()
+        task = _PollTask(
+            name=name,
+            check=check,
+            deadline=now + max(1.0, float(timeout)),
+            interval=max(0.5, float(initial_interval)),
+            max_interval=max(float(initial_interval), float(max_interval)),
+            on_timeout=on_timeout or (lambda: TimeoutError(f"provider task {name} polling timeout")),
+        )
+        with self._cond:
+            self._ensure_thread()
+            heapq.heappush(self._heap, (now + task.interval, next(self._seq), task))
+            self._cond.notify()
+        return task.future
+
+    def then(self, future: Future, fn: Callable[[Any], Any]) -> Future:
+        """Future of fn(future.result()), run on the finish pool once `future` resolves (no thread waits for it)."""
+        out: Future = Future()
+
+        def _run(src: Future):
+            if out.done():  # отменён вызывающим — продолжение не нужно
+                return
+            try:
+                value = fn(src.result())
+            except BaseException as exc:
+                self._resolve(out, exc=exc)
+                return
+            self._resolve(out, value)
+
+        future.add_done_callback(lambda src: self._finish_pool.submit(_run, src))
+        return out
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop, name="provider-poller", daemon=True)
+            self._thread.start()
+
+    def _take_due(self) -> List[_PollTask]:
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                if self._heap and self._heap[0][0] <= now:
+                    due = []
+                    while self._heap and self._heap[0][0] <= now:
+                        due.append(heapq.heappop(self._heap)[2])
+                    return due
+                wait = (self._heap[0][0] - now) if self._heap else None
+                self._cond.wait(wait)
+
+    def _reschedule(self, task: _PollTask):
+        task.interval = min(task.max_interval, task.interval * self.backoff)
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + task.interval, next(self._seq), task))
+
+    @staticmethod
+    def _resolve(fut: Future, result: Any = None, exc: Optional[BaseException] = None):
+        # владелец мог отменить Future, пока шла проверка — тогда set_* бросил бы InvalidStateError
+        if fut.done():
+            return
+        try:
+            if exc is not None:
+                fut.set_exception(exc)
+            else:
+                fut.set_result(result)
+        except InvalidStateError:
+            pass
+
+    def _poll_one(self, task: _PollTask):
+        if task.future.done():
+            return
+        if time.monotonic() >= task.deadline:
+            self._resolve(task.future, exc=task.on_timeout())
+            return
+        task.polls += 1
+        with self._cond:
+            self._polls_total += 1
+        try:
+            result = task.check()
+        except requests.RequestException as exc:
+            # сетевой сбой опроса — не повод ронять уже оплаченную задачу провайдера
+            task.errors += 1
+            if task.errors >= self.max_errors:
+                self._resolve(task.future, exc=exc)
+                return
+            logger.warning("provider poll error name=%s errors=%s: %s", task.name, task.errors, exc)
+            self._reschedule(task)
+            return
+        except BaseException as exc:
+            self._resolve(task.future, exc=exc)
+            return
+        task.errors = 0
+        if result is None:
+            self._reschedule(task)
+            return
+        self._resolve(task.future, result)
+
+    def _run_poll(self, task: _PollTask):
+        try:
+            self._poll_one(task)
+        except Exception as exc:  # never leave the owner's Future hanging
+            logger.exception("provider poller failed name=%s", task.name)
+            self._resolve(task.future, exc=exc)
+        finally:
+            with self._cond:
+                self._in_flight -= 1
+
+    def _loop(self):
+        while True:
+            due = self._take_due()
+            with self._cond:
+                self._in_flight += len(due)
+            for task in due:
+                self._poll_pool.submit(self._run_poll, task)
+
+    def stats(self) -> Dict[str, int]:
+        with self._cond:
+            return {"tracked": len(self._heap) + self._in_flight, "inFlight": self._in_flight, "polls": self._polls_total}
+
+
+_POLLER: Optional[ProviderPoller] = None
+_POLLER_LOCK = threading.Lock()
+
+
+def get_provider_poller() -> ProviderPoller:
+    global _POLLER
+    with _POLLER_LOCK:
+        if _POLLER is None:
+            _POLLER = ProviderPoller(
+                backoff=_env_float("PROVIDER_POLL_BACKOFF", 1.5),
+                max_errors=int(_env_float("PROVIDER_POLL_MAX_ERRORS", 3)),
+                poll_workers=int(_env_float("PROVIDER_POLL_WORKERS", 4)),
+                finish_workers=int(_env_float("PROVIDER_FINISH_WORKERS", 4)),
+            )
+        return _POLLER
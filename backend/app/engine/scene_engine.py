@@ -1,7 +1,7 @@
 import os
 from typing import Optional
 
-import requests
+from .http_client import get_http_session
 
 
 def _data_url_to_inline(data_url: str) -> dict:
@@ -85,7 +85,7 @@ def create_asset(kind: str, prompt: str, base_image: Optional[str], details: lis
             "https://generativelanguage.googleapis.com/v1beta/models/"
             f"{model_name}:generateContent?key={api_key}"
         )
-        resp = requests.post(url, json=payload, timeout=180)
+        resp = get_http_session().post(url, json=payload, timeout=180)
         resp.raise_for_status()
         data = resp.json()
 
@@ -0,0 +1,139 @@
+"""
+ffmpeg runner for merges/normalization: capped concurrency + progress from `-progress pipe:1`.
+
+Кодирование libx264 занимает все ядра, поэтому одновременно идёт не больше
+TRANSCODE_CONCURRENCY процессов ffmpeg (остальные ждут слот), а каждому процессу
+отдаётся cores / TRANSCODE_CONCURRENCY потоков. Прогресс считается по out_time из
+вывода `-progress` относительно ожидаемой длительности результата.
+
+  run_ffmpeg(args, ...) — синхронно; вызывается из воркеров задач, не из event loop
+
+Отдельного пула потоков и async-API здесь нет: слияние и кадры — задачи video.merge /
+video.frames, поэтому ffmpeg никогда не запускается в event loop, а роль «пула
+транскодирования» играют слоты _encode_slots (TRANSCODE_CONCURRENCY процессов по
+THREADS_PER_ENCODE потоков — в сумме ≈ число ядер).
+
+Env:
+  TRANSCODE_CONCURRENCY   — сколько ffmpeg одновременно (default: cores/2, минимум 1)
+  TRANSCODE_TIMEOUT_SECONDS — предел на один запуск (default 900)
+"""
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ProgressCallback = Callable[[float], None]  # 0.0 .. 1.0
+
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int((os.getenv(name) or "").strip() or default))
+    except Exception:
+        return default
+
+
+CPU_COUNT = os.cpu_count() or 2
+TRANSCODE_CONCURRENCY = _env_int("TRANSCODE_CONCURRENCY", max(1, CPU_COUNT // 2))
+TRANSCODE_TIMEOUT_SECONDS = _env_int("TRANSCODE_TIMEOUT_SECONDS", 900)
+THREADS_PER_ENCODE = max(1, CPU_COUNT // TRANSCODE_CONCURRENCY)
+
+_encode_slots = threading.BoundedSemaphore(TRANSCODE_CONCURRENCY)
+
+
+class FfmpegMissing(RuntimeError):
+    pass
+
+
+@dataclass
+class FfmpegResult:
+    returncode: int
+    stderr: str
+    elapsed: float
+
+    @property
+    def ok(self) -> bool:
+        return self.returncode == 0
+
+
+def ffmpeg_bin() -> str:
+    path = shutil.which("ffmpeg")
+    if not path:
+        raise FfmpegMissing("ffmpeg not found in PATH. Install ffmpeg and restart backend.")
+    return path
+
+
+def _build_cmd(args: List[str]) -> List[str]:
+    # -progress в stdout (key=value), статистику в stderr отключаем — там только ошибки
+    return [ffmpeg_bin(), "-hide_banner", "-nostats", "-loglevel", "error", "-progress", "pipe:1", "-threads", str(THREADS_PER_ENCODE), *args]
+
+
+class _ProgressParser:
+    def __init__(self, duration: Optional[float], on_progress: Optional[ProgressCallback]):
+        self.duration = duration if duration and duration > 0 else None
+        self.on_progress = on_progress
+        self._last = -1.0
+
+    def feed(self, line: str) -> None:
+        if not self.on_progress:
+            return
+        key, _, value = line.strip().partition("=")
+        frac = None
+        if key in ("out_time_us", "out_time_ms") and self.duration:
+            # out_time_ms у ffmpeg тоже в микросекундах (исторический баг названия)
+            try:
+                frac = int(value) / 1_000_000 / self.duration
+            except ValueError:
+                return
+        elif key == "progress" and value == "end":
+            frac = 1.0
+        if frac is None:
+            return
+        frac = max(0.0, min(1.0, frac))
+        if frac - self._last >= 0.01 or frac == 1.0:
+            self._last = frac
+            try:
+                self.on_progress(frac)
+            except Exception:
+                logger.exception("transcode progress callback failed")
+
+
+def run_ffmpeg(
+    args: List[str],
+    duration: Optional[float] = None,
+    on_progress: Optional[ProgressCallback] = None,
+    timeout: Optional[float] = None,
+) -> FfmpegResult:
+    """Run ffmpeg with `args` (everything after the global options) in one of the capped encode slots."""
+    cmd = _build_cmd(args)
+    parser = _ProgressParser(duration, on_progress)
+    limit = float(timeout or TRANSCODE_TIMEOUT_SECONDS)
+    with _encode_slots:
+        started = time.monotonic()
+        proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        # stderr читаем в отдельном потоке, чтобы заполненный pipe не заблокировал ffmpeg
+        err_chunks: List[str] = []
+        err_thread = threading.Thread(target=lambda: err_chunks.append(proc.stderr.read()), daemon=True)
+        err_thread.start()
+        killer = threading.Timer(limit, proc.kill)
+        killer.start()
+        try:
+            for line in proc.stdout:
+                parser.feed(line)
+            proc.wait()
+        finally:
+            killer.cancel()
+            err_thread.join(5)
+        elapsed = time.monotonic() - started
+    stderr = "".join(err_chunks)
+    if elapsed >= limit and proc.returncode != 0:
+        stderr = f"ffmpeg timeout after {int(limit)}s. {stderr}"
+    return FfmpegResult(proc.returncode, stderr[-2000:], elapsed)
+
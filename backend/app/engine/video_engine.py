@@ -5,16 +5,22 @@ import hashlib
 import json
 import logging
 import os
-import shutil
-import subprocess
+import threading
 import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Optional
-from urllib.parse import urljoin, urlparse
+from typing import Callable, Optional
+from urllib.parse import urljoin
 
 import requests
 
+from .http_client import get_http_session
+from .frames import extract_last_frame
+from .media_io import read_local_asset, stream_download_to_file
+from .provider_poller import POLL_HTTP_TIMEOUT, get_provider_poller
+
 logger = logging.getLogger(__name__)
 
 
@@ -47,25 +53,12 @@ def load_env_value(name: str) -> str:
 
 def _try_read_local_static_asset(url: str) -> tuple[Optional[bytes], Optional[str]]:
     """If url points to our own /static/assets/... file, read it from disk to avoid self-HTTP deadlocks."""
-    try:
-        u = urlparse(url)
-        p = (u.path or "").lstrip("/")
-        if not p.startswith("static/assets/"):
-            return None, None
-        filename = p.split("static/assets/", 1)[1]
-        if not filename:
-            return None, None
-        assets_dir = Path(__file__).resolve().parents[1] / "static" / "assets"
-        fpath = (assets_dir / filename).resolve()
-        # safety: ensure it's under assets_dir
-        if assets_dir.resolve() not in fpath.parents and fpath != assets_dir.resolve():
-            return None, None
-        if not fpath.exists() or not fpath.is_file():
-            return None, None
-        ext = fpath.suffix.lstrip(".").lower() or None
-        return fpath.read_bytes(), ext
-    except Exception:
+    local = read_local_asset(url)
+    if local is None:
         return None, None
+    b, mime = local
+    ext_map = {"image/jpeg": "jpg", "image/png": "png", "image/webp": "webp"}
+    return b, ext_map.get(mime)
 
 def _download_image_from_source(source_image: str) -> tuple[bytes, str]:
     src = (source_image or "").strip()
@@ -93,7 +86,7 @@ def _download_image_from_source(source_image: str) -> tuple[bytes, str]:
         if b is not None:
             return b, (ext_local or "jpg")
 
-        resp = requests.get(src, timeout=30)
+        resp = get_http_session().get(src, timeout=30)
         resp.raise_for_status()
         ctype = (resp.headers.get("content-type") or "").lower()
         ext = "jpg"
@@ -122,10 +115,11 @@ def _download_reference_images(sources: list[str]) -> list[dict]:
         )
     return out
 
-def _download_file(url: str) -> bytes:
-    resp = requests.get(url, timeout=120)
-    resp.raise_for_status()
-    return resp.content
+def _download_video(url: str, out_path: Path, headers: Optional[dict] = None) -> Path:
+    """Stream a finished provider video straight to disk (temp file + atomic rename, Range resume)."""
+    info = stream_download_to_file(url, str(out_path), headers=headers, timeout=(15, 180))
+    logger.info("video downloaded file=%s bytes=%s sha256=%s", out_path.name, info["bytes"], str(info["sha256"])[:16])
+    return out_path
 
 
 def _extract_video_urls(data: dict) -> tuple[Optional[str], Optional[str]]:
@@ -155,59 +149,29 @@ def _ensure_video_dir() -> Path:
     return videos_dir
 
 
-def _save_video_locally(video_bytes: bytes, job_id: Optional[str] = None) -> tuple[str, Path, str]:
-    ts = int(time.time() * 1000)
-    resolved_job_id = (job_id or f"job_{ts}").strip()
-    videos_dir = _ensure_video_dir()
-    file_name = f"{resolved_job_id}.mp4"
-    file_path = videos_dir / file_name
-    file_path.write_bytes(video_bytes)
-    return f"/static/videos/{file_name}", file_path, resolved_job_id
-
-
-def _save_veo_video_locally(video_bytes: bytes, job_id: Optional[str] = None) -> tuple[str, Path, str]:
+def _local_video_target(job_id: Optional[str] = None) -> tuple[str, Path, str]:
+    """Where a generated clip is stored: (public url, file path, job id). The file is written by _download_video."""
     ts = int(time.time() * 1000)
     resolved_job_id = (job_id or f"job_{ts}").strip()
     videos_dir = _ensure_video_dir()
     file_name = f"{resolved_job_id}.mp4"
-    file_path = videos_dir / file_name
-    file_path.write_bytes(video_bytes)
-    return f"/static/videos/{file_name}", file_path, resolved_job_id
-
+    return f"/static/videos/{file_name}", videos_dir / file_name, resolved_job_id
 
-def _extract_last_frame(video_path: Path, ts: int) -> tuple[str, str]:
-    if shutil.which("ffmpeg") is None:
-        return "", "last frame extraction skipped: ffmpeg is not installed"
-
-    videos_dir = _ensure_video_dir()
-    frame_name = f"frame_{ts}.png"
-    frame_path = videos_dir / frame_name
-
-    cmd = [
-        "ffmpeg",
-        "-sseof",
-        "-0.1",
-        "-i",
-        str(video_path),
-        "-vframes",
-        "1",
-        "-y",
-        str(frame_path),
-    ]
-    proc = subprocess.run(cmd, capture_output=True, text=True)
-    if proc.returncode != 0:
-        return "", "last frame extraction failed: ffmpeg failed to extract last frame"
 
-    return f"/static/videos/{frame_name}", ""
+def _extract_last_frame(video_path: Path) -> tuple[str, str]:
+    name, warning = extract_last_frame(video_path, _ensure_video_dir())
+    return (f"/static/videos/{name}" if name else ""), warning
 
 
-def _kling_request(image_bytes: bytes, image_ext: str, fmt: str, camera: str, prompt: str, seconds: int, api_key: str) -> tuple[bytes, Optional[bytes]]:
+def _kling_request(image_bytes: bytes, image_ext: str, fmt: str, camera: str, prompt: str, seconds: int, api_key: str, out_path: Path) -> "Future[Path]":
+    """Upload + createTask synchronously; the returned Future resolves to out_path once the clip is downloaded."""
     upload_url = os.getenv("KIE_UPLOAD_URL", "https://kieai.redpandaai.co/api/file-base64-upload")
     create_url = os.getenv("KIE_CREATE_TASK_URL", "https://api.kie.ai/api/v1/jobs/createTask")
     details_url = os.getenv("KIE_TASK_DETAILS_URL", "https://api.kie.ai/api/v1/jobs/recordInfo")
     upload_path = os.getenv("KIE_UPLOAD_PATH", "images/photostudio")
     timeout_s = int(os.getenv("KIE_POLL_TIMEOUT_SECONDS", "300"))
-    interval_s = int(os.getenv("KIE_POLL_INTERVAL_SECONDS", "4"))
+    interval_s = int(os.getenv("KIE_POLL_INTERVAL_SECONDS", "3"))
+    max_interval_s = int(os.getenv("KIE_POLL_MAX_INTERVAL_SECONDS", "15"))
     logger.info("KIE endpoints upload_url=%s create_url=%s details_url=%s", upload_url, create_url, details_url)
 
     req_prompt = f"{prompt}\nCamera move: {camera}. Duration: {seconds}s. Format: {fmt}."
@@ -249,7 +213,7 @@ def _kling_request(image_bytes: bytes, image_ext: str, fmt: str, camera: str, pr
         file_name,
         upload_url,
     )
-    upload_resp = requests.post(upload_url, headers=headers, json=upload_payload, timeout=60)
+    upload_resp = get_http_session().post(upload_url, headers=headers, json=upload_payload, timeout=60)
     logger.debug("KIE file upload status=%s request_id=%s response=%s", upload_resp.status_code, upload_resp.headers.get("x-request-id") or upload_resp.headers.get("request-id"), upload_resp.text[:500])
     _raise_kie_error(upload_resp, "file-base64-upload")
     upload_data = upload_resp.json()
@@ -269,7 +233,7 @@ def _kling_request(image_bytes: bytes, image_ext: str, fmt: str, camera: str, pr
             "duration": str(seconds),
         },
     }
-    create_resp = requests.post(create_url, headers=headers, json=task_payload, timeout=60)
+    create_resp = get_http_session().post(create_url, headers=headers, json=task_payload, timeout=60)
     logger.debug("KIE createTask status=%s request_id=%s response=%s", create_resp.status_code, create_resp.headers.get("x-request-id") or create_resp.headers.get("request-id"), create_resp.text[:500])
     _raise_kie_error(create_resp, "createTask")
 
@@ -278,9 +242,8 @@ def _kling_request(image_bytes: bytes, image_ext: str, fmt: str, camera: str, pr
     if not task_id:
         raise RuntimeError(f"KIE createTask did not return taskId: {str(create_data)[:400]}")
 
-    started = time.time()
-    while time.time() - started < timeout_s:
-        detail_resp = requests.get(details_url, headers=headers, params={"taskId": task_id}, timeout=60)
+    def _check() -> Optional[str]:
+        detail_resp = get_http_session().get(details_url, headers=headers, params={"taskId": task_id}, timeout=POLL_HTTP_TIMEOUT)
         _raise_kie_error(detail_resp, "getTaskDetails")
         detail_data = detail_resp.json()
 
@@ -295,43 +258,55 @@ def _kling_request(image_bytes: bytes, image_ext: str, fmt: str, camera: str, pr
         )
 
         if status in {"success", "succeeded", "done", "completed"}:
-            video_url, _ = _extract_video_urls(detail_data)
-            if not video_url:
-                nested_data = detail_data.get("data") if isinstance(detail_data, dict) else None
-                if isinstance(nested_data, dict):
-                    video_url, _ = _extract_video_urls(nested_data)
-                    if not video_url:
-                        result_json_str = nested_data.get("resultJson") or nested_data.get("result_json") or nested_data.get("result")
-                        if isinstance(result_json_str, str):
-                            result_json_trimmed = result_json_str.strip()
-                            if result_json_trimmed.startswith("{") or result_json_trimmed.startswith("["):
-                                try:
-                                    parsed_obj = json.loads(result_json_trimmed)
-                                except Exception:
-                                    parsed_obj = None
-                                if isinstance(parsed_obj, dict):
-                                    result_urls = parsed_obj.get("resultUrls") or parsed_obj.get("result_urls")
-                                    if isinstance(result_urls, list) and result_urls:
-                                        first_url = result_urls[0]
-                                        if isinstance(first_url, str) and first_url.startswith(("http://", "https://")):
-                                            video_url = first_url
-                                if not video_url and isinstance(parsed_obj, dict):
-                                    video_url, _ = _extract_video_urls(parsed_obj)
-            if not video_url:
-                logger.debug(
-                    "KIE success but video url missing. detail_keys=%s data_keys=%s",
-                    list(detail_data.keys()) if isinstance(detail_data, dict) else [],
-                    list((detail_data.get("data") or {}).keys()) if isinstance(detail_data, dict) and isinstance(detail_data.get("data"), dict) else [],
-                )
-                raise RuntimeError(f"KIE task succeeded but video url is missing: {str(detail_data)[:500]}")
-            return _download_file(video_url), None
-
+            return _kie_video_url(detail_data)
         if status in {"failed", "error", "canceled", "cancelled"}:
             raise RuntimeError(f"KIE task failed for taskId={task_id}: {str(detail_data)[:500]}")
+        return None
+
+    # опрос ведёт общий поллер, скачивание — его пул завершения; вызывающий поток свободен
+    poller = get_provider_poller()
+    video_url = poller.track(
+        f"kie:{task_id}",
+        _check,
+        timeout=timeout_s,
+        initial_interval=interval_s,
+        max_interval=max_interval_s,
+        on_timeout=lambda: RuntimeError(f"KIE task polling timeout for taskId={task_id} after {timeout_s}s"),
+    )
+    return poller.then(video_url, lambda url: _download_video(url, out_path))
 
-        time.sleep(interval_s)
 
-    raise RuntimeError(f"KIE task polling timeout for taskId={task_id} after {timeout_s}s")
+def _kie_video_url(detail_data: dict) -> str:
+    video_url, _ = _extract_video_urls(detail_data)
+    if not video_url:
+        nested_data = detail_data.get("data") if isinstance(detail_data, dict) else None
+        if isinstance(nested_data, dict):
+            video_url, _ = _extract_video_urls(nested_data)
+            if not video_url:
+                result_json_str = nested_data.get("resultJson") or nested_data.get("result_json") or nested_data.get("result")
+                if isinstance(result_json_str, str):
+                    result_json_trimmed = result_json_str.strip()
+                    if result_json_trimmed.startswith("{") or result_json_trimmed.startswith("["):
+                        try:
+                            parsed_obj = json.loads(result_json_trimmed)
+                        except Exception:
+                            parsed_obj = None
+                        if isinstance(parsed_obj, dict):
+                            result_urls = parsed_obj.get("resultUrls") or parsed_obj.get("result_urls")
+                            if isinstance(result_urls, list) and result_urls:
+                                first_url = result_urls[0]
+                                if isinstance(first_url, str) and first_url.startswith(("http://", "https://")):
+                                    video_url = first_url
+                        if not video_url and isinstance(parsed_obj, dict):
+                            video_url, _ = _extract_video_urls(parsed_obj)
+    if not video_url:
+        logger.debug(
+            "KIE success but video url missing. detail_keys=%s data_keys=%s",
+            list(detail_data.keys()) if isinstance(detail_data, dict) else [],
+            list((detail_data.get("data") or {}).keys()) if isinstance(detail_data, dict) and isinstance(detail_data.get("data"), dict) else [],
+        )
+        raise RuntimeError(f"KIE task succeeded but video url is missing: {str(detail_data)[:500]}")
+    return video_url
 
 
 def _raise_kie_error(resp: requests.Response, endpoint_name: str) -> None:
@@ -390,9 +365,11 @@ def _veo_request(
     seconds: int,
     api_key: str,
     reference_sources: Optional[list[str]] = None,
-) -> tuple[bytes, Optional[bytes]]:
+    out_path: Optional[Path] = None,
+) -> "Future[Path]":
     """
-    Gemini Veo predictLongRunning.
+    Gemini Veo predictLongRunning. The request is sent synchronously; the returned Future
+    resolves to the downloaded clip path (or raises TimeoutError / RuntimeError).
 
     Supports:
     - image-to-video: pass image_bytes
@@ -441,7 +418,7 @@ def _veo_request(
     }
 
     request_start = time.time()
-    resp = requests.post(predict_url, headers=headers, json=payload, timeout=120)
+    resp = get_http_session().post(predict_url, headers=headers, json=payload, timeout=120)
     if resp.status_code >= 400:
         raise RuntimeError(f"Gemini Veo predictLongRunning error {resp.status_code}: {resp.text[:400]}")
     created = resp.json()
@@ -451,52 +428,124 @@ def _veo_request(
     operation_name = operation_name.strip()
 
     poll_timeout_seconds = int(os.getenv("VEO_POLL_TIMEOUT_SECONDS", "720"))
-    poll_interval_seconds = int(os.getenv("VEO_POLL_INTERVAL_SECONDS", "10"))
+    poll_interval_seconds = int(os.getenv("VEO_POLL_INTERVAL_SECONDS", "5"))
+    poll_max_interval_seconds = int(os.getenv("VEO_POLL_MAX_INTERVAL_SECONDS", "20"))
     logger.info("Gemini Veo operation started name=%s", operation_name)
 
     poll_url = urljoin(f"{base_url}/", operation_name)
     started = time.time()
-    while time.time() - started < poll_timeout_seconds:
-        status_resp = requests.get(poll_url, headers={"x-goog-api-key": api_key}, timeout=60)
+
+    def _check() -> Optional[str]:
+        status_resp = get_http_session().get(poll_url, headers={"x-goog-api-key": api_key}, timeout=POLL_HTTP_TIMEOUT)
         if status_resp.status_code >= 400:
             raise RuntimeError(f"Gemini Veo operation poll error {status_resp.status_code}: {status_resp.text[:400]}")
         status_json = status_resp.json()
-        if status_json.get("done") is True:
-            if isinstance(status_json.get("error"), dict):
-                err = status_json.get("error") or {}
-                raise RuntimeError(f"Gemini Veo operation failed: {err.get('message') or str(err)[:400]}")
-            try:
-                response_obj = status_json.get("response") if isinstance(status_json.get("response"), dict) else {}
-                gvr = response_obj.get("generateVideoResponse") if isinstance(response_obj.get("generateVideoResponse"), dict) else {}
-                generated_samples = gvr.get("generatedSamples") if isinstance(gvr.get("generatedSamples"), list) else []
-                if not generated_samples:
-                    filtered_count = gvr.get("raiMediaFilteredCount") or 0
-                    reasons = gvr.get("raiMediaFilteredReasons") if isinstance(gvr.get("raiMediaFilteredReasons"), list) else []
-                    first_reason = next((r for r in reasons if isinstance(r, str) and r.strip()), "")
-                    first_reason = (first_reason.strip()[:300] if first_reason else "generatedSamples missing/empty")
-                    raise RuntimeError(f"VEO_FILTERED: count={filtered_count} reason={first_reason}")
-                video_uri = generated_samples[0]["video"]["uri"]
-            except RuntimeError:
-                raise
-            except Exception as exc:
-                raise RuntimeError(f"Gemini Veo operation completed but video uri missing: {str(status_json)[:500]}") from exc
-
-            video_resp = requests.get(video_uri, headers={"x-goog-api-key": api_key}, timeout=180, allow_redirects=True)
-            if video_resp.status_code >= 400:
-                raise RuntimeError(f"Gemini Veo video download error {video_resp.status_code}: {video_resp.text[:400]}")
-            elapsed = int(time.time() - request_start)
-            logger.info("Gemini Veo operation completed name=%s elapsed=%ss", operation_name, elapsed)
-            return video_resp.content, None
-
-        logger.debug("Gemini Veo operation pending name=%s elapsed=%ss", operation_name, int(time.time() - started))
-        time.sleep(max(8, min(12, poll_interval_seconds)))
-
-    raise TimeoutError("VIDEO_TIMEOUT")
+        if status_json.get("done") is not True:
+            logger.debug("Gemini Veo operation pending name=%s elapsed=%ss", operation_name, int(time.time() - started))
+            return None
+        if isinstance(status_json.get("error"), dict):
+            err = status_json.get("error") or {}
+            raise RuntimeError(f"Gemini Veo operation failed: {err.get('message') or str(err)[:400]}")
+        try:
+            response_obj = status_json.get("response") if isinstance(status_json.get("response"), dict) else {}
+            gvr = response_obj.get("generateVideoResponse") if isinstance(response_obj.get("generateVideoResponse"), dict) else {}
+            generated_samples = gvr.get("generatedSamples") if isinstance(gvr.get("generatedSamples"), list) else []
+            if not generated_samples:
+                filtered_count = gvr.get("raiMediaFilteredCount") or 0
+                reasons = gvr.get("raiMediaFilteredReasons") if isinstance(gvr.get("raiMediaFilteredReasons"), list) else []
+                first_reason = next((r for r in reasons if isinstance(r, str) and r.strip()), "")
+                first_reason = (first_reason.strip()[:300] if first_reason else "generatedSamples missing/empty")
+                raise RuntimeError(f"VEO_FILTERED: count={filtered_count} reason={first_reason}")
+            return generated_samples[0]["video"]["uri"]
+        except RuntimeError:
+            raise
+        except Exception as exc:
+            raise RuntimeError(f"Gemini Veo operation completed but video uri missing: {str(status_json)[:500]}") from exc
+
+    # опрос ведёт общий поллер, скачивание — его пул завершения; вызывающий поток свободен
+    poller = get_provider_poller()
+    video_uri = poller.track(
+        f"veo:{operation_name}",
+        _check,
+        timeout=poll_timeout_seconds,
+        initial_interval=poll_interval_seconds,
+        max_interval=poll_max_interval_seconds,
+        on_timeout=lambda: TimeoutError("VIDEO_TIMEOUT"),
+    )
+    if out_path is None:
+        _, out_path, _ = _local_video_target()
+
+    def _finish(uri: str) -> Path:
+        try:
+            _download_video(uri, out_path, headers={"x-goog-api-key": api_key})
+        except RuntimeError as exc:
+            raise RuntimeError(f"Gemini Veo video download error: {exc}") from exc
+        elapsed = int(time.time() - request_start)
+        logger.info("Gemini Veo operation completed name=%s elapsed=%ss", operation_name, elapsed)
+        return out_path
+
+    return poller.then(video_uri, _finish)
+
+
+def _video_error(exc: BaseException, model: str) -> dict:
+    if isinstance(exc, TimeoutError):
+        return {
+            "ok": False,
+            "code": "VIDEO_TIMEOUT",
+            "hint": "Retry later or inspect provider/backend logs.",
+            "message": "Video generation timed out while waiting for Gemini Veo operation.",
+        }
+    logger.error("video generation failed model=%s", model, exc_info=exc)
+    msg = str(exc)
+    if msg.startswith("VEO_FILTERED"):
+        return {
+            "ok": False,
+            "code": "VEO_FILTERED",
+            "message": "Veo не смог создать видео (фильтр или processing).",
+            "hint": "Упростите промт, уберите упоминания музыки/голоса и добавьте 'No audio. Silent video.'",
+            "debug": msg,
+        }
+    return {
+        "ok": False,
+        "code": "VIDEO_GENERATION_FAILED",
+        "message": msg,
+    }
+
+
+def _resolved(value: dict) -> "Future[dict]":
+    fut: Future = Future()
+    fut.set_result(value)
+    return fut
+
+
+def _settle(fut: Future, model: str) -> "Future[dict]":
+    """Future[dict] that never raises: provider errors become the same error dicts as sync failures."""
+    out: Future = Future()
+
+    def _done(src: Future):
+        exc = src.exception()
+        out.set_result(_video_error(exc, model) if exc is not None else src.result())
+
+    fut.add_done_callback(_done)
+    return out
+
+
 def generate_video(kind: str, source_image: str, fmt: str, model: str, camera: str, prompt: str, seconds: int, lighting: str = "soft") -> dict:
+    """Blocking wrapper over start_video()."""
+    return start_video(kind, source_image, fmt, model, camera, prompt, seconds, lighting=lighting).result()
+
+
+def start_video(kind: str, source_image: str, fmt: str, model: str, camera: str, prompt: str, seconds: int, lighting: str = "soft") -> "Future[dict]":
+    """
+    Submit one clip to the provider (image download, upload, create task — in the calling thread)
+    and return a Future of the generate_video() result dict. Пока провайдер рендерит, ни один
+    поток этот ролик не ждёт: опрос и скачивание идут через provider_poller.
+    """
     try:
-        job_id = f"job_{int(time.time() * 1000)}"
+        # uuid suffix: clips of one request are generated concurrently within the same millisecond
+        job_id = f"job_{int(time.time() * 1000)}_{uuid.uuid4().hex[:6]}"
         if kind != "video_from_image":
-            return {"ok": False, "code": "INVALID_KIND", "message": "kind must be 'video_from_image'"}
+            return _resolved({"ok": False, "code": "INVALID_KIND", "message": "kind must be 'video_from_image'"})
 
         # Allow passing multiple reference images for Veo (up to 3).
         # Frontend may send a JSON array string in source_image, e.g. ["url1","url2","url3"].
@@ -533,28 +582,32 @@ def generate_video(kind: str, source_image: str, fmt: str, model: str, camera: s
         if model == "classic":
             api_key = load_env_value("KLING_API_KEY")
             if not api_key:
-                return {"ok": False, "code": "MISSING_KLING_API_KEY", "message": "KLING_API_KEY is missing in environment/.env"}
+                return _resolved({"ok": False, "code": "MISSING_KLING_API_KEY", "message": "KLING_API_KEY is missing in environment/.env"})
             if seconds not in (5, 10):
-                return {
+                return _resolved({
                     "ok": False,
                     "code": "INVALID_DURATION",
                     "message": f"Classic (Kling-2.6) supports duration only 5 or 10 seconds; got {seconds}",
+                })
+            video_url, video_path, resolved_job_id = _local_video_target(job_id=job_id)
+
+            def _kling_done(path: Path) -> dict:
+                last_frame_url, warning = _extract_last_frame(path)
+                return {
+                    "ok": True,
+                    "jobId": resolved_job_id,
+                    "videoUrl": video_url,
+                    "lastFrameUrl": last_frame_url,
+                    "warning": warning,
                 }
-            video_bytes, _ = _kling_request(image_bytes, image_ext, fmt, camera, prompt, seconds, api_key)
-            video_url, video_path, resolved_job_id = _save_video_locally(video_bytes, job_id=job_id)
-            last_frame_url, warning = _extract_last_frame(video_path, int(time.time() * 1000))
-            return {
-                "ok": True,
-                "jobId": resolved_job_id,
-                "videoUrl": video_url,
-                "lastFrameUrl": last_frame_url,
-                "warning": warning,
-            }
+
+            clip = _kling_request(image_bytes, image_ext, fmt, camera, prompt, seconds, api_key, out_path=video_path)
+            return _settle(get_provider_poller().then(clip, _kling_done), model)
 
         if model == "premium":
             api_key = load_env_value("GEMINI_API_KEY")
             if not api_key:
-                return {"ok": False, "code": "MISSING_GEMINI_API_KEY", "message": "GEMINI_API_KEY is missing in environment/.env"}
+                return _resolved({"ok": False, "code": "MISSING_GEMINI_API_KEY", "message": "GEMINI_API_KEY is missing in environment/.env"})
 
             # If we received multiple sources, use them as Veo referenceImages (up to 3).
             # Veo referenceImages require durationSeconds=8 in Gemini API docs.
@@ -564,51 +617,104 @@ def generate_video(kind: str, source_image: str, fmt: str, model: str, camera: s
                 # Auto-fix to 8s to keep UI simple (user can still show 5s/10s presets on UI).
                 effective_seconds = 8
 
-            video_bytes, _ = _veo_request(image_bytes if not ref_sources else None, image_ext, fmt, prompt, effective_seconds, api_key, reference_sources=ref_sources)
-            video_url, video_path, resolved_job_id = _save_veo_video_locally(video_bytes, job_id=job_id)
-            last_frame_url, warning = _extract_last_frame(video_path, int(time.time() * 1000))
-            return {
-                "ok": True,
-                "jobId": resolved_job_id,
-                "provider": "veo_gemini",
-                "video_url": video_url,
-                "videoUrl": video_url,
-                "lastFrameUrl": last_frame_url,
-                "warning": warning,
-                "meta": {
-                    "format": fmt,
-                    "seconds": effective_seconds,
-                    "camera": camera,
-                    "generated_at": datetime.now(timezone.utc).isoformat(),
-                    "file": f"{resolved_job_id}.mp4",
-                },
-            }
+            video_url, video_path, resolved_job_id = _local_video_target(job_id=job_id)
 
-        return {"ok": False, "code": "INVALID_MODEL", "message": "model must be 'classic' or 'premium'"}
+            def _veo_done(path: Path) -> dict:
+                last_frame_url, warning = _extract_last_frame(path)
+                return {
+                    "ok": True,
+                    "jobId": resolved_job_id,
+                    "provider": "veo_gemini",
+                    "video_url": video_url,
+                    "videoUrl": video_url,
+                    "lastFrameUrl": last_frame_url,
+                    "warning": warning,
+                    "meta": {
+                        "format": fmt,
+                        "seconds": effective_seconds,
+                        "camera": camera,
+                        "generated_at": datetime.now(timezone.utc).isoformat(),
+                        "file": f"{resolved_job_id}.mp4",
+                    },
+                }
+
+            clip = _veo_request(image_bytes if not ref_sources else None, image_ext, fmt, prompt, effective_seconds, api_key, reference_sources=ref_sources, out_path=video_path)
+            return _settle(get_provider_poller().then(clip, _veo_done), model)
+
+        return _resolved({"ok": False, "code": "INVALID_MODEL", "message": "model must be 'classic' or 'premium'"})
 
-    except TimeoutError:
-        return {
-            "ok": False,
-            "code": "VIDEO_TIMEOUT",
-            "hint": "Retry later or inspect provider/backend logs.",
-            "message": "Video generation timed out while waiting for Gemini Veo operation.",
-        }
     except Exception as exc:
-        logger.exception("video generation failed model=%s", model)
-        msg = str(exc)
-        if msg.startswith("VEO_FILTERED"):
-            return {
-                "ok": False,
-                "code": "VEO_FILTERED",
-                "message": "Veo не смог создать видео (фильтр или processing).",
-                "hint": "Упростите промт, уберите упоминания музыки/голоса и добавьте 'No audio. Silent video.'",
-                "debug": msg,
-            }
-        return {
-            "ok": False,
-            "code": "VIDEO_GENERATION_FAILED",
-            "message": msg,
-        }
+        return _resolved(_video_error(exc, model))
+
+
+def start_videos(
+    count: int,
+    kind: str,
+    source_image: str,
+    fmt: str,
+    model: str,
+    camera: str,
+    prompt: str,
+    seconds: int,
+    lighting: str = "soft",
+    on_clip_done: Optional[Callable[[int, dict], None]] = None,
+) -> "Future[list[dict]]":
+    """
+    Submit `count` clips concurrently (each clip is its own provider task) and return a Future
+    of the per-clip generate_video() results in request order; one failed clip does not fail
+    the others. on_clip_done(index, result) is called as each clip finishes.
+    Короткий пул нужен только на отправку (upload + createTask); дальше клипы ждут в
+    provider_poller, и ни один поток не ждёт результат — его собирают колбэки готовых клипов.
+    """
+    count = max(1, int(count or 1))
+    results: list[Optional[dict]] = [None] * count
+    out: Future = Future()
+    lock = threading.Lock()
+    left = [count]
+
+    def _start(_i: int) -> "Future[dict]":
+        return start_video(kind, source_image, fmt, model, camera, prompt, seconds, lighting=lighting)
+
+    def _clip_done(i: int, fut: Future):
+        res = fut.result() if fut.exception() is None else _video_error(fut.exception(), model)
+        results[i] = res
+        if on_clip_done:
+            try:
+                on_clip_done(i, res)
+            except Exception:
+                logger.exception("on_clip_done callback failed index=%s", i)
+        with lock:
+            left[0] -= 1
+            last = left[0] == 0
+        if last:
+            out.set_result([r or {"ok": False, "code": "VIDEO_GENERATION_FAILED", "message": "no result"} for r in results])
+
+    with ThreadPoolExecutor(max_workers=count, thread_name_prefix="video-clip") as pool:
+        started = {pool.submit(_start, i): i for i in range(count)}
+        for fut in as_completed(started):
+            i = started[fut]
+            try:
+                clip = fut.result()
+            except Exception as exc:  # start_video normally returns errors as resolved dicts
+                clip = _resolved({"ok": False, "code": "VIDEO_GENERATION_FAILED", "message": str(exc)})
+            clip.add_done_callback(lambda f, i=i: _clip_done(i, f))
+    return out
+
+
+def generate_videos(
+    count: int,
+    kind: str,
+    source_image: str,
+    fmt: str,
+    model: str,
+    camera: str,
+    prompt: str,
+    seconds: int,
+    lighting: str = "soft",
+    on_clip_done: Optional[Callable[[int, dict], None]] = None,
+) -> list[dict]:
+    """Blocking wrapper over start_videos()."""
+    return start_videos(count, kind, source_image, fmt, model, camera, prompt, seconds, lighting=lighting, on_clip_done=on_clip_done).result()
 
 
 def _local_video_path_from_url(video_url: str) -> str | None:
@@ -624,57 +730,31 @@ def _local_video_path_from_url(video_url: str) -> str | None:
 
 
 def concat_videos(clip_urls: list[str], fmt: str = "9:16") -> dict:
-    """Concat local mp4 clips with ffmpeg (concat demuxer)."""
+    """Concat local mp4 clips (stream copy when compatible, see video_merge.merge_clips)."""
+    from app.core.config import settings
+    from .video_merge import merge_clips
+
+    if not clip_urls or len(clip_urls) < 2:
+        return {"ok": False, "code": "NEED_2", "message": "Need at least 2 clips"}
+
+    paths = []
+    for u in clip_urls:
+        p = _local_video_path_from_url(u)
+        if not p or not os.path.exists(p):
+            return {"ok": False, "code": "MISSING_CLIP", "message": f"Clip not found: {u}"}
+        paths.append(p)
+
+    out_job = f"merge_{int(time.time()*1000)}_{uuid.uuid4().hex[:6]}"
+    out_path = os.path.join(_ensure_video_dir(), f"{out_job}.mp4")
     try:
-        if not clip_urls or len(clip_urls) < 2:
-            return {"ok": False, "code": "NEED_2", "message": "Need at least 2 clips"}
-
-        paths = []
-        for u in clip_urls:
-            p = _local_video_path_from_url(u)
-            if not p or not os.path.exists(p):
-                return {"ok": False, "code": "MISSING_CLIP", "message": f"Clip not found: {u}"}
-            paths.append(p)
-
-        out_job = f"merge_{int(time.time()*1000)}"
-        videos_dir = _ensure_video_dir()
-        out_path = os.path.join(videos_dir, f"{out_job}.mp4")
-
-        # concat demuxer list file
-        list_path = os.path.join(videos_dir, f"{out_job}.txt")
-        with open(list_path, "w", encoding="utf-8") as f:
-            for p in paths:
-                # ffmpeg concat wants file lines with escaped paths
-                esc = p.replace("'", "'\\\\''")
-                f.write("file '%s'\n" % esc)
-
-        # Run ffmpeg
-        cmd = [
-            "ffmpeg",
-            "-y",
-            "-hide_banner",
-            "-loglevel", "error",
-            "-f", "concat",
-            "-safe", "0",
-            "-i", list_path,
-            "-c", "copy",
-            out_path,
-        ]
-        try:
-            proc = subprocess.run(cmd, capture_output=True, text=True, check=False)
-        except FileNotFoundError:
-            return {"ok": False, "code": "FFMPEG_MISSING", "message": "ffmpeg not found in PATH. Install ffmpeg and restart backend."}
-
-        if proc.returncode != 0 or not os.path.exists(out_path):
-            err = (proc.stderr or proc.stdout or "").strip()
-            return {"ok": False, "code": "FFMPEG_ERROR", "message": err[:400] or "ffmpeg concat failed"}
-
-        base_url = settings.PUBLIC_BASE_URL.rstrip("/")
-        video_url = f"{base_url}/static/videos/{os.path.basename(out_path)}"
-        last_frame_url, warning = _extract_last_frame(out_path, int(time.time() * 1000))
-        return {"ok": True, "videoUrl": video_url, "lastFrameUrl": last_frame_url, "warning": warning}
-    finally:
-        try:
-            pass
-        except Exception:
-            pass
\ No newline at end of file
+        merge_clips(paths, out_path)
+    except FileNotFoundError:
+        return {"ok": False, "code": "FFMPEG_MISSING", "message": "ffmpeg not found in PATH. Install ffmpeg and restart backend."}
+    except RuntimeError as exc:
+        code = "FFMPEG_MISSING" if "not found in PATH" in str(exc) else "FFMPEG_ERROR"
+        return {"ok": False, "code": code, "message": str(exc)[:400]}
+
+    base_url = settings.PUBLIC_BASE_URL.rstrip("/")
+    video_url = f"{base_url}/static/videos/{os.path.basename(out_path)}"
+    last_frame_url, warning = _extract_last_frame(Path(out_path))
+    return {"ok": True, "videoUrl": video_url, "lastFrameUrl": last_frame_url, "warning": warning}
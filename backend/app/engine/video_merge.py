@@ -0,0 +1,260 @@
+"""
+Single merge engine for /static/videos clips.
+
+Раньше было две склейки: concat_videos (всегда `-c copy`, ломается на смеси Kling/Veo)
+и routes/video.merge (всегда полный libx264 re-encode, медленно). Теперь:
+  1. каждый клип пробуется ffprobe (кодек, разрешение, fps, pix_fmt, timebase, аудио);
+     результат кэшируется по (path, size, mtime);
+  2. если параметры всех клипов совпадают — concat demuxer + stream copy (доли секунды);
+  3. иначе все клипы, которые ещё не в нём, перекодируются в единый mezzanine-формат
+     (h264 yuv420p 30fps, aac 48k stereo, короткая сторона 720 при самом частом соотношении
+     сторон). Цель не зависит от набора склеиваемых клипов, поэтому нормализованные клипы
+     из clip_cache (ключ — исходник + сигнатура mezzanine) переиспользуются между склейками:
+     повторные склейки тех же клипов — только concat copy.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import uuid
+from collections import Counter, OrderedDict
+from dataclasses import dataclass
+from fractions import Fraction
+from typing import Dict, List, Optional, Tuple
+
+from . import clip_cache
+from .transcode import ProgressCallback, run_ffmpeg
+
+logger = logging.getLogger(__name__)
+
+PROBE_CACHE_MAX = 512
+
+# Mezzanine-формат нормализованных клипов (часть ключа clip_cache — меняешь параметры, меняй версию)
+MEZZANINE_VERSION = 2
+MEZZANINE_SHORT_SIDE = 720
+MEZZANINE_FPS = "30/1"
+MEZZANINE_TIME_BASE = "1/15360"
+MEZZANINE_AUDIO_RATE = 48000
+MEZZANINE_AUDIO_CHANNELS = 2
+
+
+@dataclass(frozen=True)
+class ClipInfo:
+    vcodec: str
+    width: int
+    height: int
+    fps: str            # r_frame_rate, e.g. "30/1"
+    pix_fmt: str
+    time_base: str      # video stream time_base, e.g. "1/15360"
+    has_audio: bool
+    acodec: str
+    sample_rate: int
+    channels: int
+    duration: float
+    video_duration: float = 0.0  # длительность видеопотока (может быть короче контейнера); 0 — неизвестна
+
+    def signature(self) -> Tuple:
+        """Everything that must match for concat demuxer + stream copy."""
+        return (
+            self.vcodec, self.width, self.height, self.fps, self.pix_fmt, self.time_base,
+            self.has_audio, self.acodec, self.sample_rate, self.channels,
+        )
+
+
+_probe_cache: "OrderedDict[Tuple[str, int, int], ClipInfo]" = OrderedDict()
+_probe_lock = threading.Lock()
+
+
+def _ffprobe_bin() -> str:
+    path = shutil.which("ffprobe")
+    if not path:
+        raise RuntimeError("ffprobe not found in PATH. Install ffmpeg (includes ffprobe) and restart backend.")
+    return path
+
+
+def _run_probe(path: str) -> ClipInfo:
+    proc = subprocess.run(
+        [_ffprobe_bin(), "-v", "error", "-print_format", "json", "-show_streams", "-show_format", path],
+        capture_output=True, text=True, timeout=30,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"ffprobe failed for {os.path.basename(path)}: {proc.stderr[-300:]}")
+    data = json.loads(proc.stdout or "{}")
+    streams = data.get("streams") or []
+    v = next((s for s in streams if s.get("codec_type") == "video"), None)
+    a = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    if not v:
+        raise RuntimeError(f"No video stream in {os.path.basename(path)}")
+    try:
+        duration = float((data.get("format") or {}).get("duration") or v.get("duration") or 0)
+    except (TypeError, ValueError):
+        duration = 0.0
+    try:
+        video_duration = float(v.get("duration") or 0)
+    except (TypeError, ValueError):
+        video_duration = 0.0
+    return ClipInfo(
+        vcodec=str(v.get("codec_name") or ""),
+        width=int(v.get("width") or 0),
+        height=int(v.get("height") or 0),
+        fps=str(v.get("r_frame_rate") or v.get("avg_frame_rate") or ""),
+        pix_fmt=str(v.get("pix_fmt") or ""),
+        time_base=str(v.get("time_base") or ""),
+        has_audio=a is not None,
+        acodec=str((a or {}).get("codec_name") or ""),
+        sample_rate=int((a or {}).get("sample_rate") or 0),
+        channels=int((a or {}).get("channels") or 0),
+        duration=duration,
+        video_duration=video_duration,
+    )
+
+
+def probe_clip(path: str) -> ClipInfo:
+    """ffprobe a clip; cached per (path, size, mtime) so repeated merges don't re-probe."""
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _probe_lock:
+        info = _probe_cache.get(key)
+        if info is not None:
+            _probe_cache.move_to_end(key)
+            return info
+    info = _run_probe(path)
+    with _probe_lock:
+        _probe_cache[key] = info
+        while len(_probe_cache) > PROBE_CACHE_MAX:
+            _probe_cache.popitem(last=False)
+    return info
+
+
+def _pick_target(infos: List[ClipInfo]) -> ClipInfo:
+    """All clips identical -> that format (pure stream copy); else the canonical mezzanine target."""
+    if len({i.signature() for i in infos}) == 1:
+        return infos[0]
+    return mezzanine_target(infos)
+
+
+def _even(x: float) -> int:
+    return max(2, int(round(x / 2)) * 2)
+
+
+def mezzanine_target(infos: List[ClipInfo]) -> ClipInfo:
+    """
+    Canonical stream layout for normalized clips. Размер зависит только от соотношения сторон
+    (самого частого среди клипов): короткая сторона MEZZANINE_SHORT_SIDE, поэтому один и тот же
+    клип в разных склейках нормализуется в один и тот же формат и берётся из clip_cache.
+    """
+    (width, height), _ = Counter((i.width, i.height) for i in infos).most_common(1)[0]
+    if width > 0 and height > 0:
+        scale = MEZZANINE_SHORT_SIDE / min(width, height)
+        width, height = _even(width * scale), _even(height * scale)
+    return ClipInfo(
+        vcodec="h264", width=width, height=height, fps=MEZZANINE_FPS, pix_fmt="yuv420p",
+        time_base=MEZZANINE_TIME_BASE, has_audio=True, acodec="aac",
+        sample_rate=MEZZANINE_AUDIO_RATE, channels=MEZZANINE_AUDIO_CHANNELS, duration=0.0,
+    )
+
+
+def normalize_args(src: str, info: ClipInfo, target: ClipInfo, dst: str) -> List[str]:
+    """ffmpeg args that re-encode `src` into exactly the target stream layout (for concat copy)."""
+    w, h = target.width, target.height
+    vf = (
+        f"scale={w}:{h}:force_original_aspect_ratio=decrease,"
+        f"pad={w}:{h}:(ow-iw)/2:(oh-ih)/2,setsar=1,fps={target.fps},format={target.pix_fmt}"
+    )
+    args = ["-y", "-i", src]
+    if target.has_audio and not info.has_audio:
+        # тихая дорожка, чтобы у всех клипов был одинаковый набор потоков
+        layout = "stereo" if target.channels == 2 else "mono"
+        args += ["-f", "lavfi", "-i", f"anullsrc=channel_layout={layout}:sample_rate={target.sample_rate}", "-shortest"]
+    args += ["-map", "0:v:0"]
+    if target.has_audio:
+        args += ["-map", "0:a:0" if info.has_audio else "1:a:0"]
+    args += ["-vf", vf, "-c:v", "libx264", "-preset", "veryfast", "-crf", "20"]
+    if target.time_base:
+        try:
+            args += ["-video_track_timescale", str(Fraction(target.time_base).denominator)]
+        except (ValueError, ZeroDivisionError):
+            pass
+    if target.has_audio:
+        args += ["-c:a", "aac", "-b:a", "128k", "-ar", str(target.sample_rate), "-ac", str(target.channels)]
+    else:
+        args += ["-an"]
+    args += ["-movflags", "+faststart", dst]
+    return args
+
+
+def _concat_copy(paths: List[str], out_path: str, work_dir: str) -> None:
+    list_path = os.path.join(work_dir, "list.txt")
+    with open(list_path, "w", encoding="utf-8") as f:
+        for p in paths:
+            esc = p.replace("'", "'\\''")
+            f.write(f"file '{esc}'\n")
+    res = run_ffmpeg(["-y", "-f", "concat", "-safe", "0", "-i", list_path, "-c", "copy", "-movflags", "+faststart", out_path])
+    if not res.ok:
+        raise RuntimeError(f"ffmpeg concat failed: {res.stderr[-400:]}")
+
+
+def _mezzanine_clip(src: str, info: ClipInfo, target: ClipInfo, on_progress: Optional[ProgressCallback]) -> Tuple[str, bool]:
+    """Normalized copy of src from clip_cache (transcoded on first use). Returns (path, cache_hit)."""
+    params = f"v{MEZZANINE_VERSION}|" + "|".join(str(x) for x in target.signature())
+
+    def _build(dst: str):
+        res = run_ffmpeg(normalize_args(src, info, target, dst), duration=info.duration or None, on_progress=on_progress)
+        if not res.ok:
+            raise RuntimeError(f"ffmpeg normalize failed for {os.path.basename(src)}: {res.stderr[-400:]}")
+
+    return clip_cache.get_or_create(src, params, _build)
+
+
+def merge_clips(paths: List[str], out_path: str, on_progress: Optional[ProgressCallback] = None) -> Dict[str, object]:
+    """
+    Concatenate local clips into out_path (written atomically).
+    Returns {"mode": "copy"|"normalized", "normalized": <clips not already in target format>,
+             "transcoded": <clips actually re-encoded now (cache misses)>, "duration": seconds}.
+    """
+    if len(paths) < 2:
+        raise ValueError("Need at least 2 clips")
+    infos = [probe_clip(p) for p in paths]
+    target = _pick_target(infos)  # всё совпадает -> сам клип, mismatched пуст — чистый stream copy
+    mismatched = [i for i, info in enumerate(infos) if info.signature() != target.signature()]
+    transcoded = 0
+
+    out_dir = os.path.dirname(os.path.abspath(out_path))
+    tmp_out = os.path.join(out_dir, f".{os.path.basename(out_path)}.{uuid.uuid4().hex[:8]}.part.mp4")
+    total = sum(infos[i].duration for i in mismatched) or 1.0
+    done_s = 0.0
+    try:
+        with tempfile.TemporaryDirectory() as td:
+            inputs = list(paths)
+            for i in mismatched:
+                base, dur = done_s, infos[i].duration
+
+                def _clip_progress(frac: float, base=base, dur=dur):
+                    if on_progress:
+                        on_progress(min(0.95, (base + frac * dur) / total * 0.95))
+
+                inputs[i], hit = _mezzanine_clip(paths[i], infos[i], target, _clip_progress)
+                transcoded += 0 if hit else 1
+                done_s += dur
+            _concat_copy(inputs, tmp_out, td)
+        os.replace(tmp_out, out_path)
+    finally:
+        if os.path.exists(tmp_out):
+            os.remove(tmp_out)
+    if on_progress:
+        on_progress(1.0)
+    logger.info(
+        "merged clips=%s mode=%s normalized=%s transcoded=%s out=%s",
+        len(paths), "normalized" if mismatched else "copy", len(mismatched), transcoded, os.path.basename(out_path),
+    )
+    return {
+        "mode": "normalized" if mismatched else "copy",
+        "normalized": len(mismatched),
+        "transcoded": transcoded,
+        "duration": round(sum(i.duration for i in infos), 3),
+    }
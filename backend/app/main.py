@@ -6,7 +6,13 @@ from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from app.api.router import api_router
-from app.db.sqlite import init_db
+from app.db.sqlite import close_pool, init_db, pool_stats
+from app.engine.prompt_registry import get_prompt_registry
+from app.engine.provider_poller import get_provider_poller
+from app.core.config import settings
+from app.services.job_scheduler import get_job_scheduler, shutdown_job_scheduler
+from app.services.job_queue import start_job_queue, stop_job_queue
+from app.services.job_events import get_job_event_bus, get_job_state_cache
 
 app = FastAPI(title="PhotoStudio Core API", version="0.2.0")
 
@@ -29,12 +35,26 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
     # Чтобы фронт мог прочитать имя файла при скачивании (Content-Disposition)
-    expose_headers=["Content-Disposition"],
+    # и версию задачи для long-poll (ETag -> If-None-Match)
+    expose_headers=["Content-Disposition", "ETag"],
 )
 
 @app.on_event("startup")
 def _startup():
     init_db()
+    # Промпты lookbook загружаем один раз на старте (дальше — hot-reload по mtime)
+    get_prompt_registry()
+    get_job_scheduler()
+    # durable очередь: подбирает queued-задачи и восстанавливает упавшие (REFUND/перезапуск)
+    start_job_queue()
+
+
+@app.on_event("shutdown")
+def _shutdown():
+    # graceful drain: новые задачи не принимаем, текущие даём доделать
+    stop_job_queue()
+    shutdown_job_scheduler(settings.JOB_DRAIN_SECONDS)
+    close_pool()
 
 
 @app.get("/engine/status")
@@ -44,6 +64,11 @@ def engine_status():
         "engine": "stub",
         "kling_configured": bool(os.getenv("KLING_API_KEY")),
         "veo_configured": bool(os.getenv("VEO_API_KEY")),
+        "jobs": get_job_scheduler().stats(),
+        "providerPoller": get_provider_poller().stats(),
+        "dbPool": pool_stats(),
+        "jobEvents": get_job_event_bus().stats(),
+        "jobStateCache": get_job_state_cache().stats(),
         "time": datetime.now(timezone.utc).isoformat(),
     }
 
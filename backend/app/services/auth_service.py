@@ -1,9 +1,13 @@
 import os
 import uuid
 import hashlib
+import threading
+import time
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
+from app.core.config import settings
 from app.db.sqlite import db
+from app.services.balances import apply_ledger_entry, read_balance
 
 def _now():
     return datetime.utcnow().isoformat() + "Z"
@@ -27,6 +31,7 @@ def create_user(email: str, name: str, password: str) -> Dict[str, Any]:
                 "INSERT INTO users(id,email,name,pwd_hash,pwd_salt,created_at) VALUES(?,?,?,?,?,?)",
                 (uid, email_n, name.strip() or email_n.split("@")[0], pwd_hash, salt.hex(), _now())
             )
+            con.execute("INSERT INTO balances(user_id, balance, updated_at) VALUES(?,?,?)", (uid, 0, _now()))
         except Exception as ex:
             msg = str(ex).lower()
             if "unique" in msg or "constraint" in msg:
@@ -52,24 +57,19 @@ def get_user_by_id(user_id: str) -> Dict[str, Any]:
         row = con.execute("SELECT * FROM users WHERE id = ?", (user_id,)).fetchone()
         if not row:
             raise ValueError("Пользователь не найден")
-        # balance = sum ledger
-        bal_row = con.execute(
-            "SELECT COALESCE(SUM(delta),0) as bal FROM ledger WHERE user_id = ?",
-            (user_id,),
-        ).fetchone()
-        bal = int(bal_row["bal"] or 0)
+        # balance = sum ledger (materialized in balances)
+        bal = read_balance(con, user_id)
 
         # Защита от старых данных: если в БД уже накопился отрицательный баланс
         # (например, из-за прежнего бага/ручных тестов), автоматически выравниваем до 0.
         # Это важно, потому что add_ledger запрещает уходить в минус и дальше система
         # может "заклинить" на отрицательном балансе.
-        if bal < 0:
-            lid = "l_" + uuid.uuid4().hex[:16]
-            con.execute(
-                "INSERT INTO ledger(id,user_id,delta,reason,ref,created_at) VALUES(?,?,?,?,?,?)",
-                (lid, user_id, int(-bal), "AUTO_CORRECTION", "NEGATIVE_BALANCE", _now()),
-            )
+        corrected = bal < 0
+        if corrected:
+            apply_ledger_entry(con, user_id, int(-bal), "AUTO_CORRECTION", "NEGATIVE_BALANCE")
             bal = 0
+    if corrected:
+        invalidate_user(user_id)
     return {
         "id": row["id"],
         "email": row["email"],
@@ -78,29 +78,62 @@ def get_user_by_id(user_id: str) -> Dict[str, Any]:
         "credits": bal,
     }
 
+# Короткоживущий кэш профиля (вместе с балансом) для частых запросов вроде /auth/me.
+# Каждая запись в ledger (add_ledger, AUTO_CORRECTION) сбрасывает запись пользователя после коммита,
+# поэтому собственные списания/пополнения видны сразу; TTL ограничивает прочую устарелость.
+# Поколение пользователя растёт при каждом сбросе: чтение, начатое до сброса, свой
+# (возможно, уже устаревший) результат в кэш не кладёт.
+_profile_cache: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+_profile_gen: Dict[str, int] = {}
+_profile_epoch = 0  # растёт при очистке _profile_gen — незавершённые чтения тоже не кэшируются
+_profile_lock = threading.Lock()
+PROFILE_CACHE_MAX = 10000
+
+def _profile_token(user_id: str) -> Tuple[int, int]:
+    return _profile_epoch, _profile_gen.get(user_id, 0)
+
+def get_user_cached(user_id: str) -> Dict[str, Any]:
+    ttl = max(0, int(settings.USER_CACHE_TTL_SECONDS))
+    now = time.monotonic()
+    with _profile_lock:
+        hit = _profile_cache.get(user_id)
+        if hit and hit[0] > now:
+            return dict(hit[1])
+        token = _profile_token(user_id)
+    user = get_user_by_id(user_id)
+    if ttl:
+        with _profile_lock:
+            if _profile_token(user_id) == token:
+                if len(_profile_cache) >= PROFILE_CACHE_MAX:
+                    _profile_cache.clear()
+                _profile_cache[user_id] = (now + ttl, user)
+    return dict(user)
+
+def invalidate_user(user_id: str):
+    global _profile_epoch
+    with _profile_lock:
+        _profile_cache.pop(user_id, None)
+        _profile_gen[user_id] = _profile_gen.get(user_id, 0) + 1
+        if len(_profile_gen) > PROFILE_CACHE_MAX:
+            _profile_gen.clear()
+            _profile_epoch += 1
+
 def add_ledger(user_id: str, delta: int, reason: str, ref: str = None) -> Dict[str, Any]:
     if not isinstance(delta, int) or delta == 0:
         raise ValueError("delta должен быть целым и не 0")
-    lid = "l_" + uuid.uuid4().hex[:16]
     with db() as con:
         # Запрещаем уходить в минус (никаких "кредитов в долг").
         # BEGIN IMMEDIATE — чтобы параллельные запросы не прошли чек одновременно.
         con.execute("BEGIN IMMEDIATE")
 
-        row = con.execute(
-            "SELECT COALESCE(SUM(delta), 0) AS bal FROM ledger WHERE user_id = ?",
-            (user_id,),
-        ).fetchone()
-        bal = int(row["bal"]) if row is not None else 0
+        bal = read_balance(con, user_id)
         next_bal = bal + int(delta)
         if int(delta) < 0 and next_bal < 0:
             raise ValueError("Недостаточно кредитов")
 
-        con.execute(
-            "INSERT INTO ledger(id,user_id,delta,reason,ref,created_at) VALUES(?,?,?,?,?,?)",
-            (lid, user_id, int(delta), reason, ref, _now())
-        )
-    return {"id": lid}
+        lid = apply_ledger_entry(con, user_id, int(delta), reason, ref)
+    invalidate_user(user_id)
+    return {"id": lid, "balance": next_bal}
 
 def list_ledger(user_id: str, limit: int = 50):
     lim = max(1, min(int(limit or 50), 200))
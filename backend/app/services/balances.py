@@ -0,0 +1,75 @@
+"""
+Materialized user balances: balances.balance == SUM(ledger.delta) for the user.
+
+Баланс читается за O(1) из balances вместо SUM(delta) по всему ledger на каждый запрос.
+Каждая запись в ledger идёт через apply_ledger_entry() в той же транзакции, что и
+изменение balances, поэтому они не расходятся.
+
+Проверка/перестройка:
+  python -m app.services.balances            — показать расхождения
+  python -m app.services.balances --rebuild  — пересчитать balances из ledger
+"""
+import argparse
+import uuid
+from datetime import datetime
+from typing import Dict, List
+from app.db.sqlite import db
+
+def _now():
+    return datetime.utcnow().isoformat() + "Z"
+
+def read_balance(con, user_id: str) -> int:
+    row = con.execute("SELECT balance FROM balances WHERE user_id = ?", (user_id,)).fetchone()
+    return int(row["balance"]) if row else 0
+
+def apply_ledger_entry(con, user_id: str, delta: int, reason: str, ref: str = None) -> str:
+    """Insert a ledger row and move the materialized balance by delta (caller owns the transaction)."""
+    lid = "l_" + uuid.uuid4().hex[:16]
+    now = _now()
+    con.execute(
+        "INSERT INTO ledger(id,user_id,delta,reason,ref,created_at) VALUES(?,?,?,?,?,?)",
+        (lid, user_id, int(delta), reason, ref, now),
+    )
+    con.execute(
+        """INSERT INTO balances(user_id, balance, updated_at) VALUES(?,?,?)
+           ON CONFLICT(user_id) DO UPDATE SET balance = balance + excluded.balance, updated_at = excluded.updated_at""",
+        (user_id, int(delta), now),
+    )
+    return lid
+
+def check_balances() -> List[Dict[str, int]]:
+    """Users whose balances row differs from SUM(ledger.delta)."""
+    with db() as con:
+        rows = con.execute(
+            """SELECT u.id AS user_id,
+                      COALESCE(b.balance, 0) AS balance,
+                      COALESCE((SELECT SUM(l.delta) FROM ledger l WHERE l.user_id = u.id), 0) AS ledger_sum
+               FROM users u LEFT JOIN balances b ON b.user_id = u.id"""
+        ).fetchall()
+    return [dict(r) for r in rows if int(r["balance"]) != int(r["ledger_sum"])]
+
+def rebuild_balances() -> int:
+    """Recompute every balance from the ledger. Returns number of users written."""
+    now = _now()
+    with db() as con:
+        con.execute("BEGIN IMMEDIATE")
+        con.execute("DELETE FROM balances")
+        cur = con.execute(
+            """INSERT INTO balances(user_id, balance, updated_at)
+               SELECT u.id, COALESCE((SELECT SUM(l.delta) FROM ledger l WHERE l.user_id = u.id), 0), ?
+               FROM users u""",
+            (now,),
+        )
+        return cur.rowcount
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Check / rebuild materialized balances from ledger")
+    ap.add_argument("--rebuild", action="store_true", help="recompute balances from ledger")
+    a = ap.parse_args()
+    bad = check_balances()
+    for r in bad:
+        print(f"MISMATCH user={r['user_id']} balance={r['balance']} ledger_sum={r['ledger_sum']}")
+    print(f"mismatches: {len(bad)}")
+    if a.rebuild:
+        n = rebuild_balances()
+        print(f"rebuilt balances for {n} users; mismatches now: {len(check_balances())}")
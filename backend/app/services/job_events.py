@@ -0,0 +1,298 @@
+"""
+In-process pub/sub of job state changes for the push stream (GET /api/jobs/stream).
+
+Каждое изменение строки в lookbook_jobs / scene_jobs / video_jobs (прогресс, результат,
+переходы состояния в job_queue) публикуется подписчикам владельца задачи. Один SSE-поток
+на пользователя покрывает все его задачи, поэтому фронту не нужно опрашивать
+/jobs/{id} каждые 1.5–2 секунды.
+
+  - издатели — потоки воркеров; подписчики — asyncio-очереди в event loop сервера
+    (передача через loop.call_soon_threadsafe);
+  - событие = полный снимок задачи (как в GET /jobs/{id}), поэтому при переполнении
+    очереди медленного клиента старые события можно выбросить без потери состояния;
+  - если у владельца задачи нет подписчиков (и задачу не опрашивают через кэш), строка
+    даже не читается из БД; владельца передаёт писатель (UPDATE ... RETURNING user_id).
+Шина живёт в процессе: при нескольких процессах uvicorn клиент получает события только
+от задач, выполняемых процессом, к которому он подключён (остальное — fallback-опрос).
+
+JobStateCache — последнее состояние задачи в памяти для GET /<kind>/jobs/{id}
+(ETag / 304 / long-poll) без SQLite и JSON-декода result на каждый опрос. Запись из
+этого процесса обновляет кэш сразу; записи других процессов видны не позже
+JOB_CACHE_TTL_SECONDS.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Set
+
+from app.db.sqlite import db
+
+logger = logging.getLogger(__name__)
+
+# table -> kind в событиях и URL (/api/<kind>/jobs/{id})
+JOB_KINDS: Dict[str, str] = {
+    "lookbook_jobs": "lookbook",
+    "scene_jobs": "scene",
+    "video_jobs": "video",
+}
+
+JOB_COLUMNS: Dict[str, str] = {
+    "lookbook_jobs": "job_id, user_id, mode, state, progress, result_json, error, spent, created_at, updated_at",
+    "scene_jobs": "job_id, user_id, kind, action, state, progress, result_json, error, created_at, updated_at",
+    "video_jobs": "job_id, user_id, action, state, progress, result_json, error, spent, created_at, updated_at",
+}
+
+SUBSCRIBER_QUEUE_MAX = 64
+JOB_CACHE_TTL_SECONDS = 5.0
+JOB_CACHE_MAX = 5000
+
+
+def job_from_row(row) -> Dict[str, Any]:
+    """Row of a *_jobs table -> API job dict (result_json parsed into result)."""
+    out = dict(row)
+    try:
+        out["result"] = json.loads(out.get("result_json") or "null")
+    except Exception:
+        out["result"] = None
+    out.pop("result_json", None)
+    return out
+
+
+class JobSubscription:
+    def __init__(self, user_id: str, loop: asyncio.AbstractEventLoop):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_MAX)
+        self.dropped = 0
+
+    def _put(self, event: Dict[str, Any]):
+        # вызывается в event loop подписчика
+        if self.queue.full():
+            try:
+                self.queue.get_nowait()
+                self.dropped += 1
+            except asyncio.QueueEmpty:
+                pass
+        self.queue.put_nowait(event)
+
+    async def get(self, timeout: float) -> Optional[Dict[str, Any]]:
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class JobEventBus:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs: Dict[str, Set[JobSubscription]] = {}
+        self.published = 0
+
+    def subscribe(self, user_id: str) -> JobSubscription:
+        """Must be called from the event loop that will consume the subscription."""
+        sub = JobSubscription(user_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subs.setdefault(user_id, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: JobSubscription):
+        with self._lock:
+            subs = self._subs.get(sub.user_id)
+            if subs is not None:
+                subs.discard(sub)
+                if not subs:
+                    self._subs.pop(sub.user_id, None)
+
+    def has_subscribers(self, user_id: Optional[str] = None) -> bool:
+        with self._lock:
+            return bool(self._subs.get(user_id)) if user_id else bool(self._subs)
+
+    def publish(self, user_id: str, event: Dict[str, Any]):
+        with self._lock:
+            subs = list(self._subs.get(user_id) or ())
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub._put, event)
+            except RuntimeError:
+                # loop закрыт (остановка сервера) — подписчик больше не читает
+                self.unsubscribe(sub)
+        if subs:
+            self.published += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "users": len(self._subs),
+                "subscribers": sum(len(s) for s in self._subs.values()),
+                "published": self.published,
+            }
+
+
+_BUS: Optional[JobEventBus] = None
+_BUS_LOCK = threading.Lock()
+
+
+def get_job_event_bus() -> JobEventBus:
+    global _BUS
+    if _BUS is None:
+        with _BUS_LOCK:
+            if _BUS is None:
+                _BUS = JobEventBus()
+    return _BUS
+
+
+@dataclass(frozen=True)
+class JobState:
+    table: str
+    user_id: str
+    job: Dict[str, Any]
+    etag: str
+    loaded_at: float
+
+
+def job_etag(job: Dict[str, Any]) -> str:
+    raw = f"{job.get('job_id')}|{job.get('updated_at')}|{job.get('state')}|{job.get('progress')}"
+    return '"' + hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20] + '"'
+
+
+class JobStateCache:
+    """LRU of the latest job states keyed by job_id."""
+
+    def __init__(self, max_items: int = JOB_CACHE_MAX, ttl: float = JOB_CACHE_TTL_SECONDS):
+        self._lock = threading.Lock()
+        self._items: "OrderedDict[str, JobState]" = OrderedDict()
+        self.max_items = max_items
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+
+    def contains(self, job_id: str) -> bool:
+        with self._lock:
+            return job_id in self._items
+
+    def owner(self, job_id: str) -> Optional[str]:
+        """user_id of a cached job regardless of freshness (owner never changes)."""
+        with self._lock:
+            st = self._items.get(job_id)
+            return st.user_id if st is not None else None
+
+    def get(self, table: str, job_id: str) -> Optional[JobState]:
+        """Cached state if it is fresh enough, else None (caller loads)."""
+        with self._lock:
+            st = self._items.get(job_id)
+            if st is None or st.table != table or time.monotonic() - st.loaded_at > self.ttl:
+                self.misses += 1
+                return None
+            self._items.move_to_end(job_id)
+            self.hits += 1
+            return st
+
+    def put(self, table: str, row) -> JobState:
+        job = job_from_row(row)
+        st = JobState(table, job["user_id"], job, job_etag(job), time.monotonic())
+        with self._lock:
+            self._items[st.job["job_id"]] = st
+            self._items.move_to_end(st.job["job_id"])
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return st
+
+    def load(self, table: str, job_id: str) -> Optional[JobState]:
+        with db() as con:
+            row = con.execute(f"SELECT {JOB_COLUMNS[table]} FROM {table} WHERE job_id=?", (job_id,)).fetchone()
+        if row is None:
+            with self._lock:
+                self._items.pop(job_id, None)
+            return None
+        return self.put(table, row)
+
+    def get_or_load(self, table: str, job_id: str) -> Optional[JobState]:
+        return self.get(table, job_id) or self.load(table, job_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"items": len(self._items), "hits": self.hits, "misses": self.misses}
+
+
+_CACHE: Optional[JobStateCache] = None
+
+
+def get_job_state_cache() -> JobStateCache:
+    global _CACHE
+    if _CACHE is None:
+        with _BUS_LOCK:
+            if _CACHE is None:
+                _CACHE = JobStateCache()
+    return _CACHE
+
+
+def publish_job(table: str, job_id: str, user_id: Optional[str] = None):
+    """
+    Refresh the cached state after a write and push it to the owner's subscribers (never raises).
+    user_id — владелец задачи, если он известен писателю (иначе берётся из кэша состояний).
+    """
+    if not job_id or table not in JOB_KINDS:
+        return
+    bus = get_job_event_bus()
+    cache = get_job_state_cache()
+    owner = user_id or cache.owner(job_id)
+    # никто не смотрит на задачу (ни поток владельца, ни опрос через кэш) — не читаем строку
+    watched = bus.has_subscribers(owner) if owner else bus.has_subscribers()
+    if not watched and not cache.contains(job_id):
+        return
+    try:
+        st = cache.load(table, job_id)
+        if st is None or not bus.has_subscribers(st.user_id):
+            return
+        bus.publish(st.user_id, {"kind": JOB_KINDS[table], "job": st.job})
+    except Exception:
+        logger.exception("job event publish failed table=%s job_id=%s", table, job_id)
+
+
+def active_jobs(user_id: str, job_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Snapshot for a new stream: the user's queued/running jobs plus explicitly requested ids."""
+    ids = [str(j) for j in (job_ids or []) if j][:50]
+    out: List[Dict[str, Any]] = []
+    with db() as con:
+        for table, kind in JOB_KINDS.items():
+            where = "state IN ('queued','running')"
+            params: list = [user_id]
+            if ids:
+                where = f"({where} OR job_id IN ({','.join('?' for _ in ids)}))"
+                params += ids
+            rows = con.execute(
+                f"SELECT {JOB_COLUMNS[table]} FROM {table} WHERE user_id=? AND {where}",
+                tuple(params),
+            ).fetchall()
+            out += [{"kind": kind, "job": job_from_row(r)} for r in rows]
+    return out
+
+
+JOB_STATUS_MAX_IDS = 100
+
+
+def job_statuses(user_id: str, job_ids: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """
+    Compact state of many jobs across all job tables in one query (UNION ALL, каждая ветка —
+    по PK job_id или по индексу (user_id, state)). Без ids — все queued/running задачи пользователя.
+    """
+    ids = list(dict.fromkeys(str(j) for j in (job_ids or []) if j))[:JOB_STATUS_MAX_IDS]
+    if ids:
+        where = f"job_id IN ({','.join('?' for _ in ids)}) AND user_id=?"
+        params: list = [*ids, user_id]
+    else:
+        where = "user_id=? AND state IN ('queued','running')"
+        params = [user_id]
+    sql = " UNION ALL ".join(
+        f"SELECT job_id, '{kind}' AS kind, state, progress, error, updated_at FROM {table} WHERE {where}"
+        for table, kind in JOB_KINDS.items()
+    )
+    with db() as con:
+        rows = con.execute(sql, tuple(params * len(JOB_KINDS))).fetchall()
+    # те же имена полей, что в job dict GET /<kind>/jobs/{id} и событиях потока
+    return [dict(r) for r in rows]
@@ -0,0 +1,277 @@
+"""
+Durable job queue on top of lookbook_jobs / scene_jobs / video_jobs.
+
+Строка задачи хранит handler + payload_json, поэтому задачу может выполнить любой
+процесс, а не только тот поток, который её создал:
+  - воркер забирает строку атомарно (lease_owner/lease_until, state -> running);
+  - пока задача идёт, lease продлевается (heartbeat) фоновым потоком обслуживания;
+  - если lease протух (процесс упал/перезапущен), списанные кредиты возвращаются
+    записью REFUND, а задача снова ставится в очередь (до JOB_MAX_ATTEMPTS) или
+    завершается ошибкой;
+  - строки в state=queued подбирает любой живой процесс.
+Исполнение идёт через общий JobScheduler (лимиты на пользователя/очередь сохраняются).
+Handler может вернуть Future (ожидание внешнего провайдера): воркер пула тогда сразу
+свободен, а задача остаётся «своей» (heartbeat, lease) до выполнения Future.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Optional, Set, Tuple
+from app.core.config import settings
+from app.db.sqlite import db
+from app.services.auth_service import add_ledger
+from app.services.job_events import publish_job
+from app.services.job_scheduler import get_job_scheduler, SchedulerBusy
+
+logger = logging.getLogger(__name__)
+
+# table -> есть ли колонка spent (списанные кредиты, которые надо вернуть при сбое)
+JOB_TABLES: Dict[str, bool] = {
+    "lookbook_jobs": True,
+    "scene_jobs": False,
+    "video_jobs": True,
+}
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+@dataclass(frozen=True)
+class JobHandler:
+    run: Callable[[str, str, Dict[str, Any]], Any]                   # (job_id, user_id, payload) -> None | Future
+    on_abandon: Optional[Callable[[str, str, Dict[str, Any]], None]] = None  # cleanup when failed by recovery
+
+_HANDLERS: Dict[str, JobHandler] = {}
+
+_local_lock = threading.Lock()
+_local_pending: Set[Tuple[str, str]] = set()
+_local_running: Set[Tuple[str, str]] = set()
+
+_maint_stop = threading.Event()
+_maint_thread: Optional[threading.Thread] = None
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+def _check_table(table: str):
+    if table not in JOB_TABLES:
+        raise ValueError(f"Unknown job table: {table}")
+
+def register_handler(name: str, run: Callable[[str, str, Dict[str, Any]], Any], on_abandon: Optional[Callable[[str, str, Dict[str, Any]], None]] = None):
+    _HANDLERS[name] = JobHandler(run=run, on_abandon=on_abandon)
+
+def enqueue(table: str, job_id: str, user_id: str, handler: str, payload: Dict[str, Any]) -> None:
+    """Attach handler + payload to an existing queued job row and hand it to the workers. Raises SchedulerBusy."""
+    _check_table(table)
+    if handler not in _HANDLERS:
+        raise ValueError(f"Unknown job handler: {handler}")
+    with db() as con:
+        con.execute(
+            f"UPDATE {table} SET handler=?, payload_json=?, updated_at=? WHERE job_id=?",
+            (handler, json.dumps(payload, ensure_ascii=False), _now_iso(), job_id),
+        )
+    submit(table, job_id, user_id)
+
+def submit(table: str, job_id: str, user_id: str) -> None:
+    """Hand a queued job row to the local worker pool. Raises SchedulerBusy (429/503)."""
+    _check_table(table)
+    key = (table, job_id)
+    with _local_lock:
+        if key in _local_pending or key in _local_running:
+            return
+        _local_pending.add(key)
+    try:
+        get_job_scheduler().submit(user_id, _execute, table, job_id)
+    except SchedulerBusy:
+        with _local_lock:
+            _local_pending.discard(key)
+        raise
+
+def _claim(table: str, job_id: str):
+    now = time.time()
+    names = list(_HANDLERS)
+    if not names:
+        return None
+    marks = ",".join("?" for _ in names)
+    with db() as con:
+        cur = con.execute(
+            f"""UPDATE {table} SET state='running', lease_owner=?, lease_until=?, heartbeat_at=?,
+                attempts=attempts+1, updated_at=?
+                WHERE job_id=? AND state='queued' AND handler IN ({marks})
+                AND (lease_until IS NULL OR lease_until<?)""",
+            (WORKER_ID, now + settings.JOB_LEASE_SECONDS, now, _now_iso(), job_id, *names, now),
+        )
+        if cur.rowcount != 1:
+            return None
+        return con.execute(
+            f"SELECT user_id, handler, payload_json FROM {table} WHERE job_id=?",
+            (job_id,),
+        ).fetchone()
+
+def _execute(table: str, job_id: str):
+    key = (table, job_id)
+    with _local_lock:
+        _local_pending.discard(key)
+    row = _claim(table, job_id)
+    if row is None:
+        return  # уже забрал другой воркер/процесс
+    publish_job(table, job_id, row["user_id"])
+    with _local_lock:
+        _local_running.add(key)
+    try:
+        payload = json.loads(row["payload_json"] or "{}")
+        pending = _HANDLERS[row["handler"]].run(job_id, row["user_id"], payload)
+    except Exception as e:
+        _fail(table, job_id, e)
+        _release(table, job_id)
+        return
+    if isinstance(pending, Future):
+        # handler ждёт провайдера без потока: воркер свободен, lease продлевается до конца Future
+        pending.add_done_callback(lambda f: _finish_detached(table, job_id, f))
+    else:
+        _release(table, job_id)
+
+def _finish_detached(table: str, job_id: str, fut: Future):
+    try:
+        exc = fut.exception()
+        if exc is not None:
+            _fail(table, job_id, exc)
+    finally:
+        _release(table, job_id)
+
+def _fail(table: str, job_id: str, e: BaseException):
+    logger.error("job handler failed table=%s job_id=%s", table, job_id, exc_info=e)
+    with db() as con:
+        row = con.execute(
+            f"UPDATE {table} SET state='error', error=?, updated_at=? WHERE job_id=? AND state IN ('queued','running') RETURNING user_id",
+            (str(e), _now_iso(), job_id),
+        ).fetchone()
+    if row is not None:
+        publish_job(table, job_id, row["user_id"])
+
+def _release(table: str, job_id: str):
+    with _local_lock:
+        _local_running.discard((table, job_id))
+    with db() as con:
+        con.execute(
+            f"UPDATE {table} SET lease_owner=NULL, lease_until=NULL WHERE job_id=? AND lease_owner=?",
+            (job_id, WORKER_ID),
+        )
+
+def _heartbeat():
+    with _local_lock:
+        running = list(_local_running)
+    if not running:
+        return
+    now = time.time()
+    with db() as con:
+        for table, job_id in running:
+            con.execute(
+                f"UPDATE {table} SET lease_until=?, heartbeat_at=? WHERE job_id=? AND lease_owner=?",
+                (now + settings.JOB_LEASE_SECONDS, now, job_id, WORKER_ID),
+            )
+
+def _recover_table(table: str):
+    """Running jobs whose lease expired (worker died) -> REFUND + re-queue or fail."""
+    has_spent = JOB_TABLES[table]
+    now = time.time()
+    # queued без handler: строка старого формата или процесс упал между созданием задачи и enqueue
+    stale_iso = datetime.fromtimestamp(now - settings.JOB_LEASE_SECONDS, timezone.utc).isoformat()
+    spent_col = "spent" if has_spent else "0 AS spent"
+    with db() as con:
+        rows = con.execute(
+            f"""SELECT job_id, user_id, handler, payload_json, attempts, {spent_col} FROM {table}
+                WHERE (state='running' AND (lease_until IS NULL OR lease_until<?))
+                   OR (state='queued' AND handler IS NULL AND updated_at<?)""",
+            (now, stale_iso),
+        ).fetchall()
+    for r in rows:
+        job_id = r["job_id"]
+        with _local_lock:
+            if (table, job_id) in _local_running:
+                continue  # наша задача — lease продлит heartbeat
+        handler = _HANDLERS.get(r["handler"] or "")
+        attempts = int(r["attempts"] or 0)
+        requeue = handler is not None and attempts < max(1, settings.JOB_MAX_ATTEMPTS)
+        sets = ["lease_owner=NULL", "lease_until=NULL", "updated_at=?"]
+        vals: list = [_now_iso()]
+        if requeue:
+            sets += ["state='queued'", "progress=0", "error=NULL"]
+        else:
+            sets += ["state='error'", "error=?"]
+            vals.append("Задача прервана перезапуском сервера. Кредиты возвращены.")
+        if has_spent:
+            sets.append("spent=0")
+        # compare-and-swap: только один процесс обработает протухшую задачу (и вернёт кредиты)
+        with db() as con:
+            cur = con.execute(
+                f"""UPDATE {table} SET {', '.join(sets)}
+                    WHERE job_id=? AND attempts=? AND state IN ('queued','running')
+                    AND (lease_until IS NULL OR lease_until<?)""",
+                (*vals, job_id, attempts, now),
+            )
+            if cur.rowcount != 1:
+                continue
+        publish_job(table, job_id, r["user_id"])
+        spent = int(r["spent"] or 0)
+        if spent > 0:
+            try:
+                add_ledger(r["user_id"], spent, "REFUND", ref=f"JOB_RECOVERY:{table}:{job_id}:{attempts}")
+            except Exception:
+                logger.exception("job recovery refund failed table=%s job_id=%s", table, job_id)
+        logger.warning("recovered job table=%s job_id=%s attempts=%s -> %s", table, job_id, attempts, "queued" if requeue else "error")
+        if not requeue and handler is not None and handler.on_abandon:
+            try:
+                handler.on_abandon(job_id, r["user_id"], json.loads(r["payload_json"] or "{}"))
+            except Exception:
+                logger.exception("job on_abandon failed table=%s job_id=%s", table, job_id)
+
+def _pickup_table(table: str):
+    """Queued rows nobody is working on (e.g. accepted by a process that then died) -> local pool."""
+    names = list(_HANDLERS)
+    if not names:
+        return
+    marks = ",".join("?" for _ in names)
+    with db() as con:
+        rows = con.execute(
+            f"""SELECT job_id, user_id FROM {table}
+                WHERE state='queued' AND handler IN ({marks}) AND (lease_until IS NULL OR lease_until<?)
+                ORDER BY created_at LIMIT 50""",
+            (*names, time.time()),
+        ).fetchall()
+    for r in rows:
+        try:
+            submit(table, r["job_id"], r["user_id"])
+        except SchedulerBusy:
+            continue
+
+def run_maintenance_once():
+    _heartbeat()
+    for table in JOB_TABLES:
+        _recover_table(table)
+        _pickup_table(table)
+
+def _maintenance_loop():
+    while not _maint_stop.is_set():
+        try:
+            run_maintenance_once()
+        except Exception:
+            logger.exception("job queue maintenance failed")
+        _maint_stop.wait(max(1.0, float(settings.JOB_QUEUE_POLL_SECONDS)))
+
+def start_job_queue():
+    global _maint_thread
+    if _maint_thread is not None and _maint_thread.is_alive():
+        return
+    _maint_stop.clear()
+    _maint_thread = threading.Thread(target=_maintenance_loop, name="job-queue-maintenance", daemon=True)
+    _maint_thread.start()
+
+def stop_job_queue():
+    """Stop picking up new rows. Running jobs keep their lease until the scheduler drains them."""
+    _maint_stop.set()
@@ -0,0 +1,126 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+class SchedulerBusy(Exception):
+    """Job was not accepted: per-user limit (429) or global queue full / shutting down (503)."""
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+class JobScheduler:
+    """
+    Фиксированный пул воркеров для долгих задач (lookbook/scene/...) вместо
+    threading.Thread на каждый запрос:
+      - одновременно выполняется не больше `workers` задач (глобальный лимит);
+      - у пользователя не больше `per_user` задач в очереди+работе (иначе 429);
+      - ожидающих свободного воркера не больше `max_queue` задач (иначе 503);
+      - shutdown() перестаёт принимать задачи и дожидается уже принятых.
+    """
+
+    def __init__(self, workers: int, max_queue: int, per_user: int, retry_after: int):
+        self.workers = max(1, int(workers))
+        self.max_queue = max(1, int(max_queue))
+        self.per_user = max(1, int(per_user))
+        self.retry_after = max(1, int(retry_after))
+        self._q: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._user_jobs: Dict[str, int] = {}
+        self._queued = 0
+        self._running = 0
+        self._closed = False
+        self._threads = []
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"job-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, user_id: str, fn: Callable[..., Any], *args, **kwargs) -> None:
+        with self._lock:
+            if self._closed:
+                raise SchedulerBusy("Сервер перезапускается. Попробуй чуть позже.", 503, self.retry_after)
+            if self._user_jobs.get(user_id, 0) >= self.per_user:
+                raise SchedulerBusy("Слишком много задач одновременно. Дождись завершения текущих.", 429, self.retry_after)
+            # свободные воркеры заберут задачу сразу; max_queue — сколько может ждать сверх них
+            if self._queued + self._running >= self.workers + self.max_queue:
+                raise SchedulerBusy("Сервер перегружен. Попробуй чуть позже.", 503, self.retry_after)
+            self._user_jobs[user_id] = self._user_jobs.get(user_id, 0) + 1
+            self._queued += 1
+        self._q.put((user_id, fn, args, kwargs))
+
+    def _worker(self):
+        while True:
+            item = self._q.get()
+            if item is None:
+                self._q.task_done()
+                return
+            user_id, fn, args, kwargs = item
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+            try:
+                fn(*args, **kwargs)
+            except Exception:
+                logger.exception("background job failed user_id=%s", user_id)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    left = self._user_jobs.get(user_id, 1) - 1
+                    if left > 0:
+                        self._user_jobs[user_id] = left
+                    else:
+                        self._user_jobs.pop(user_id, None)
+                self._q.task_done()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "running": self._running,
+                "queued": self._queued,
+                "maxQueue": self.max_queue,
+                "users": len(self._user_jobs),
+            }
+
+    def shutdown(self, timeout: float = 30.0) -> bool:
+        """Graceful drain: stop accepting jobs, let queued/running ones finish. True if drained in time."""
+        with self._lock:
+            if self._closed:
+                return True
+            self._closed = True
+        deadline = time.monotonic() + max(0.0, float(timeout))
+        # sentinels go after already queued jobs (FIFO) — workers exit once the queue is drained
+        for _ in self._threads:
+            self._q.put(None)
+        for t in self._threads:
+            t.join(max(0.0, deadline - time.monotonic()))
+        drained = not any(t.is_alive() for t in self._threads)
+        if not drained:
+            logger.warning("job scheduler drain timeout: %s", self.stats())
+        return drained
+
+_SCHEDULER: Optional[JobScheduler] = None
+_SCHEDULER_LOCK = threading.Lock()
+
+def get_job_scheduler() -> JobScheduler:
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = JobScheduler(
+                workers=settings.JOB_WORKERS,
+                max_queue=settings.JOB_QUEUE_MAX,
+                per_user=settings.JOB_PER_USER_MAX,
+                retry_after=settings.JOB_RETRY_AFTER_SECONDS,
+            )
+        return _SCHEDULER
+
+def shutdown_job_scheduler(timeout: float) -> bool:
+    with _SCHEDULER_LOCK:
+        sch = _SCHEDULER
+    return sch.shutdown(timeout) if sch is not None else True
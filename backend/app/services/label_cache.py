@@ -0,0 +1,41 @@
+from datetime import datetime, timedelta
+from typing import Optional
+from app.core.config import settings
+from app.db.sqlite import db
+
+def _now():
+    return datetime.utcnow().isoformat() + "Z"
+
+def _cutoff() -> str:
+    return (datetime.utcnow() - timedelta(days=max(1, int(settings.LABEL_CACHE_TTL_DAYS)))).isoformat() + "Z"
+
+def get_label(content_hash: str, model: str) -> Optional[str]:
+    """Cached garment label for (image hash, vision model), or None if missing/expired."""
+    with db() as con:
+        row = con.execute(
+            "SELECT label FROM garment_labels WHERE content_hash=? AND model=? AND created_at>=?",
+            (content_hash, model, _cutoff()),
+        ).fetchone()
+        if not row:
+            return None
+        con.execute(
+            "UPDATE garment_labels SET last_used_at=? WHERE content_hash=? AND model=?",
+            (_now(), content_hash, model),
+        )
+    return row["label"]
+
+def put_label(content_hash: str, model: str, label: str):
+    now = _now()
+    with db() as con:
+        con.execute(
+            "INSERT OR REPLACE INTO garment_labels(content_hash,model,label,created_at,last_used_at) VALUES(?,?,?,?,?)",
+            (content_hash, model, label, now, now),
+        )
+        # eviction: протухшие по TTL + самые давно не используемые сверх лимита
+        con.execute("DELETE FROM garment_labels WHERE created_at<?", (_cutoff(),))
+        con.execute(
+            """DELETE FROM garment_labels WHERE rowid IN (
+                SELECT rowid FROM garment_labels ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+            )""",
+            (max(1, int(settings.LABEL_CACHE_MAX_ROWS)),),
+        )
@@ -0,0 +1,394 @@
+"""
+Lookbook sessions stored as rows instead of one JSON blob per (user_id, mode).
+
+  lookbook_sessions — заголовок сессии: format, created_at, updated_at (data — legacy, '{}');
+  lookbook_cards    — одна строка на карточку (slot), data = JSON этой карточки;
+  lookbook_results  — одна строка на результат по порядку (idx), url/slot_index + JSON элемента;
+  lookbook_runs     — lock фотосессии и jobId: захват/снятие lock — один UPDATE без JSON.
+
+Правка одной карточки или переключение lock больше не читает/пишет всю сессию.
+Все функции работают на переданном соединении — транзакцией управляет вызывающий (db()).
+
+Оптимистичная конкуренция: у каждой карточки свой version, у заголовка сессии — version
+для format/results. Изменение с устаревшим version -> VersionConflict (в API — 409),
+правки разных карточек из двух вкладок друг другу не мешают.
+"""
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+DEFAULT_FORMAT = "1:1"  # 1:1 | 16:9 | 9:16
+CARD_LABELS = [
+    "ПЕРЕД", "ПРАВЫЙ БОК", "ЛЕВЫЙ БОК",
+    "СПИНА", "ТКАНЬ / МАТЕРИАЛ", "ДЕТАЛИРОВКА 1",
+    "ДЕТАЛИРОВКА 2", "ЛОГОТИП",
+]
+
+
+class VersionConflict(Exception):
+    """Expected version does not match the stored one; `current` is the server state to resync from."""
+
+    def __init__(self, message: str, current: Dict[str, Any]):
+        super().__init__(message)
+        self.current = current
+
+
+def _now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def default_cards() -> List[Dict[str, Any]]:
+    # 8 карточек: 1..7 вещи/детали, 8 логотип
+    cards = []
+    for i, label in enumerate(CARD_LABELS):
+        if i == 7:
+            cards.append({"slot": 8, "type": "logo", "label": label, "refUrl": None, "logoKind": "print"})  # print | embroidery | patch
+        else:
+            cards.append({"slot": i + 1, "type": "shot", "label": label, "refUrl": None, "camera": "front", "pose": "classic"})
+    return cards
+
+
+def validate_cards(cards: List[Any]) -> List[Tuple[int, Dict[str, Any]]]:
+    """
+    (slot, card) pairs in the given order. Карточка без slot получает позицию+1;
+    не-объект, slot не целое >= 1 или повтор slot -> ValueError (в API — 400), а не тихая потеря.
+    """
+    out: List[Tuple[int, Dict[str, Any]]] = []
+    seen = set()
+    for pos, card in enumerate(cards or []):
+        if not isinstance(card, dict):
+            raise ValueError(f"cards[{pos}] must be an object")
+        slot = card.get("slot", pos + 1)
+        if isinstance(slot, bool) or not isinstance(slot, int) or slot < 1:
+            raise ValueError(f"cards[{pos}].slot must be a positive integer")
+        if slot in seen:
+            raise ValueError(f"Duplicate card slot {slot}")
+        seen.add(slot)
+        out.append((slot, card))
+    return out
+
+
+def _legacy_cards(cards: Any) -> List[Dict[str, Any]]:
+    # старые blob-сессии уже лежат в БД: отклонить нельзя, поэтому битое отбрасываем (первый slot выигрывает)
+    if not isinstance(cards, list):
+        return default_cards()
+    out, seen = [], set()
+    for pos, card in enumerate(cards):
+        if not isinstance(card, dict):
+            continue
+        slot = card.get("slot", pos + 1)
+        if isinstance(slot, bool) or not isinstance(slot, int) or slot < 1 or slot in seen:
+            continue
+        seen.add(slot)
+        out.append({**card, "slot": slot})
+    return out
+
+
+def ensure_session(con, user_id: str, mode: str) -> bool:
+    """Create the session with default cards if it does not exist. Returns True if created."""
+    now = _now_iso()
+    cur = con.execute(
+        """INSERT OR IGNORE INTO lookbook_sessions(user_id, mode, data, format, normalized, created_at, updated_at)
+           VALUES(?,?,'{}',?,1,?,?)""",
+        (user_id, mode, DEFAULT_FORMAT, now, now),
+    )
+    if cur.rowcount != 1:
+        return False
+    replace_cards(con, user_id, mode, default_cards(), now=now)
+    return True
+
+
+def touch(con, user_id: str, mode: str, now: Optional[str] = None):
+    con.execute(
+        "UPDATE lookbook_sessions SET updated_at=? WHERE user_id=? AND mode=?",
+        (now or _now_iso(), user_id, mode),
+    )
+
+
+def check_session_version(con, user_id: str, mode: str, expected: Optional[int]):
+    """Raise VersionConflict if expected is given and the header version moved on."""
+    if expected is None:
+        return
+    row = con.execute(
+        "SELECT format, version FROM lookbook_sessions WHERE user_id=? AND mode=?", (user_id, mode)
+    ).fetchone()
+    if row is not None and int(row["version"]) != expected:
+        raise VersionConflict(
+            "Session was changed by another request",
+            {"version": int(row["version"]), "format": row["format"] or DEFAULT_FORMAT},
+        )
+
+
+def bump_version(con, user_id: str, mode: str) -> int:
+    """Increment the session version; returns the new one (0 if there is no session row)."""
+    con.execute(
+        "UPDATE lookbook_sessions SET version=version+1, updated_at=? WHERE user_id=? AND mode=?",
+        (_now_iso(), user_id, mode),
+    )
+    row = con.execute("SELECT version FROM lookbook_sessions WHERE user_id=? AND mode=?", (user_id, mode)).fetchone()
+    return int(row["version"]) if row else 0
+
+
+def set_format(con, user_id: str, mode: str, fmt: str):
+    con.execute(
+        "UPDATE lookbook_sessions SET format=?, updated_at=? WHERE user_id=? AND mode=?",
+        (fmt, _now_iso(), user_id, mode),
+    )
+
+
+def _check_card_versions(con, user_id: str, mode: str, incoming: Dict[int, str], expected: Dict[Any, Any]):
+    """
+    Every card the replace would change or delete must still have the version the client saw
+    (cardVersions из GET); карточка, которой клиент не видел, тоже конфликт.
+    """
+    try:
+        seen = {int(k): int(v) for k, v in (expected or {}).items()}
+    except (TypeError, ValueError):
+        raise ValueError("cardVersions must map slot -> integer version")
+    stored = {
+        r["slot"]: (r["data"], int(r["version"]))
+        for r in con.execute(
+            "SELECT slot, data, version FROM lookbook_cards WHERE user_id=? AND mode=?", (user_id, mode)
+        ).fetchall()
+    }
+    stale = [
+        slot for slot, (data, version) in stored.items()
+        if incoming.get(slot) != data and seen.get(slot) != version
+    ]
+    stale += [slot for slot in incoming if slot not in stored and slot in seen]
+    if stale:
+        raise VersionConflict(
+            f"Cards {sorted(stale)} were changed by another request",
+            {"cardVersions": {str(slot): version for slot, (_, version) in stored.items()}},
+        )
+
+
+def replace_cards(
+    con,
+    user_id: str,
+    mode: str,
+    cards: List[Any],
+    now: Optional[str] = None,
+    expected_versions: Optional[Dict[Any, Any]] = None,
+):
+    """
+    Store cards in the given order (pos); raises ValueError for invalid/duplicate slots (see validate_cards).
+    With expected_versions ({slot: version}) raises VersionConflict instead of overwriting newer cards.
+    """
+    # upsert вместо DELETE+INSERT: version изменённой карточки растёт, а не сбрасывается в 1
+    now = now or _now_iso()
+    rows = [
+        (user_id, mode, slot, pos, json.dumps(card, ensure_ascii=False), now)
+        for pos, (slot, card) in enumerate(validate_cards(cards))
+    ]
+    if expected_versions is not None:
+        _check_card_versions(con, user_id, mode, {r[2]: r[4] for r in rows}, expected_versions)
+    slots = [r[2] for r in rows]
+    con.execute(
+        f"DELETE FROM lookbook_cards WHERE user_id=? AND mode=? AND slot NOT IN ({','.join('?' for _ in slots)})",
+        (user_id, mode, *slots),
+    )
+    con.executemany(
+        """INSERT INTO lookbook_cards(user_id, mode, slot, pos, data, updated_at) VALUES(?,?,?,?,?,?)
+           ON CONFLICT(user_id, mode, slot) DO UPDATE SET
+             pos=excluded.pos, data=excluded.data, updated_at=excluded.updated_at,
+             version=lookbook_cards.version+(lookbook_cards.data<>excluded.data)
+           WHERE lookbook_cards.data<>excluded.data OR lookbook_cards.pos IS NOT excluded.pos""",
+        rows,
+    )
+
+
+def patch_card(con, user_id: str, mode: str, slot: int, fields: Dict[str, Any], expected: int) -> Dict[str, Any]:
+    """
+    Merge `fields` into one card if its version is still `expected`.
+    Returns {"slot", "card", "version"}; raises KeyError for an unknown slot, VersionConflict otherwise.
+    """
+    row = con.execute(
+        "SELECT data, version FROM lookbook_cards WHERE user_id=? AND mode=? AND slot=?",
+        (user_id, mode, slot),
+    ).fetchone()
+    if row is None:
+        raise KeyError(slot)
+    card = json.loads(row["data"])
+    if int(row["version"]) != expected:
+        raise VersionConflict("Card was changed by another request", {"slot": slot, "card": card, "version": int(row["version"])})
+    merged = {**card, **fields, "slot": slot}
+    if merged == card:
+        return {"slot": slot, "card": card, "version": expected}
+    now = _now_iso()
+    # WHERE version=? — параллельный запрос между SELECT и UPDATE тоже даёт конфликт
+    cur = con.execute(
+        """UPDATE lookbook_cards SET data=?, version=version+1, updated_at=?
+           WHERE user_id=? AND mode=? AND slot=? AND version=?""",
+        (json.dumps(merged, ensure_ascii=False), now, user_id, mode, slot, expected),
+    )
+    if cur.rowcount != 1:
+        row = con.execute(
+            "SELECT data, version FROM lookbook_cards WHERE user_id=? AND mode=? AND slot=?",
+            (user_id, mode, slot),
+        ).fetchone()
+        raise VersionConflict("Card was changed by another request", {"slot": slot, "card": json.loads(row["data"]), "version": int(row["version"])})
+    touch(con, user_id, mode, now=now)
+    return {"slot": slot, "card": merged, "version": expected + 1}
+
+
+def replace_results(con, user_id: str, mode: str, results: List[Any]):
+    # элемент результата — строка url или {"slotIndex", "url", ...}; храним как есть + url/slot для выборок
+    con.execute("DELETE FROM lookbook_results WHERE user_id=? AND mode=?", (user_id, mode))
+    rows = []
+    for idx, r in enumerate(results or []):
+        url = r if isinstance(r, str) else (r.get("url") if isinstance(r, dict) else None)
+        slot = r.get("slotIndex") if isinstance(r, dict) else None
+        rows.append((user_id, mode, idx, url, slot if isinstance(slot, int) else None, json.dumps(r, ensure_ascii=False)))
+    con.executemany(
+        "INSERT INTO lookbook_results(user_id, mode, idx, url, slot_index, data) VALUES(?,?,?,?,?,?)",
+        rows,
+    )
+
+
+def result_urls(con, user_id: str, mode: str) -> List[str]:
+    rows = con.execute(
+        "SELECT url FROM lookbook_results WHERE user_id=? AND mode=? AND url IS NOT NULL ORDER BY idx",
+        (user_id, mode),
+    ).fetchall()
+    return [r["url"].strip() for r in rows if r["url"] and r["url"].strip()]
+
+
+def _run_dict(row) -> Dict[str, Any]:
+    run: Dict[str, Any] = {"running": bool(row["running"]), "jobId": row["job_id"]}
+    if row["started_at"]:
+        run["startedAt"] = row["started_at"]
+    if row["finished_at"]:
+        run["finishedAt"] = row["finished_at"]
+    return run
+
+
+def load_session(con, user_id: str, mode: str) -> Optional[Dict[str, Any]]:
+    """
+    Session in the API shape
+    {mode, format, cards, results, version, cardVersions: {slot: version}, createdAt, updatedAt[, _run]} or None.
+    """
+    head = con.execute(
+        "SELECT format, version, created_at, updated_at FROM lookbook_sessions WHERE user_id=? AND mode=?",
+        (user_id, mode),
+    ).fetchone()
+    if head is None:
+        return None
+    card_rows = con.execute(
+        "SELECT slot, data, version FROM lookbook_cards WHERE user_id=? AND mode=? ORDER BY COALESCE(pos, slot), slot",
+        (user_id, mode),
+    ).fetchall()
+    cards = [json.loads(r["data"]) for r in card_rows]
+    results = [
+        json.loads(r["data"])
+        for r in con.execute(
+            "SELECT data FROM lookbook_results WHERE user_id=? AND mode=? ORDER BY idx",
+            (user_id, mode),
+        ).fetchall()
+    ]
+    sess: Dict[str, Any] = {
+        "mode": mode,
+        "format": head["format"] or DEFAULT_FORMAT,
+        "cards": cards,
+        "results": results,
+        "version": int(head["version"]),
+        "cardVersions": {str(r["slot"]): int(r["version"]) for r in card_rows},
+        "updatedAt": head["updated_at"],
+        "createdAt": head["created_at"],
+    }
+    run = con.execute(
+        "SELECT running, job_id, started_at, finished_at FROM lookbook_runs WHERE user_id=? AND mode=?",
+        (user_id, mode),
+    ).fetchone()
+    if run is not None:
+        sess["_run"] = _run_dict(run)
+    return sess
+
+
+def delete_session(con, user_id: str, mode: str):
+    con.execute("DELETE FROM lookbook_sessions WHERE user_id=? AND mode=?", (user_id, mode))
+    con.execute("DELETE FROM lookbook_cards WHERE user_id=? AND mode=?", (user_id, mode))
+    con.execute("DELETE FROM lookbook_results WHERE user_id=? AND mode=?", (user_id, mode))
+    # идущую фотосессию не отпускаем — lock защищает от второго списания
+    con.execute("DELETE FROM lookbook_runs WHERE user_id=? AND mode=? AND running=0", (user_id, mode))
+
+
+def cleanup_expired(con, user_id: str, ttl_hours: int):
+    """Drop the user's sessions not updated for ttl_hours (one indexed query, no per-row date parsing)."""
+    cutoff = (datetime.now(timezone.utc) - timedelta(hours=ttl_hours)).isoformat()
+    rows = con.execute(
+        "SELECT mode FROM lookbook_sessions WHERE user_id=? AND updated_at<?",
+        (user_id, cutoff),
+    ).fetchall()
+    for r in rows:
+        delete_session(con, user_id, r["mode"])
+
+
+def try_acquire_run(con, user_id: str, mode: str, ttl_seconds: int) -> bool:
+    """
+    Atomic run lock for (user_id, mode): succeeds if no run is active or the active one is
+    older than ttl_seconds (протух). jobId предыдущего запуска сохраняется.
+    """
+    now = datetime.now(timezone.utc)
+    stale = (now - timedelta(seconds=max(10, int(ttl_seconds or 180)))).isoformat()
+    cur = con.execute(
+        """INSERT INTO lookbook_runs(user_id, mode, running, job_id, started_at, finished_at)
+           VALUES(?,?,1,NULL,?,NULL)
+           ON CONFLICT(user_id, mode) DO UPDATE SET running=1, started_at=excluded.started_at
+           WHERE lookbook_runs.running=0 OR lookbook_runs.started_at IS NULL OR lookbook_runs.started_at<?""",
+        (user_id, mode, now.isoformat(), stale),
+    )
+    return cur.rowcount == 1
+
+
+def set_run(con, user_id: str, mode: str, job_id: Optional[str], running: bool):
+    now = _now_iso()
+    if running:
+        con.execute(
+            """INSERT INTO lookbook_runs(user_id, mode, running, job_id, started_at) VALUES(?,?,1,?,?)
+               ON CONFLICT(user_id, mode) DO UPDATE SET running=1, job_id=excluded.job_id, started_at=excluded.started_at""",
+            (user_id, mode, job_id, now),
+        )
+    else:
+        con.execute(
+            """INSERT INTO lookbook_runs(user_id, mode, running, job_id, finished_at) VALUES(?,?,0,?,?)
+               ON CONFLICT(user_id, mode) DO UPDATE SET running=0, job_id=excluded.job_id, finished_at=excluded.finished_at""",
+            (user_id, mode, job_id, now),
+        )
+
+
+def release_run(con, user_id: str, mode: str):
+    con.execute(
+        "UPDATE lookbook_runs SET running=0, finished_at=? WHERE user_id=? AND mode=?",
+        (_now_iso(), user_id, mode),
+    )
+
+
+def migrate_legacy_sessions(con) -> int:
+    """Split pre-normalization JSON blobs (lookbook_sessions.data) into rows. Returns sessions migrated."""
+    rows = con.execute(
+        "SELECT user_id, mode, data, updated_at FROM lookbook_sessions WHERE normalized=0"
+    ).fetchall()
+    for r in rows:
+        try:
+            data = json.loads(r["data"] or "{}")
+        except Exception:
+            data = {}
+        if not isinstance(data, dict):
+            data = {}
+        uid, mode = r["user_id"], r["mode"]
+        replace_cards(con, uid, mode, _legacy_cards(data.get("cards")), now=r["updated_at"])
+        replace_results(con, uid, mode, data.get("results") if isinstance(data.get("results"), list) else [])
+        run = data.get("_run")
+        if isinstance(run, dict):
+            con.execute(
+                """INSERT OR REPLACE INTO lookbook_runs(user_id, mode, running, job_id, started_at, finished_at)
+                   VALUES(?,?,?,?,?,?)""",
+                (uid, mode, 1 if run.get("running") else 0, run.get("jobId"),
+                 run.get("startedAt") or run.get("started_at"), run.get("finishedAt")),
+            )
+        con.execute(
+            "UPDATE lookbook_sessions SET format=?, data='{}', normalized=1 WHERE user_id=? AND mode=?",
+            (data.get("format") or DEFAULT_FORMAT, uid, mode),
+        )
+    return len(rows)
@@ -5,6 +5,7 @@ import Header from "./Header.jsx";
 import { AuthProvider } from "../app/AuthContext.jsx";
 import { useAuth } from "../app/AuthContext.jsx";
 import { fetchJson } from "../services/api.js";
+import { watchJob } from "../services/jobStream.js";
 
 /**
  * Global notifications (toast) + background job watcher.
@@ -122,6 +123,7 @@ function GlobalJobWatcher() {
   const accountKey = user?.id || "guest";
   const notifiedRef = React.useRef(new Set());
   const timerRef = React.useRef(null);
+  const watchesRef = React.useRef(new Map()); // jobId -> unsubscribe
 
   const notifyDone = React.useCallback((jobId, meta) => {
     const studioKey = meta?.studioKey || "lookbook";
@@ -162,11 +164,26 @@ function GlobalJobWatcher() {
   }, []);
 
   React.useEffect(() => {
+    const watches = watchesRef.current;
     const stop = () => {
       if (timerRef.current) {
         clearTimeout(timerRef.current);
         timerRef.current = null;
       }
+      watches.forEach((unsub) => unsub());
+      watches.clear();
+    };
+
+    // localStorage сканируем локально раз в 2s; состояние задач приходит из общего потока (SSE)
+    const watch = (kind, jobId, onJob) => {
+      if (watches.has(jobId)) return;
+      watches.set(jobId, watchJob(kind, jobId, (job) => {
+        if (job?.state !== "done" && job?.state !== "error") return;
+        const unsub = watches.get(jobId);
+        if (unsub) unsub();
+        watches.delete(jobId);
+        onJob(job);
+      }));
     };
 
     const safeLsKeys = () => {
@@ -180,7 +197,7 @@ function GlobalJobWatcher() {
       return out;
     };
 
-    const tick = async () => {
+    const tick = () => {
       try {
         // 1) Lookbook jobs: ps_lb_activeJob_v1:<accountKey>:<MODE> -> <jobId>
         const lbPrefix = `ps_lb_activeJob_v1:${accountKey}:`;
@@ -196,21 +213,22 @@ function GlobalJobWatcher() {
           const mode = String(k.slice(lbPrefix.length) || "").toUpperCase();
           const meta = { studioKey: "lookbook", mode, to: `/studio/lookbook?mode=${mode}` };
 
-          const res = await fetchJson(`/api/lookbook/jobs/${jobId}`);
-          const job = res?.job;
-          const state = job?.state;
-
-          if (state === "done") {
-            const count = Array.isArray(job?.result?.results) ? job.result.results.length : 0;
-            notifiedRef.current.add(jobId);
-            try { localStorage.removeItem(k); } catch {}
-            notifyDone(jobId, { ...meta, count, title: "Фотосессия готова", message: "Готово. Можно открыть результаты." });
-          } else if (state === "error") {
-            const msg = job?.error || "Ошибка фотосессии";
-            notifiedRef.current.add(jobId);
-            try { localStorage.removeItem(k); } catch {}
-            notifyError(jobId, meta, msg);
-          }
+          watch("lookbook", jobId, (job) => {
+            const state = job?.state;
+            if (notifiedRef.current.has(jobId)) return;
+
+            if (state === "done") {
+              const count = Array.isArray(job?.result?.results) ? job.result.results.length : 0;
+              notifiedRef.current.add(jobId);
+              try { localStorage.removeItem(k); } catch {}
+              notifyDone(jobId, { ...meta, count, title: "Фотосессия готова", message: "Готово. Можно открыть результаты." });
+            } else if (state === "error") {
+              const msg = job?.error || "Ошибка фотосессии";
+              notifiedRef.current.add(jobId);
+              try { localStorage.removeItem(k); } catch {}
+              notifyError(jobId, meta, msg);
+            }
+          });
         }
 
         // 2) Scene jobs: ps_sc_activeJob_v1:<accountKey>:<KIND> -> JSON { jobId, action } OR plain <jobId>
@@ -239,32 +257,33 @@ function GlobalJobWatcher() {
           const kind = String(k.slice(scPrefix.length) || "").toLowerCase(); // model|location
           const mode = kind ? kind.toUpperCase() : null;
 
-          const res = await fetchJson(`/api/scene/jobs/${jobId}`);
-          const job = res?.job;
-          const state = job?.state;
-
-          const isApply = String(action || job?.action || "").toLowerCase().includes("apply");
-          const title = kind === "model"
-            ? (isApply ? "Детали модели применены" : "Модель готова")
-            : (kind === "location" ? (isApply ? "Детали локации применены" : "Локация готова") : "Сцена готова");
-
-          if (state === "done") {
-            notifiedRef.current.add(jobId);
-            try { localStorage.removeItem(k); } catch {}
-            notifyDone(jobId, {
-              studioKey: "scene",
-              mode,
-              to: "/scene",
-              count: 1,
-              title,
-              message: "Готово. Перейдите в «Создание сцены».",
-            });
-          } else if (state === "error") {
-            const msg = job?.error || "Ошибка сцены";
-            notifiedRef.current.add(jobId);
-            try { localStorage.removeItem(k); } catch {}
-            notifyError(jobId, { studioKey: "scene", mode, to: "/scene", title: "Ошибка сцены" }, msg);
-          }
+          watch("scene", jobId, (job) => {
+            const state = job?.state;
+            if (notifiedRef.current.has(jobId)) return;
+
+            const isApply = String(action || job?.action || "").toLowerCase().includes("apply");
+            const title = kind === "model"
+              ? (isApply ? "Детали модели применены" : "Модель готова")
+              : (kind === "location" ? (isApply ? "Детали локации применены" : "Локация готова") : "Сцена готова");
+
+            if (state === "done") {
+              notifiedRef.current.add(jobId);
+              try { localStorage.removeItem(k); } catch {}
+              notifyDone(jobId, {
+                studioKey: "scene",
+                mode,
+                to: "/scene",
+                count: 1,
+                title,
+                message: "Готово. Перейдите в «Создание сцены».",
+              });
+            } else if (state === "error") {
+              const msg = job?.error || "Ошибка сцены";
+              notifiedRef.current.add(jobId);
+              try { localStorage.removeItem(k); } catch {}
+              notifyError(jobId, { studioKey: "scene", mode, to: "/scene", title: "Ошибка сцены" }, msg);
+            }
+          });
         }
       } catch {
         // ignore transient errors
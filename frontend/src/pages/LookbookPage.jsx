@@ -4,6 +4,7 @@ import "./LookbookPage.css";
 import { useNavigate, useLocation } from "react-router-dom";
 import { useAuth } from "../app/AuthContext.jsx";
 import { fetchJson, API_BASE } from "../services/api.js";
+import { watchJob } from "../services/jobStream.js";
 
 /**
  * LOOKBOOK — server-backed session per mode (TORSO/LEGS/FULL)
@@ -47,6 +48,7 @@ const DEFAULT_CARDS = [
 
 
 const FORMAT_OPTIONS = ["1:1", "16:9", "9:16"];
+const PERSIST_RETRY_MS = 3000; // повтор несохранённых правок после сетевой ошибки
 
 const CAMERA_OPTIONS = [
   { key: "front", label: "Фронт" },
@@ -221,6 +223,12 @@ const [scene, setScene] = React.useState(null);
   const [sessionMode, setSessionMode] = React.useState(null); // which mode current session belongs to
   const didHydrateRef = React.useRef(false);
   const fetchSeqRef = React.useRef(0); // prevent late fetches overwriting newer mode
+  // Incremental persist: только изменённые карточки/format, с version (409 = изменено в другой вкладке)
+  const pendingRef = React.useRef({ mode: null, cards: {}, format: null });
+  const versionsRef = React.useRef({ mode: null, session: null, cards: {} });
+  const persistChainRef = React.useRef(Promise.resolve());
+  const persistRetryRef = React.useRef(null);
+  React.useEffect(() => () => clearTimeout(persistRetryRef.current), []);
   const [activeResultIndex, setActiveResultIndex] = React.useState(-1);
 
   // Генерация: смешные фразы в большом окне результата (каждые 3–5 сек)
@@ -434,16 +442,20 @@ React.useEffect(() => {
         }
 
         // fix old/wrong extensions for /static/assets/<hash>.* (png/jpg/jpeg/webp)
+        const fixedCards = {};
         if (Array.isArray(s.cards) && s.cards.length) {
           s.cards = await Promise.all(
             s.cards.map(async (c) => {
               if (!c || !c.refUrl) return c;
               const abs = resolveAssetUrl(c.refUrl) || c.refUrl;
               const fixed = await resolveExistingAssetUrl(abs);
-              return fixed && fixed !== abs ? { ...c, refUrl: fixed } : c;
+              if (!fixed || fixed === abs) return c;
+              fixedCards[c.slot] = { refUrl: fixed };
+              return { ...c, refUrl: fixed };
             })
           );
         }
+        s.fixedCards = fixedCards;
         if (Array.isArray(s.results) && s.results.length) {
           s.results = await Promise.all(
             s.results.map(async (r) => {
@@ -474,6 +486,9 @@ React.useEffect(() => {
         return 0;
       })();
 
+      versionsRef.current = { mode: m, session: s?.version ?? null, cards: { ...(s?.cardVersions || {}) } };
+      pendingRef.current = { mode: m, cards: { ...(s?.fixedCards || {}) }, format: null };
+      if (s) delete s.fixedCards;
       setSession(s);
       setSessionMode(m);
       setActiveResultIndex(firstIdx);
@@ -511,14 +526,98 @@ React.useEffect(() => {
     // eslint-disable-next-line react-hooks/exhaustive-deps
   }, [mode]);
 
-  // Persist session (debounced) — server-backed
+  // Конфликт (409): берём состояние сервера, локальную правку отбрасываем
+  const applyServerCard = (m, slot, card) => {
+    if (!card) return;
+    setSession((prev) => {
+      if (!prev || prev.mode !== m) return prev;
+      const cardsNext = Array.isArray(prev.cards) ? prev.cards.slice() : [];
+      const idx = cardsNext.findIndex((c) => Number(c?.slot) === Number(slot));
+      const fixed = { ...card, refUrl: sanitizePersistentUrl(card.refUrl) };
+      if (idx >= 0) cardsNext[idx] = fixed;
+      else cardsNext.push(fixed);
+      return { ...prev, cards: cardsNext };
+    });
+  };
+
+  // Сетевая ошибка / 5xx: вернуть правку в pending (новые правки того же поля главнее) и повторить позже
+  const requeuePending = (m, slot, card, format) => {
+    const pending = pendingRef.current;
+    if (pending.mode !== m) return;
+    if (slot != null) pending.cards[slot] = { ...card, ...(pending.cards[slot] || {}) };
+    if (format != null && pending.format == null) pending.format = format;
+    clearTimeout(persistRetryRef.current);
+    persistRetryRef.current = setTimeout(() => persistPending(), PERSIST_RETRY_MS);
+  };
+
+  const persistPending = () => {
+    const pending = pendingRef.current;
+    const m = pending.mode;
+    const cardPatches = pending.cards;
+    const format = pending.format;
+    if (!m || (!Object.keys(cardPatches).length && format == null)) return;
+    pendingRef.current = { mode: m, cards: {}, format: null };
+
+    // запросы идут цепочкой: следующий берёт version из ответа предыдущего
+    persistChainRef.current = persistChainRef.current.then(async () => {
+      const v = versionsRef.current;
+      if (v.mode !== m) return; // режим сменился — сессия уже перечитана
+      let conflicted = false;
+      for (const [slot, card] of Object.entries(cardPatches)) {
+        try {
+          const res = await fetchJson(`/api/lookbook/session/${m}/cards/${slot}`, {
+            method: "PATCH",
+            body: { version: v.cards[slot] ?? 1, card },
+          });
+          if (res?.version != null) v.cards[slot] = res.version;
+        } catch (e) {
+          if (e?.status !== 409) {
+            console.warn("[lookbook] persist card failed:", e?.message || e);
+            requeuePending(m, slot, card, null);
+            continue;
+          }
+          const cur = e.data?.detail || {};
+          if (cur.version != null) v.cards[slot] = cur.version;
+          applyServerCard(m, slot, cur.card);
+          conflicted = true;
+        }
+      }
+      if (format != null) {
+        try {
+          const res = await fetchJson(`/api/lookbook/session/${m}`, { method: "PATCH", body: { format, version: v.session } });
+          if (res?.session?.version != null) v.session = res.session.version;
+        } catch (e) {
+          if (e?.status !== 409) {
+            console.warn("[lookbook] persist format failed:", e?.message || e);
+            requeuePending(m, null, null, format);
+          } else {
+            const cur = e.data?.detail || {};
+            if (cur.version != null) v.session = cur.version;
+            if (cur.format) setSession((prev) => (prev && prev.mode === m ? { ...prev, format: cur.format } : prev));
+            conflicted = true;
+          }
+        }
+      }
+      if (conflicted) {
+        notify({
+          id: `lookbook_conflict:${m}`,
+          kind: "error",
+          title: "Сессия изменена в другой вкладке",
+          source: `Lookbook · ${m}`,
+          message: "Показана актуальная версия, последняя правка не сохранена.",
+          ttlMs: 6000,
+        });
+      }
+    });
+  };
+
+  // Persist session (debounced) — server-backed, только изменённые слоты
   useDebouncedEffect(
     () => {
       if (!didHydrateRef.current) return;
       if (!session) return;
       if (sessionMode !== mode) return; // prevent cross-mode bleed on fast tab switch
-      fetchJson(`/api/lookbook/session/${mode}`, { method: "PATCH", body: { format: session.format, cards: session.cards, results: session.results } })
-        .catch((e) => console.warn("[lookbook] persist failed:", e?.message || e));
+      persistPending();
     },
     [mode, session, sessionMode],
     450
@@ -552,6 +651,8 @@ React.useEffect(() => {
   };
 
   const setCard = (slot, patch) => {
+    const pending = pendingRef.current;
+    pending.cards[slot] = { ...(pending.cards[slot] || {}), ...patch };
     setSession((prev) => {
       if (!prev) return prev;
       const next = { ...prev, cards: Array.isArray(prev.cards) ? prev.cards.map((c) => ({ ...c })) : [] };
@@ -758,7 +859,7 @@ const goToPrints = () => {
 
   const stopJobPolling = React.useCallback(() => {
     if (jobPollRef.current) {
-      clearTimeout(jobPollRef.current);
+      jobPollRef.current(); // unsubscribe from the job stream
       jobPollRef.current = null;
     }
   }, []);
@@ -774,15 +875,20 @@ const goToPrints = () => {
     const modeUpper = String(m || mode || "TORSO").toUpperCase();
     if (!jobId) return;
 
-    const tick = async () => {
+    // Updates arrive via the shared job stream (SSE) instead of polling every 1.5s.
+    const onJob = async (job) => {
       try {
-        const res = await fetchJson(`/api/lookbook/jobs/${jobId}`);
-        const job = res?.job;
         const state = job?.state;
 
         if (state === "done") {
           const results = job?.result?.results || [];
-          setSession((prev) => (prev ? { ...prev, results } : prev));
+          // задача подняла версию сессии — иначе следующая правка получит 409
+          const version = job?.result?.version;
+          const v = versionsRef.current;
+          if (Number.isFinite(version) && v.mode === modeUpper && (v.session == null || version > v.session)) {
+            v.session = version;
+          }
+          setSession((prev) => (prev ? { ...prev, results, ...(Number.isFinite(version) ? { version } : {}) } : prev));
           setActiveResultIndex(Array.isArray(results) && results.length ? 0 : -1);
           setIsGenerating(false);
           clearActiveJob(modeUpper);
@@ -825,14 +931,12 @@ const goToPrints = () => {
         // queued/running
         setIsGenerating(true);
         setActiveJobId(jobId);
-        jobPollRef.current = setTimeout(tick, 1500);
       } catch (e) {
-        // transient fetch error
-        jobPollRef.current = setTimeout(tick, 2000);
+        console.warn("[lookbook] job update failed:", e);
       }
     };
 
-    tick();
+    jobPollRef.current = watchJob("lookbook", jobId, (job) => { onJob(job); });
   }, [clearActiveJob, mode, refresh, stopJobPolling]);
 
   // Resume job after navigation/F5: try localStorage first, then session._run from backend.
@@ -1045,7 +1149,10 @@ const goToPrints = () => {
                 <button
                   key={f}
                   className={"lb-formatBtn" + (session?.format === f ? " isActive" : "")}
-                  onClick={() => setSession((p) => (p ? { ...p, format: f } : p))}
+                  onClick={() => {
+                    pendingRef.current.format = f;
+                    setSession((p) => (p ? { ...p, format: f } : p));
+                  }}
                 >
                   {f}
                 </button>
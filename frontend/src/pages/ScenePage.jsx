@@ -6,6 +6,7 @@ import { useNavigate, useLocation } from "react-router-dom";
 import { STUDIOS } from "./studiosData.js";
 import { creditsSpend } from "../services/authApi.js";
 import { fetchJson } from "../services/api.js";
+import { watchJob } from "../services/jobStream.js";
 
 
 function getAccountKey(user){
@@ -314,66 +315,63 @@ React.useEffect(() => {
 
 }, [user?.id]);
 
-// Poll running jobs while user is on ScenePage (so UI updates immediately on completion)
+// Watch running jobs while user is on ScenePage (so UI updates immediately on completion).
+// Updates are pushed by the shared job stream (SSE), no per-job polling.
 React.useEffect(() => {
   let cancelled = false;
   const accountKey = getAccountKey(user);
 
-  const tick = async () => {
+  const onJob = async (kind, job) => {
     try {
-      for (const kind of ["model", "location"]) {
-        const rec = runMap?.[kind];
-        if (!rec?.jobId) continue;
-
-        const res = await fetchJson(`/api/scene/jobs/${rec.jobId}`);
-        const job = res?.job;
-        const state = job?.state;
-
-        if (state === "done") {
-          safeRemoveLS(scJobKey(accountKey, kind));
-          if (!cancelled) {
-            setRunMap((prev) => ({ ...(prev || {}), [kind]: null }));
-            try {
-              const cur = await fetchJson("/api/scene/current");
-              const sc = cur?.scene || null;
-              if (sc) {
-                if (kind === "model") setModelImage(sc.modelUrl || null);
-                if (kind === "location") setLocationImage(sc.locationUrl || null);
-              }
-            } catch {}
-            // stop overlay if it belongs to this panel
-            setPanelProgress((p) => {
-              if (!p) return p;
-              if (p.kind === kind) return { kind: null, phase: null, phrase: "" };
-              return p;
-            });
-            setBusy(false);
-            setStatus("Готово ✅");
-          }
+      const state = job?.state;
+
+      if (state === "done") {
+        safeRemoveLS(scJobKey(accountKey, kind));
+        if (!cancelled) {
+          setRunMap((prev) => ({ ...(prev || {}), [kind]: null }));
+          try {
+            const cur = await fetchJson("/api/scene/current");
+            const sc = cur?.scene || null;
+            if (sc) {
+              if (kind === "model") setModelImage(sc.modelUrl || null);
+              if (kind === "location") setLocationImage(sc.locationUrl || null);
+            }
+          } catch {}
+          // stop overlay if it belongs to this panel
+          setPanelProgress((p) => {
+            if (!p) return p;
+            if (p.kind === kind) return { kind: null, phase: null, phrase: "" };
+            return p;
+          });
+          setBusy(false);
+          setStatus("Готово ✅");
         }
+      }
 
-        if (state === "error") {
-          safeRemoveLS(scJobKey(accountKey, kind));
-          if (!cancelled) {
-            setRunMap((prev) => ({ ...(prev || {}), [kind]: null }));
-            setPanelProgress((p) => {
-              if (!p) return p;
-              if (p.kind === kind) return { kind: null, phase: null, phrase: "" };
-              return p;
-            });
-            setBusy(false);
-          }
+      if (state === "error") {
+        safeRemoveLS(scJobKey(accountKey, kind));
+        if (!cancelled) {
+          setRunMap((prev) => ({ ...(prev || {}), [kind]: null }));
+          setPanelProgress((p) => {
+            if (!p) return p;
+            if (p.kind === kind) return { kind: null, phase: null, phrase: "" };
+            return p;
+          });
+          setBusy(false);
         }
       }
     } catch {
       // ignore transient
-    } finally {
-      if (!cancelled) setTimeout(tick, 1500);
     }
   };
 
-  tick();
-  return () => { cancelled = true; };
+  const unsubs = ["model", "location"]
+    .filter((kind) => runMap?.[kind]?.jobId)
+    .map((kind) => watchJob("scene", runMap[kind].jobId, (job) => { onJob(kind, job); }));
+  return () => {
+    cancelled = true;
+    unsubs.forEach((u) => u());
+  };
 }, [user?.id, runMap]);
 
   React.useEffect(() => {
@@ -1,9 +1,15 @@
 import React from "react";
 import { fetchJson, API_BASE } from "../services/api.js";
+import { waitJob } from "../services/jobStream.js";
 import { useAuth } from "../app/AuthContext.jsx";
 import "./VideoPage.css";
 import { useLocation } from "react-router-dom";
 
+// Генерация и склейка видео — серверные задачи: ждём job до done/error (через поток задач).
+function waitVideoJob(jobId, onProgress){
+  return waitJob("video", jobId, onProgress);
+}
+
 function GlassSelect({ value, options, onChange, ariaLabel }){
   const [open, setOpen] = React.useState(false);
   const rootRef = React.useRef(null);
@@ -478,7 +484,13 @@ React.useEffect(() => {
     }
     setStatus("Объединяем клипы (ffmpeg)…");
     try{
-      const out = await fetchJson("/api/video/merge", { method: "POST", body: { clipUrls: urls } });
+      const start = await fetchJson("/api/video/merge", { method: "POST", body: { clipUrls: urls } });
+      let out = start;
+      if(start?.jobId){
+        const job = await waitVideoJob(start.jobId, (p) => setStatus(`Объединяем клипы (ffmpeg)… ${p}%`));
+        if(job?.state === "error") throw new Error(job.error || "Не удалось собрать итог");
+        out = job?.result;
+      }
       const url = sanitizePersistentUrl(out?.url);
       if(!url) throw new Error("Не удалось собрать итог");
       // кладём в первый пустой слот
@@ -689,11 +701,22 @@ React.useEffect(() => {
                       count: 1
                     };
 
-                    const res = await fetchJson("/api/video/generate", {
+                    const start = await fetchJson("/api/video/generate", {
                       method: "POST",
                       body: payload,
                     });
 
+                    let job = null;
+                    if (start?.jobId) {
+                      setStatus("Генерация видео… Это может занять несколько минут.");
+                      job = await waitVideoJob(start.jobId, (p) => setStatus(`Генерация видео… ${p}%`));
+                      if (job?.state === "error") {
+                        setStatus(`Ошибка генерации: ${job.error || "не удалось сделать видео"}`);
+                        return;
+                      }
+                    }
+                    const res = job?.result || start;
+
                     const urls = (res && res.videos) ? res.videos : [];
                     if (!urls.length) {
                       setStatus("Генерация завершилась без результата (videos пустой).");
@@ -712,7 +735,10 @@ React.useEffect(() => {
                       return next;
                     });
 
-                    setStatus(`Готово: ${urls.length} клип(а). Можно объединять справа.`);
+                    const failed = (res?.clips || []).filter(c => c?.state === "error");
+                    setStatus(failed.length
+                      ? `Готово: ${urls.length} клип(а), не удалось: ${failed.length} (${failed[0].error || "ошибка"}).`
+                      : `Готово: ${urls.length} клип(а). Можно объединять справа.`);
                   } catch (e) {
                     // backend may return: {detail}, {data:{detail}}, Error(message), etc.
                     const detail =
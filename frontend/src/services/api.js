@@ -14,8 +14,12 @@ export async function fetchJson(path,{method="GET",headers={},body}={}){
   try{ data = text?JSON.parse(text):null; }catch{ data={raw:text}; }
   if(!res.ok){
     // FastAPI часто возвращает {detail: ...}
-    const msg = data?.message || data?.detail || `HTTP ${res.status}`;
-    throw new Error(msg);
+    const detail = data?.detail;
+    const msg = data?.message || (detail && typeof detail === "object" ? detail.message : detail) || `HTTP ${res.status}`;
+    const err = new Error(msg);
+    err.status = res.status; // 409 и т.п. — вызывающий может разобрать err.data
+    err.data = data;
+    throw err;
   }
   return data;
 }
@@ -0,0 +1,207 @@
+import { API_BASE, fetchJson } from "./api.js";
+
+// Один SSE-поток (/api/jobs/stream) на вкладку для всех задач пользователя:
+// lookbook / scene / video. Подписчики регистрируются по jobId, поток открыт только
+// пока есть хоть один подписчик. Если EventSource недоступен или поток не держится —
+// fallback: раз в FALLBACK_POLL_MS один GET /api/jobs/status на все незавершённые задачи
+// (полный job с result — только для завершившихся).
+
+const JOB_URL = {
+  lookbook: (id) => `/api/lookbook/jobs/${id}`,
+  scene: (id) => `/api/scene/jobs/${id}`,
+  video: (id) => `/api/video/jobs/${id}`,
+};
+const FALLBACK_POLL_MS = 3000;
+const STATUS_MAX_IDS = 100; // JOB_STATUS_MAX_IDS на бэкенде
+const CLOSE_IDLE_MS = 5000;
+
+const watchers = new Map(); // jobId -> { kind, cbs: Set<fn>, last }
+let source = null;
+let opened = false;
+let closeTimer = null;
+let polling = false;
+let pollTimer = null;
+let failures = 0;
+
+const isFinal = (job) => job?.state === "done" || job?.state === "error";
+
+function deliver(jobId, job){
+  const w = watchers.get(jobId);
+  if(!w || !job) return;
+  // события могут прийти не по порядку (снимок + живые события) — старые пропускаем
+  if(w.last && String(job.updated_at || "") < String(w.last.updated_at || "")) return;
+  w.last = job;
+  for(const cb of [...w.cbs]){
+    try{ cb(job); }catch{}
+  }
+}
+
+// 4xx (кроме 408/429) не пройдёт от повтора: задача удалена/чужая (404) или сессия кончилась (401).
+const isTerminalStatus = (status) => status >= 400 && status < 500 && status !== 408 && status !== 429;
+
+// Подписчики получают error-состояние, чтобы не ждать (и не опрашивать) задачу вечно.
+function failJob(jobId, status, message){
+  const w = watchers.get(jobId);
+  if(!w) return;
+  deliver(jobId, {
+    ...(w.last || {}),
+    job_id: jobId,
+    state: "error",
+    error: message || (status === 401 ? "Not authenticated" : status === 404 ? "Job not found" : `HTTP ${status}`),
+    updated_at: new Date().toISOString(),
+  });
+}
+
+async function fetchOnce(jobId){
+  const w = watchers.get(jobId);
+  if(!w) return;
+  try{
+    const res = await fetchJson(JOB_URL[w.kind](jobId));
+    deliver(jobId, res?.job || null);
+  }catch(e){
+    if(isTerminalStatus(e?.status)) failJob(jobId, e.status, e.message);
+  }
+}
+
+// Один запрос /api/jobs/status (на каждые STATUS_MAX_IDS) на все незавершённые задачи;
+// полный job (с result) — только для тех, что завершились. Нет в ответе — задача удалена/чужая.
+async function refreshAll(){
+  const ids = [...watchers.entries()].filter(([, w]) => !isFinal(w.last)).map(([id]) => id);
+  for(let i = 0; i < ids.length; i += STATUS_MAX_IDS){
+    const chunk = ids.slice(i, i + STATUS_MAX_IDS);
+    let res;
+    try{
+      res = await fetchJson(`/api/jobs/status?ids=${encodeURIComponent(chunk.join(","))}`);
+    }catch(e){
+      if(isTerminalStatus(e?.status)) chunk.forEach((id) => failJob(id, e.status, e.message));
+      continue;
+    }
+    const seen = new Set();
+    for(const st of res?.jobs || []){
+      seen.add(st.job_id);
+      const w = watchers.get(st.job_id);
+      if(!w) continue;
+      if(isFinal(st)){
+        fetchOnce(st.job_id);
+      }else{
+        // kind здесь — тип задачи (lookbook/scene/video), а не поле job (у scene-задач своё kind)
+        const { kind: _kind, ...fields } = st;
+        deliver(st.job_id, { ...(w.last || {}), ...fields });
+      }
+    }
+    chunk.filter((id) => !seen.has(id)).forEach((id) => failJob(id, 404));
+  }
+}
+
+async function pollTick(){
+  pollTimer = null;
+  if(!watchers.size) return;
+  await refreshAll();
+  if(watchers.size && !pollTimer) pollTimer = setTimeout(pollTick, FALLBACK_POLL_MS);
+}
+
+function startPolling(){
+  polling = true;
+  if(!pollTimer) pollTimer = setTimeout(pollTick, 0);
+}
+
+function openStream(){
+  if(closeTimer){ clearTimeout(closeTimer); closeTimer = null; }
+  if(polling){
+    startPolling();
+    return;
+  }
+  if(source) return;
+  if(typeof EventSource === "undefined" || failures >= 3){
+    startPolling();
+    return;
+  }
+  const ids = [...watchers.keys()].join(",");
+  source = new EventSource(`${API_BASE}/api/jobs/stream?ids=${encodeURIComponent(ids)}`, { withCredentials: true });
+  source.addEventListener("job", (e) => {
+    try{
+      const ev = JSON.parse(e.data);
+      const job = ev?.job;
+      if(job?.job_id) deliver(job.job_id, job);
+    }catch{}
+  });
+  source.addEventListener("ready", () => {
+    // переподключение: то, что закончилось пока потока не было, и задачи, добавленные после открытия
+    if(opened) refreshAll();
+    opened = true;
+    failures = 0;
+  });
+  source.onerror = () => {
+    if(!opened) failures += 1;
+    if(source && (source.readyState === 2 || failures >= 3)){
+      source.close();
+      source = null;
+      opened = false;
+      if(!watchers.size) return;
+      if(failures >= 3) startPolling();
+      else setTimeout(openStream, FALLBACK_POLL_MS);
+    }
+  };
+}
+
+function scheduleClose(){
+  if(watchers.size || closeTimer) return;
+  closeTimer = setTimeout(() => {
+    closeTimer = null;
+    if(watchers.size) return;
+    if(source){ source.close(); source = null; opened = false; }
+  }, CLOSE_IDLE_MS);
+}
+
+/**
+ * Subscribe to job updates. onUpdate(job) gets the same object as GET /api/<kind>/jobs/{id}
+ * on every change (never synchronously from this call). Returns an unsubscribe function.
+ */
+export function watchJob(kind, jobId, onUpdate){
+  if(!jobId || !JOB_URL[kind]) return () => {};
+  let w = watchers.get(jobId);
+  const isNew = !w;
+  if(!w){
+    w = { kind, cbs: new Set(), last: null };
+    watchers.set(jobId, w);
+  }
+  w.cbs.add(onUpdate);
+  openStream();
+  if(w.last){
+    // асинхронно: вызывающий успевает сохранить функцию отписки до первого колбэка
+    const last = w.last;
+    queueMicrotask(() => {
+      if(w.cbs.has(onUpdate)){
+        try{ onUpdate(last); }catch{}
+      }
+    });
+  }else if(isNew && !polling){
+    // поток мог открыться раньше, чем появился этот jobId, — текущее состояние берём разово
+    fetchOnce(jobId);
+  }
+  return () => {
+    const cur = watchers.get(jobId);
+    if(!cur) return;
+    cur.cbs.delete(onUpdate);
+    if(!cur.cbs.size) watchers.delete(jobId);
+    scheduleClose();
+  };
+}
+
+/** Resolve with the job once it is done/error; onProgress(progress, job) on intermediate updates. */
+export function waitJob(kind, jobId, onProgress){
+  return new Promise((resolve) => {
+    let finished = false;
+    const cb = (job) => {
+      if(finished) return;
+      if(isFinal(job)){
+        finished = true;
+        unsubscribe();
+        resolve(job);
+        return;
+      }
+      onProgress?.(job?.progress || 0, job);
+    };
+    const unsubscribe = watchJob(kind, jobId, cb);
+  });
+}